@@ -11,7 +11,7 @@ import sys
 import datetime
 from tale.story import Storybase
 from tale.main import run_story
-from zones import init_zones
+from zones import init_zones, location_zone, make_location, exit_target_vnum
 
 
 class Story(Storybase):
@@ -37,13 +37,30 @@ class Story(Storybase):
     show_exits_in_look = False
     mud_host = "localhost"
     mud_port = 8200
+    lazy_zones = False    # build a zone only when it's first entered (boot time and memory then scale with the explored world)
+    drop_circle_records = True    # discard the parsed circle records once they've been converted (saves memory)
 
     driver = None     # will be set by init()
 
     def init(self, driver):
         """Called by the game driver when it is done with its initial initialization"""
         self.driver = driver
-        init_zones()
+        driver.exit_graph.zone_of = location_zone
+        init_zones(lazy=self.lazy_zones, drop=self.drop_circle_records)
+
+    def init_snapshot(self, driver):
+        """Called by the game driver instead of init(), when the world is restored from a snapshot"""
+        if self.lazy_zones:
+            raise ValueError("the lazy zones mode can't be used with a world snapshot")
+        self.driver = driver
+        driver.exit_graph.zone_of = location_zone
+
+    def init_shards(self, driver, shard_map):
+        """Called in the worker processes of the sharded mud mode. Locations are identified by their circle vnum."""
+        shard_map.location_key = lambda location: getattr(location, "vnum", None)
+        shard_map.target_key = exit_target_vnum
+        shard_map.zone_of_key = lambda vnum: vnum // 100
+        shard_map.find_location = make_location
 
     def init_player(self, player):
         """
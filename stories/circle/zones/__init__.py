@@ -8,38 +8,49 @@ Copyright by Irmen de Jong (irmen@razorvine.net)
 from __future__ import absolute_import, print_function, division, unicode_literals
 import re
 import random
-from .circledata.parse_mob_files import get_mobs
-from .circledata.parse_obj_files import get_objs
-from .circledata.parse_shp_files import get_shops
-from .circledata.parse_wld_files import get_rooms
-from .circledata.parse_zon_files import get_zones
-from tale.base import Location, Item, Exit, Door, Armour, Container, Weapon, Key
+import datetime
+from collections import defaultdict
+from tale.base import Location, Item, Exit, Door, Armour, Container, Weapon, Key, clone
 from tale.npc import NPC
+from tale.player import Player
 from tale.items.basic import *
 from tale.items.board import BulletinBoard
 from tale.shop import ShopBehavior, Shopkeeper
-from tale.errors import LocationIntegrityError
+from tale.errors import LocationIntegrityError, ActionRefused
 from tale.util import roll_dice
 from tale import mud_context
 
 
-print("\nLoading circle data files.")
-mobs = get_mobs()
-print(len(mobs), "mobs loaded.")
-objs = get_objs()
-print(len(objs), "objects loaded.")
-shops = get_shops()
-print(len(shops), "shops loaded.")
-rooms = get_rooms()
-print(len(rooms), "rooms loaded.")
-zones = get_zones()
-print(len(zones), "zones loaded.")
+mobs = objs = shops = rooms = zones = None    # the circle data, loaded by load_circle_data()
+
+
+def load_circle_data():
+    """
+    Load the circle data files. This is only needed to build the zones, it is skipped
+    when the world is restored from a snapshot (so it's not done on import).
+    """
+    global mobs, objs, shops, rooms, zones
+    if rooms is not None:
+        return
+    from .circledata.cache import load_world_data
+    print("\nLoading circle data files.")
+    # uses the binary cache if it's still up to date, it is kept in the user data directory (the package can be read-only)
+    resources = getattr(mud_context.driver, "user_resources", None)
+    data = load_world_data(path=resources.validate_path("world.cache") if resources else None)
+    mobs, objs, shops, rooms, zones = data["mobs"], data["objs"], data["shops"], data["rooms"], data["zones"]
+    print("%d mobs, %d objects, %d shops, %d rooms, %d zones loaded." % (len(mobs), len(objs), len(shops), len(rooms), len(zones)))
 
 
 converted_rooms = {}   # cache for the rooms
-converted_mobs = set()
-converted_items = set()
+converted_mobs = {}    # cache for the mob prototypes (that are cloned to spawn the actual mobs)
+converted_items = {}   # cache for the item prototypes (that are cloned to spawn the actual items)
 converted_shops = {}  # cache for the shop data
+lazy_world = False    # build the zones only when they're first needed? (set by init_zones)
+built_zones = set()   # vnums of the zones that have been built (lazy world mode)
+spawned_mobs = defaultdict(list)    # vnum -> mobs spawned by zone resets (to see how many are still alive)
+spawned_items = defaultdict(list)   # vnum -> items spawned by zone resets
+reset_schedule = {}   # zone vnum -> due time of its next reset
+drop_records = False  # discard the circle records once they've been converted? (set by init_zones)
 
 
 class CircleMob(NPC):
@@ -54,21 +65,83 @@ class CircleMob(NPC):
             self.move(direction.target, self)
         ctx.driver.defer(random.randint(20, 60), self.do_wander)
 
+    def select_random_move(self):
+        """Like NPC.select_random_move, but mobs don't wander into zones that haven't been built yet"""
+        exits = [xt for xt in self.location.exits.values() if getattr(xt, "target_built", True) and xt.target.exits]
+        random.shuffle(exits)
+        for xt in exits[:4]:
+            try:
+                xt.allow_passage(self)
+            except ActionRefused:
+                continue
+            else:
+                return xt
+        return None
+
+
+class LazyTarget(object):
+    """
+    Exit mixin for the lazy world mode, for exits that lead into a zone that hasn't been built yet.
+    The target location (and the rest of its zone) is only created when it is first needed.
+    """
+    def __init__(self, directions, target_vnum, short_description, **kwargs):
+        super(LazyTarget, self).__init__(directions, unbuilt_location, short_description, **kwargs)
+        self.target = target_vnum
+        self.title = "Exit to " + rooms[target_vnum].name
+
+    @property
+    def target(self):
+        if not isinstance(self._target, Location):
+            self._target = make_location(self._target)
+        return self._target
+
+    @target.setter
+    def target(self, value):
+        self._target = value
+
+    @property
+    def target_built(self):
+        return isinstance(self._target, Location)
+
+    def __repr__(self):
+        if self.target_built:
+            return super(LazyTarget, self).__repr__()
+        return "<%s to room #%d @ 0x%x>" % (self.__class__.__name__, self._target, id(self))
+
+
+class LazyExit(LazyTarget, Exit):
+    pass
+
+
+class LazyDoor(LazyTarget, Door):
+    pass
+
+
+unbuilt_location = Location("Unbuilt zone")   # placeholder target for the lazy exits
+
 
 def make_location(vnum):
     """
     Get a Tale location object for the given circle room vnum.
     This performs an on-demand conversion of the circle room data to Tale.
+    In the lazy world mode, the room's whole zone is built if that hasn't been done yet.
     """
     try:
         return converted_rooms[vnum]   # get cached version if available
     except KeyError:
+        if lazy_world:
+            zone = zone_of_room(vnum)
+            if zone.vnum not in built_zones:
+                build_zone(zone)
+                return converted_rooms[vnum]
         c_room = rooms[vnum]
         loc = Location(c_room.name, c_room.desc)
         loc.vnum = vnum  # keep the circle vnum
         for ed in c_room.extradesc:
             loc.add_extradesc(ed["keywords"], ed["text"])
         converted_rooms[vnum] = loc
+        if drop_records:
+            del rooms[vnum]
         for circle_exit in c_room.exits.values():
             if circle_exit.roomlink >= 0:
                 xt = make_exit(circle_exit)
@@ -96,17 +169,43 @@ def make_location(vnum):
 
 
 def make_exit(c_exit):
-    """Create an instance of a door or exit for the given circle exit"""
-    if c_exit.type in ("normal", "pickproof"):
+    """
+    Create an instance of a door or exit for the given circle exit.
+    In the lazy world mode, exits into a zone that hasn't been built yet get a lazy target.
+    """
+    if lazy_world and c_exit.roomlink not in converted_rooms and zone_of_room(c_exit.roomlink).vnum not in built_zones:
+        exit_class = LazyDoor if c_exit.type in ("normal", "pickproof") else LazyExit
+        xt = exit_class(c_exit.direction, c_exit.roomlink, c_exit.desc)
+    elif c_exit.type in ("normal", "pickproof"):
         xt = Door(c_exit.direction, make_location(c_exit.roomlink), c_exit.desc)
     else:
         xt = Exit(c_exit.direction, make_location(c_exit.roomlink), c_exit.desc)
-    xt.aliases |= c_exit.keywords
+    if c_exit.keywords:
+        xt.aliases |= c_exit.keywords
     return xt
 
 
 def make_mob(vnum, mob_class=CircleMob):
-    """Create an instance of an item for the given vnum"""
+    """Create an instance of a mob for the given vnum (cloned from its prototype)"""
+    try:
+        prototype = converted_mobs[vnum]
+    except KeyError:
+        prototype = converted_mobs[vnum] = make_mob_prototype(vnum, mob_class)
+        if drop_records:
+            del mobs[vnum]
+    assert type(prototype) is mob_class
+    mob = clone(prototype)
+    number, sides, hp = map(int, re.match(r"(\d+)d(\d+)\+(\d+)$", prototype.stats.maxhp_dice).groups())
+    if number > 0 and sides > 0:
+        hp += roll_dice(number, sides)[0]
+    mob.stats.hp = hp
+    if not prototype.sentinel:
+        mud_context.driver.defer(random.randint(2, 30), mob.do_wander)
+    return mob
+
+
+def make_mob_prototype(vnum, mob_class):
+    """Create the prototype mob for the given vnum"""
     c_mob = mobs[vnum]
     aliases = list(c_mob.aliases)
     name = aliases[0]
@@ -124,25 +223,19 @@ def make_mob(vnum, mob_class=CircleMob):
             mob.add_extradesc(ed["keywords"], ed["text"])
     mob.aliases = aliases
     mob.aggressive = "aggressive" in c_mob.actions
+    mob.sentinel = "sentinel" in c_mob.actions
     mob.money = float(c_mob.gold)
     mob.stats.alignment = c_mob.alignment
     mob.stats.xp = c_mob.xp
-    number, sides, hp = map(int, re.match(r"(\d+)d(\d+)\+(\d+)$", c_mob.maxhp_dice).groups())
-    if number > 0 and sides > 0:
-        hp += roll_dice(number, sides)[0]
-    mob.stats.hp = hp
     mob.stats.maxhp_dice = c_mob.maxhp_dice
     mob.stats.level = max(1, c_mob.level)   # 1..50
     # convert AC -10..10 to more modern 0..20   (naked person(0)...plate armor(10)...battletank(20))
     # special elites can go higher (limit 100), weaklings with utterly no defenses can go lower (limit -100)
     mob.stats.ac = max(-100, min(100, 10 - c_mob.ac))
     mob.stats.attack_dice = c_mob.barehanddmg_dice
-    if "sentinel" not in c_mob.actions:
-        mud_context.driver.defer(random.randint(2, 30), mob.do_wander)
     # @todo load position? (standing/sleeping/sitting...)
     # @todo convert thac0 to appropriate attack stat (armor penetration? to-hit bonus?)
     # @todo actions, affection,...
-    converted_mobs.add(vnum)
     return mob
 
 
@@ -155,7 +248,18 @@ circle_bulletin_boards = {
 
 
 def make_item(vnum):
-    """Create an instance of an item for the given vnum"""
+    """Create an instance of an item for the given vnum (cloned from its prototype)"""
+    try:
+        prototype = converted_items[vnum]
+    except KeyError:
+        prototype = converted_items[vnum] = make_item_prototype(vnum)
+        if drop_records:
+            del objs[vnum]
+    return clone(prototype)
+
+
+def make_item_prototype(vnum):
+    """Create the prototype item for the given vnum"""
     c_obj = objs[vnum]
     aliases = list(c_obj.aliases)
     name = aliases[0]
@@ -258,7 +362,6 @@ def make_item(vnum):
     item.rent = c_obj.rent
     item.weight = c_obj.weight
     # @todo: affects, effects, wear
-    converted_items.add(vnum)
     return item
 
 
@@ -306,81 +409,28 @@ def make_shop(vnum):
         return shop
 
 
-def init_zones():
-    """Populate the zones and initialize inventories and door states. Set up shops."""
+def init_zones(lazy=False, drop=False):
+    """
+    Populate the zones and initialize inventories and door states. Set up shops.
+    In the lazy world mode, a zone is only built (and populated) when one of its rooms is first needed.
+    If drop is True, the circle records of rooms, mobs and items are discarded once they have been
+    converted to Tale objects (the zone resets only need the prototypes), to save memory.
+    """
+    global lazy_world, drop_records
+    load_circle_data()
+    drop_records = drop
+    if lazy:
+        lazy_world = True
+        print("Lazy world: zones are built when they're first entered.")
+        return
     print("Initializing zones.")
     num_shops = num_mobs = num_items = 0
-    all_shopkeepers = set(shop.shopkeeper for shop in shops.values())
     for vnum in sorted(zones):
-        zone = zones[vnum]
-        for mobref in zone.mobs:
-            if mobref.vnum in all_shopkeepers:
-                # mob is a shopkeeper, we need to make a shop+shopkeeper rather than a regular mob
-                mob = make_mob(mobref.vnum, mob_class=Shopkeeper)
-                # find the shop it works for
-                shop_vnums = [vnum for vnum, shop in shops.items() if shop.shopkeeper == mobref.vnum]
-                assert len(shop_vnums) == 1
-                shop_vnum = shop_vnums[0]
-                shopdata = make_shop(shop_vnum)
-                mob.shop = shopdata
-                num_shops += 1
-            else:
-                mob = make_mob(mobref.vnum)
-            for vnum, details in mobref.equipped.items():
-                obj = make_item(vnum)
-                # @todo actually wield the item
-                num_items += 1
-            inventory = set()
-            for vnum, maxexists in mobref.inventory.items():
-                obj = make_item(vnum)
-                inventory.add(obj)
-                num_items += 1
-            if inventory:
-                mob.init_inventory(inventory)
-            if mobref.vnum in all_shopkeepers:
-                # if it is a shopkeeper, the shop.forsale items should also be present in his inventory
-                if mob.inventory_size < len(mob.shop.forsale):
-                    raise ValueError("shopkeeper %d's inventory missing some shop.forsale items from shop %d" % (mobref.vnum, mob.shop.vnum))
-                for item in mob.shop.forsale:
-                    if not any(i for i in mob.inventory if i.title == item.title):
-                        raise ValueError("shop.forsale item %d (%s) not in shopkeeper %d's inventory" % (item.vnum, item.title, mobref.vnum))
-            loc = make_location(mobref.room)
-            loc.insert(mob, None)
-            num_mobs += 1
-        for details in zone.objects:
-            obj = make_item(details["vnum"])
-            loc = make_location(details["room"])
-            loc.insert(obj, None)
-            inventory = set()
-            for vnum, maxexists in details["contains"].items():
-                sub_item = make_item(vnum)
-                num_items += 1
-                inventory.add(sub_item)
-            if inventory:
-                assert isinstance(obj, Container)
-                obj.init_inventory(inventory)
-            num_items += 1
-        for door_state in zone.doors:
-            loc = make_location(door_state["room"])
-            try:
-                xt = loc.exits[door_state["exit"]]
-            except KeyError:
-                pass
-            else:
-                state = door_state["state"]
-                if not isinstance(xt, Door):
-                    raise TypeError("exit type not door, but asked to set state")
-                if state == "open":
-                    xt.locked = False
-                    xt.opened = True
-                elif state == "closed":
-                    xt.locked = False
-                    xt.opened = False
-                elif state == "locked":
-                    xt.locked = True
-                    xt.opened = False
-                else:
-                    raise ValueError("invalid door state: " + state)
+        counts = reset_zone(zones[vnum])
+        num_mobs += counts[0]
+        num_items += counts[1]
+        num_shops += counts[2]
+        schedule_zone_reset(zones[vnum])
 
     # create the handful of rooms that have no incoming paths (unreachable)
     for vnum in (0, 3, 3055):
@@ -391,3 +441,192 @@ def init_zones():
     print("Spawned: %d mobs, %d items, %d shops" % (num_mobs, num_items, num_shops))
     missing = set(objs) - set(converted_items)
     print(len(missing), "unused item types.")
+
+
+def reset_zone(zone):
+    """
+    Spawn the zone's mobs and items that are missing, and set its door states.
+    Like in CircleMUD, every reset command spawns one mob or item if the live number
+    of them is still below the maximum from the zone data.
+    Returns the number of mobs, items and shops that were spawned.
+    """
+    num_shops = num_mobs = num_items = 0
+    all_shopkeepers = set(shop.shopkeeper for shop in shops.values())
+    for mobref in zone.mobs:
+        if live_count(spawned_mobs, mobref.vnum) >= mobref.globalmax:
+            continue
+        if mobref.vnum in all_shopkeepers:
+            # mob is a shopkeeper, we need to make a shop+shopkeeper rather than a regular mob
+            mob = make_mob(mobref.vnum, mob_class=Shopkeeper)
+            # find the shop it works for
+            shop_vnums = [vnum for vnum, shop in shops.items() if shop.shopkeeper == mobref.vnum]
+            assert len(shop_vnums) == 1
+            shop_vnum = shop_vnums[0]
+            shopdata = make_shop(shop_vnum)
+            mob.shop = shopdata
+            num_shops += 1
+        else:
+            mob = make_mob(mobref.vnum)
+        for vnum, details in mobref.equipped.items():
+            obj = make_item(vnum)
+            # @todo actually wield the item
+            num_items += 1
+        inventory = set()
+        for vnum, maxexists in mobref.inventory.items():
+            obj = make_item(vnum)
+            inventory.add(obj)
+            num_items += 1
+        if inventory:
+            mob.init_inventory(inventory)
+        if mobref.vnum in all_shopkeepers:
+            # if it is a shopkeeper, the shop.forsale items should also be present in his inventory
+            if mob.inventory_size < len(mob.shop.forsale):
+                raise ValueError("shopkeeper %d's inventory missing some shop.forsale items from shop %d" % (mobref.vnum, mob.shop.vnum))
+            for item in mob.shop.forsale:
+                if not any(i for i in mob.inventory if i.title == item.title):
+                    raise ValueError("shop.forsale item %d (%s) not in shopkeeper %d's inventory" % (item.vnum, item.title, mobref.vnum))
+        loc = make_location(mobref.room)
+        loc.insert(mob, None)
+        spawned_mobs[mobref.vnum].append(mob)
+        num_mobs += 1
+    for details in zone.objects:
+        if live_count(spawned_items, details["vnum"]) >= details["globalmax"]:
+            continue
+        obj = make_item(details["vnum"])
+        loc = make_location(details["room"])
+        loc.insert(obj, None)
+        inventory = set()
+        for vnum, maxexists in details["contains"].items():
+            sub_item = make_item(vnum)
+            num_items += 1
+            inventory.add(sub_item)
+        if inventory:
+            assert isinstance(obj, Container)
+            obj.init_inventory(inventory)
+        spawned_items[details["vnum"]].append(obj)
+        num_items += 1
+    for door_state in zone.doors:
+        loc = make_location(door_state["room"])
+        try:
+            xt = loc.exits[door_state["exit"]]
+        except KeyError:
+            pass
+        else:
+            state = door_state["state"]
+            if not isinstance(xt, Door):
+                raise TypeError("exit type not door, but asked to set state")
+            if state == "open":
+                xt.locked = False
+                xt.opened = True
+            elif state == "closed":
+                xt.locked = False
+                xt.opened = False
+            elif state == "locked":
+                xt.locked = True
+                xt.opened = False
+            else:
+                raise ValueError("invalid door state: " + state)
+    return num_mobs, num_items, num_shops
+
+
+def zone_of_room(vnum):
+    for zone in zones.values():
+        if zone.startroom <= vnum <= zone.endroom:
+            return zone
+    raise KeyError("no zone for room %d" % vnum)
+
+
+def location_zone(location):
+    """
+    Zone key of a location, for the driver's exit graph (path finding).
+    Circle rooms are numbered in blocks of 100 per zone, so this works without the zone data.
+    """
+    vnum = getattr(location, "vnum", None)
+    return None if vnum is None else vnum // 100
+
+
+def exit_target_vnum(exit):
+    """The room vnum of the exit's target, without building it (for the sharded mud mode)"""
+    return getattr(exit.target, "vnum", None) if exit.target_built else exit._target
+
+
+def build_zone(zone):
+    """Create all rooms of the zone, and populate it (lazy world mode)"""
+    built_zones.add(zone.vnum)
+    num_rooms = len(converted_rooms)
+    for vnum in range(zone.startroom, zone.endroom + 1):
+        if vnum in rooms:
+            make_location(vnum)
+    num_rooms = len(converted_rooms) - num_rooms
+    num_mobs, num_items, num_shops = reset_zone(zone)
+    schedule_zone_reset(zone)
+    print("Built zone %d (%s): %d rooms, %d mobs, %d items, %d shops." % (zone.vnum, zone.name, num_rooms, num_mobs, num_items, num_shops))
+
+
+def live_count(spawned, vnum):
+    """The number of spawned mobs or items with the given vnum that are still in the world"""
+    alive = [obj for obj in spawned[vnum] if obj.location and (obj.contained_in if isinstance(obj, Item) else obj in obj.location.livings)]
+    spawned[vnum] = alive
+    return len(alive)
+
+
+def schedule_zone_reset(zone):
+    """
+    Schedule the next reset of the zone, after its lifespan. There's one deferred per zone.
+    Resets are spread out so that no two zones are reset in the same server tick.
+    """
+    if zone.resetmode == "never" or zone.lifespan_minutes <= 0:
+        return
+    clock = mud_context.driver.game_clock
+    tick = datetime.timedelta(seconds=mud_context.config.server_tick_time) * clock.times_realtime   # game time per server tick
+    due = clock.plus_realtime(datetime.timedelta(minutes=zone.lifespan_minutes))
+    while any(abs(due - other_due) < tick for vnum, other_due in reset_schedule.items() if vnum != zone.vnum):
+        due += tick
+    reset_schedule[zone.vnum] = due
+    mud_context.driver.defer(due, do_zone_reset, zone.vnum)
+
+
+def do_zone_reset(zone_vnum, ctx):
+    """Deferred action that resets a zone, and schedules the next reset."""
+    if rooms is None:
+        adopt_restored_world()   # the world was restored from a snapshot
+    zone = zones[zone_vnum]
+    try:
+        if zone.resetmode == "afterdeserted" and any(isinstance(living, Player) for loc in zone_locations(zone) for living in loc.livings):
+            pass   # not deserted, try again after another lifespan
+        else:
+            reset_zone(zone)
+    finally:
+        # a failing reset must not stop the zone from being reset again later
+        reset_schedule.pop(zone_vnum, None)
+        schedule_zone_reset(zone)
+
+
+def adopt_restored_world():
+    """
+    The world was restored from a snapshot, so the circle data wasn't loaded and nothing was converted.
+    Load the data (the zone resets need it), and register the restored rooms and the mobs and items
+    in them as if they were made here, so that resets don't build a second copy of them.
+    """
+    load_circle_data()
+    todo = [mud_context.config.startlocation_player, mud_context.config.startlocation_wizard]
+    seen = set(todo)
+    while todo:
+        loc = todo.pop()
+        vnum = getattr(loc, "vnum", None)
+        if vnum is not None:
+            converted_rooms.setdefault(vnum, loc)
+            for living in loc.livings:
+                if hasattr(living, "vnum") and not isinstance(living, Player):
+                    spawned_mobs[living.vnum].append(living)
+            for item in loc.items:
+                if hasattr(item, "vnum"):
+                    spawned_items[item.vnum].append(item)
+        for exit in loc.exits.values():
+            if isinstance(exit.target, Location) and exit.target not in seen:
+                seen.add(exit.target)
+                todo.append(exit.target)
+
+
+def zone_locations(zone):
+    return [loc for vnum, loc in converted_rooms.items() if zone.startroom <= vnum <= zone.endroom]
@@ -0,0 +1,204 @@
+"""
+Binary cache of the parsed CircleMUD world data.
+Parsing all the world files takes a while, so the parsed records are pickled into a cache file
+that is loaded directly on the next start. The cache is keyed on the modification times and sizes
+of the world files and the parser modules, so it is rebuilt automatically when any of them changes.
+The game keeps the cache file in the user data directory of the story; when the cache is built
+with the command below, it is written next to the world data instead (cache_file).
+
+If the cache has to be rebuilt, the world files are parsed in parallel by a pool of worker processes.
+To rebuild the cache (and show the parse vs. load times), run this from the circle story directory:
+``python -m zones.circledata.cache``  (add ``--serial`` to parse the files one by one, for debugging)
+Use ``--memory`` to get a report of the memory used by the loaded records.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import os
+import io
+import gc
+import sys
+import argparse
+import time
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import multiprocessing
+from . import parse_mob_files, parse_obj_files, parse_shp_files, parse_wld_files, parse_zon_files
+
+__all__ = ["load_world_data", "parse_world_data"]
+
+CACHE_VERSION = 2
+datadir = os.path.dirname(__file__)
+cache_file = os.path.join(datadir, "world.cache")    # default location of the cache file
+source_dirs = ["world/mob", "world/obj", "world/shp", "world/wld", "world/zon"]
+
+
+# for every type of world data: the parser module, its parse function, the directory and the file extension
+parsers = {
+    "mobs": (parse_mob_files, parse_mob_files.parse_mobs, "world/mob", ".mob"),
+    "objs": (parse_obj_files, parse_obj_files.parse_file, "world/obj", ".obj"),
+    "shops": (parse_shp_files, parse_shp_files.parse_file, "world/shp", ".shp"),
+    "rooms": (parse_wld_files, parse_wld_files.parse_file, "world/wld", ".wld"),
+    "zones": (parse_zon_files, parse_zon_files.parse_file, "world/zon", ".zon")
+}
+
+
+def parse_world_data(parallel=True, timings=None):
+    """
+    Parse all world files, returns a dict with the mobs, objs, shops, rooms and zones.
+    The files are independent so they're parsed in a pool of worker processes
+    (unless parallel is False, or there is only a single cpu).
+    If you pass a timings dict, it is filled with the number of files and the total parse time per data type,
+    and the total elapsed time.
+    """
+    start = time.time()
+    files = []
+    for kind, (_, _, directory, extension) in parsers.items():
+        directory = os.path.join(datadir, directory)
+        files.extend((kind, os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(extension))
+    files.sort(key=lambda kind_path: os.path.getsize(kind_path[1]), reverse=True)   # the big ones first
+    data = dict((kind, {}) for kind in parsers)
+    if timings is not None:
+        timings.clear()
+        timings.update((kind, [0, 0.0]) for kind in parsers)
+    if parallel and multiprocessing.cpu_count() > 1:
+        pool = multiprocessing.Pool()
+        try:
+            results = pool.imap_unordered(parse_file, files)
+            _merge_results(data, results, timings)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _merge_results(data, (parse_file(kind_path) for kind_path in files), timings)
+    if timings is not None:
+        timings["total"] = time.time() - start
+    return data
+
+
+def parse_file(kind_path):
+    """Parse a single world file (possibly in a worker process), returns the records from that file"""
+    kind, path = kind_path
+    module, parse, _, _ = parsers[kind]
+    start = time.time()
+    records = getattr(module, kind)   # the parser modules store the records in a global dict
+    records.clear()
+    parse(path)
+    result = dict(records)
+    records.clear()
+    return kind, result, time.time() - start
+
+
+def _merge_results(data, results, timings):
+    for kind, records, duration in results:
+        data[kind].update(records)
+        if timings is not None:
+            timings[kind][0] += 1
+            timings[kind][1] += duration
+
+
+def source_signature():
+    """The name, modification time and size of all the files that the parsed data depends on"""
+    paths = [os.path.join(datadir, name) for name in os.listdir(datadir) if name.endswith(".py")]
+    for directory in source_dirs:
+        directory = os.path.join(datadir, directory)
+        paths.extend(os.path.join(directory, name) for name in os.listdir(directory))
+    signature = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        signature.append((os.path.relpath(path, datadir), stat.st_mtime, stat.st_size))
+    return CACHE_VERSION, sys.version_info[0], signature
+
+
+def load_world_data(use_cache=True, parallel=True, path=None):
+    """
+    Returns the world data (see parse_world_data), from the cache file if it is still valid.
+    Otherwise the world files are parsed and the cache is (re)written.
+    The cache file is at the given path, or at the default location (cache_file).
+    """
+    path = path or cache_file
+    signature = source_signature()
+    if use_cache:
+        try:
+            with io.open(path, "rb") as f:
+                unpickler = pickle.Unpickler(f)
+                if unpickler.load() == signature:
+                    return unpickler.load()
+        except (IOError, OSError, EOFError, pickle.PickleError, ValueError, AttributeError, ImportError):
+            pass    # no (usable) cache, just parse the files instead
+    data = parse_world_data(parallel)
+    write_cache(signature, data, path)
+    return data
+
+
+def write_cache(signature, data, path=None):
+    """Write the cache file. If that's not possible (read-only directory for instance), the game just runs without a cache."""
+    path = path or cache_file
+    temp_file = path + ".tmp"
+    try:
+        with io.open(temp_file, "wb") as f:
+            pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+            pickler.dump(signature)
+            pickler.dump(data)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_file, path)
+    except (IOError, OSError) as x:
+        print("Can't write the circle data cache file:", x)
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the circle world data cache file.")
+    parser.add_argument("-s", "--serial", help="parse the files one after another in this process (for debugging)", action="store_true")
+    parser.add_argument("-m", "--memory", help="report the memory used by the loaded records", action="store_true")
+    args = parser.parse_args()
+    if args.memory:
+        memory_report()
+        return
+    timings = {}
+    data = parse_world_data(not args.serial, timings)
+    write_cache(source_signature(), data)
+    start = time.time()
+    data = load_world_data()
+    load_duration = time.time() - start
+    print("Rebuilt the cache file: %s (%d bytes)" % (cache_file, os.path.getsize(cache_file)))
+    print("Parse times (summed per file):")
+    for kind in sorted(parsers):
+        num_files, duration = timings[kind]
+        print("  %-6s %5d records from %3d files: %.3f sec." % (kind, len(data[kind]), num_files, duration))
+    print("Parsing the world files: %.3f sec. (%s)" % (timings["total"], "serial" if args.serial else "parallel"))
+    print("Loading from the cache:  %.3f sec." % load_duration)
+
+
+def memory_report():
+    try:
+        import tracemalloc
+    except ImportError:
+        print("The memory report requires the tracemalloc module (python 3.4+).")
+        return
+    tracemalloc.start()
+    data = load_world_data()
+    gc.collect()
+    total = tracemalloc.get_traced_memory()[0]
+    print("Memory used by the loaded records:")
+    for kind in sorted(parsers):
+        num_records = len(data[kind])
+        before = tracemalloc.get_traced_memory()[0]
+        del data[kind]
+        gc.collect()
+        size = before - tracemalloc.get_traced_memory()[0]
+        print("  %-6s %5d records: %9d bytes (%d per record)" % (kind, num_records, size, size // num_records))
+    print("  total:  %d bytes" % total)
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,10 @@ http://inventwithpython.com/blog/2012/03/19/circlemud-data-in-xml-format-for-you
 import os
 import re
 import io
+try:
+    from .records import Record, intern_str
+except (ImportError, ValueError, SystemError):
+    from records import Record, intern_str     # running as a script
 
 __all__ = ["get_mobs"]
 
@@ -15,9 +19,10 @@ mobs = {}
 extendedMobPat = re.compile('(.*?):(.*)')
 
 
-class Mob(object):
-    def __init__(self, **kwargs):
-        self.__dict__ = kwargs
+class Mob(Record):
+    __slots__ = ("vnum", "alignment", "type", "level", "thac0", "ac", "maxhp_dice", "barehanddmg_dice", "gold", "xp",
+                 "loadposition", "defaultposition", "gender", "aliases", "shortdesc", "longdesc", "detaileddesc",
+                 "actions", "affection", "extended", "extradesc")
 
     def __repr__(self):
         return "<Mob #%d: %s>" % (self.vnum, self.shortdesc)
@@ -166,7 +171,7 @@ def parse_mobs(mobFile):
                       loadposition=loadArg,
                       defaultposition=defaultPosArg,
                       gender=sexArg,
-                      aliases=list(aliasArg),   # ordered, the first is the best
+                      aliases=[intern_str(a) for a in aliasArg],   # ordered, the first is the best
                       shortdesc=shortDescArg.replace("\n", " ") or None,
                       longdesc=longDescArg.replace("\n", " ") or None,
                       detaileddesc=detailedDescArg.replace("\n", " ") or None,
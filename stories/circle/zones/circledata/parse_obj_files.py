@@ -8,13 +8,17 @@ http://inventwithpython.com/blog/2012/03/19/circlemud-data-in-xml-format-for-you
 import os
 import re
 import io
+try:
+    from .records import Record, intern_str
+except (ImportError, ValueError, SystemError):
+    from records import Record, intern_str     # running as a script
 
 __all__ = ["get_objs"]
 
 
-class Obj(object):
-    def __init__(self, **kwargs):
-        self.__dict__ = kwargs
+class Obj(Record):
+    __slots__ = ("vnum", "aliases", "type", "weight", "cost", "rent", "shortdesc", "longdesc", "effects", "wear",
+                 "typespecific", "extradesc", "affects")
 
     def __repr__(self):
         return "<Obj #%d: %s>" % (self.vnum, self.shortdesc)
@@ -294,7 +298,7 @@ def parse_file(objFile):
 
             obj = Obj(
                 vnum=int(vNumArg),
-                aliases=list(aliasArg),  # ordered, the first is the best
+                aliases=[intern_str(a) for a in aliasArg],  # ordered, the first is the best
                 type=typeFlagArg,
                 weight=int(weightArg),
                 cost=int(costArg),
@@ -356,7 +360,7 @@ def parse_file(objFile):
             obj.extradesc = []
             for arg in extendedArg:
                 desc = {}
-                desc["keywords"] = set(arg[0])
+                desc["keywords"] = set(intern_str(k) for k in arg[0])
                 desc["text"] = arg[1].replace("\n", " ")
                 obj.extradesc.append(desc)
             obj.affects = {}
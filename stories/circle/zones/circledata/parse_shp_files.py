@@ -8,13 +8,18 @@ http://inventwithpython.com/blog/2012/03/19/circlemud-data-in-xml-format-for-you
 import os
 import re
 import io
+try:
+    from .records import Record
+except (ImportError, ValueError, SystemError):
+    from records import Record     # running as a script
 
 __all__ = ["get_shops"]
 
 
-class Shop(object):
-    def __init__(self, **kwargs):
-        self.__dict__ = kwargs
+class Shop(Record):
+    __slots__ = ("vnum", "sellprofit", "buyprofit", "shopkeeper", "fights", "banks", "open1", "close1", "open2", "close2",
+                 "forsale", "willbuy", "msg_playercantbuy", "msg_playercantsell", "msg_shopdoesnotbuy", "msg_shopcantafford",
+                 "msg_playercantafford", "msg_shopsolditem", "msg_shopboughtitem", "msg_temper", "rooms", "wontdealwith")
 
     def __repr__(self):
         return "<Shop #%d>" % self.vnum
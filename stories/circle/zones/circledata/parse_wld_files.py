@@ -7,22 +7,24 @@ http://inventwithpython.com/blog/2012/03/19/circlemud-data-in-xml-format-for-you
 
 import os
 import io
+try:
+    from .records import Record, intern_str
+except (ImportError, ValueError, SystemError):
+    from records import Record, intern_str     # running as a script
 
 
 __all__ = ["get_rooms"]
 
 
-class Room(object):
-    def __init__(self, **kwargs):
-        self.__dict__ = kwargs
+class Room(Record):
+    __slots__ = ("vnum", "name", "type", "zone", "attributes", "desc", "exits", "extradesc")
 
     def __repr__(self):
         return "<Room #%d: %s>" % (self.vnum, self.name)
 
 
-class Exit(object):
-    def __init__(self, **kwargs):
-        self.__dict__ = kwargs
+class Exit(Record):
+    __slots__ = ("direction", "type", "key", "roomlink", "keywords", "desc")
 
 
 rooms = {}
@@ -137,12 +139,12 @@ def parse_file(wldFile):
                     type=exitArg["type"],
                     key=int(exitArg["keynum"]) if exitArg["keynum"] else None,
                     roomlink=int(exitArg["roomlinked"]),
-                    keywords=set(exitArg["keywords"]),
+                    keywords=set(intern_str(k) for k in exitArg["keywords"]),
                     desc=exitArg["desc"].replace("\n", " ") if exitArg["desc"] else None
                 )
                 room.exits[xt.direction] = xt
             for arg in extraDescsArg:
-                desc = {"keywords": set(arg["keywords"].split()), "text": arg["desc"].replace("\n", " ")}
+                desc = {"keywords": set(intern_str(k) for k in arg["keywords"].split()), "text": arg["desc"].replace("\n", " ")}
                 room.extradesc.append(desc)
 
             rooms[room.vnum] = room
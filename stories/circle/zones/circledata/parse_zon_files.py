@@ -8,22 +8,24 @@ http://inventwithpython.com/blog/2012/03/19/circlemud-data-in-xml-format-for-you
 import os
 import re
 import io
+try:
+    from .records import Record
+except (ImportError, ValueError, SystemError):
+    from records import Record     # running as a script
 
 
 __all__ = ["get_zones"]
 
 
-class Zone(object):
-    def __init__(self, **kwargs):
-        self.__dict__ = kwargs
+class Zone(Record):
+    __slots__ = ("vnum", "name", "startroom", "endroom", "lifespan_minutes", "resetmode", "mobs", "objects", "doors")
 
     def __repr__(self):
         return "<Zone #%d: %s>" % (self.vnum, self.name)
 
 
-class MobRef(object):
-    def __init__(self, **kwargs):
-        self.__dict__ = kwargs
+class MobRef(Record):
+    __slots__ = ("vnum", "globalmax", "room", "inventory", "equipped")
 
     def __repr__(self):
         return "<MobRef to #%d>" % self.vnum
@@ -0,0 +1,29 @@
+"""
+Compact record types for the parsed CircleMUD data.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from tale.util import intern_str
+
+__all__ = ["Record", "intern_str"]
+
+
+class Record(object):
+    """
+    Base class for the parsed records. Subclasses list their fields in __slots__,
+    so the records don't need an instance dict. Fields that are not given remain unset.
+    """
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__ if hasattr(self, name))
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
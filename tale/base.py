@@ -63,28 +63,88 @@ def heartbeat(klass):
     Use sparingly as it is less efficient than using a deferred, because the driver
     has to call all heartbeats every tick even though they do nothing yet.
     With deferreds, the driver only calls a deferred at the time it is needed.
+    Objects that set heartbeat_skippable don't prevent the driver from skipping ticks
+    when it fast forwards time (see MudObject.skip_heartbeats).
     """
     klass._register_heartbeat = True
     return klass
 
 
 def clone(obj):
-    """Create a copy of an existing (Mud)Object. Only when it has an empty inventory (to avoid problems)"""
+    """
+    Create a copy of an existing (Mud)Object. Only when it has an empty inventory (to avoid problems)
+    The strings (names, descriptions) are shared with the original object, and flat collections of
+    them (such as the aliases, verbs and extra descriptions) are shallow copied. Only the remaining
+    attributes are deepcopied. The location is shared as well, and not deepcopied.
+    """
     if isinstance(obj, MudObject):
         try:
             if obj.inventory_size > 0:
                 raise ValueError("can't clone something that has other stuff in it")
         except ActionRefused:
             pass
-        if obj.location:
-            # avoid deepcopying the location
-            location, obj.location = obj.location, None
-            duplicate = copy.deepcopy(obj)
-            obj.location = duplicate.location = location
-            return duplicate
+        duplicate = obj.__class__.__new__(obj.__class__)
+        memo = {id(obj): duplicate}
+        location = obj.location
+        if location:
+            memo[id(location)] = location   # avoid deepcopying the location
+        state = obj.__getstate__() if hasattr(obj, "__getstate__") else obj.__dict__
+        state = dict((name, _clone_value(value, memo)) for name, value in state.items() if name != "contained_in")
+        if isinstance(obj, Item):
+            state["contained_in"] = location   # the duplicate is not inside the original's container
+        if hasattr(duplicate, "__setstate__"):
+            duplicate.__setstate__(state)
+        else:
+            duplicate.__dict__.update(state)
+        return duplicate
     return copy.deepcopy(obj)
 
 
+_shared_types = {type(None), bool, int, type(sys.maxsize + 1), float, complex, bytes, type("")}   # the second int type is 'long' on python 2
+
+
+def _clone_value(value, memo):
+    # share immutable values, shallow copy flat collections of them, deepcopy the rest
+    if type(value) in _shared_types:
+        return value
+    if id(value) in memo:
+        return memo[id(value)]
+    duplicate = None
+    if type(value) in (list, set, tuple, frozenset):
+        if all(type(v) in _shared_types for v in value):
+            duplicate = value if type(value) in (tuple, frozenset) else type(value)(value)
+    elif type(value) is dict:
+        if all(type(k) in _shared_types and type(v) in _shared_types for k, v in value.items()):
+            duplicate = dict(value)
+    if duplicate is None:
+        return copy.deepcopy(value, memo)
+    memo[id(value)] = duplicate
+    return duplicate
+
+
+class _OnDemand(object):
+    """
+    Descriptor for a collection attribute (set or dict) that is only created when it is first used.
+    Most objects never get any verbs or extra descriptions, and most locations are empty,
+    so this saves an empty collection per object. The collection is stored in the
+    instance's __dict__ under the same name, so pickling and cloning are not affected.
+    This is not a data descriptor (there's no __set__), so once the collection exists,
+    reading the attribute finds it in the instance's __dict__ without calling __get__.
+    """
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        try:
+            return obj.__dict__[self.name]
+        except KeyError:
+            value = obj.__dict__[self.name] = self.factory()
+            return value
+
+
 class MudObject(object):
     """
     Root class of all objects in the mud world
@@ -106,6 +166,10 @@ class MudObject(object):
     possessive = "its"
     objective = "it"
     gender = "n"
+    aliases = _OnDemand("aliases", set)
+    verbs = _OnDemand("verbs", dict)   # any custom verbs that need to be recognised (verb->docstring mapping. Verb handling is done via handle_verb() callbacks)
+    _extradesc = _OnDemand("_extradesc", dict)   # maps keyword to description
+    heartbeat_skippable = False   # can the driver replace heartbeats by skip_heartbeats, when it fast forwards time?
 
     @property
     def title(self):
@@ -142,8 +206,6 @@ class MudObject(object):
     def __init__(self, name, title=None, description=None, short_description=None):
         self.name = self._description = self._title = self._short_description = None
         self.init_names(name, title, description, short_description)
-        self.aliases = set()
-        self.verbs = {}   # any custom verbs that need to be recognised (verb->docstring mapping. Verb handling is done via handle_verb() callbacks)
         if getattr(self, "_register_heartbeat", False):
             # one way of setting this attribute is by using the @heartbeat decorator
             self.register_heartbeat()
@@ -158,14 +220,14 @@ class MudObject(object):
 
     def init_names(self, name, title, description, short_description):
         """(re)set the name and description attributes"""
-        self.name = name.lower()
+        self.name = util.intern_str(name.lower())
         if title:
             assert not title.startswith("the ") and not title.startswith("The "), "title must not start with 'the'"
             assert not title.startswith("a ") and not title.startswith("A "), "title must not start with 'a'"
         self._title = title or name
         self._description = dedent(description).strip() if description else ""
         self._short_description = short_description
-        self._extradesc = {}   # maps keyword to description
+        self.__dict__.pop("_extradesc", None)   # the extra descriptions dict is recreated when needed
 
     def add_extradesc(self, keywords, description):
         """For the list of keywords, add the extra description text"""
@@ -206,6 +268,13 @@ class MudObject(object):
         # not automatically called, only if your object registered with the driver
         pass
 
+    def skip_heartbeats(self, ctx, beats):
+        """
+        Called instead of the given number of heartbeats when the driver fast forwards the game time
+        (when waiting in IF mode), but only if the object has set heartbeat_skippable to True.
+        """
+        pass
+
     def activate(self, actor):
         # called from the activate command, override if your object needs to act on this.
         raise ActionRefused("You can't activate that.")
@@ -248,12 +317,12 @@ class Item(MudObject):
     Regular items cannot contain other things, so it makes to sense
     to check containment.
     """
-    def init(self):
-        self.contained_in = None
-        self.default_verb = "examine"
-        self.value = 0.0   # what the item is worth
-        self.rent = 0.0    # price to keep in store / day
-        self.weight = 0.0  # some abstract unit
+    # these defaults are class attributes, an item only stores them itself when they are changed
+    contained_in = None
+    default_verb = "examine"
+    value = 0.0   # what the item is worth
+    rent = 0.0    # price to keep in store / day
+    weight = 0.0  # some abstract unit
 
     def __contains__(self, item):
         raise ActionRefused("You can't look inside of that.")
@@ -374,12 +443,13 @@ class Location(MudObject):
     Has connections ('exits') to other Locations.
     You can test for containment with 'in': item in loc, npc in loc
     """
+    livings = _OnDemand("livings", set)   # set of livings in this location
+    items = _OnDemand("items", set)       # set of all items in the room
+    exits = _OnDemand("exits", dict)      # dictionary of all exits: exit_direction -> Exit object with target & descr
+
     def __init__(self, name, description=None):
         super(Location, self).__init__(name, description=description)
-        self.name = name      # make sure we preserve the case; base object stores it lowercase
-        self.livings = set()  # set of livings in this location
-        self.items = set()    # set of all items in the room
-        self.exits = {}       # dictionary of all exits: exit_direction -> Exit object with target & descr
+        self.name = util.intern_str(name)      # make sure we preserve the case; base object stores it lowercase
 
     def __contains__(self, obj):
         return obj in self.livings or obj in self.items
@@ -406,6 +476,9 @@ class Location(MudObject):
         self.livings.clear()
         self.items.clear()
         self.exits.clear()
+        graph = getattr(mud_context.driver, "exit_graph", None)
+        if graph is not None:
+            graph.location_changed(self)
 
     def add_exits(self, exits):
         """Adds every exit from the sequence as an exit to this room."""
@@ -440,36 +513,29 @@ class Location(MudObject):
             tap = self.get_wiretap()
             tap.send((self.name, room_msg))
 
-    def message_nearby_locations(self, message):
+    def message_nearby_locations(self, message, radius=1):
         """
-        Tells a message to adjacent locations, where adjacent is defined by being connected via an exit.
-        If the adjacent location has an obvious returning exit to the source location (via one of the
-        most obvious routes n/e/s/w/up/down/etc.), it hen also get information on what direction
+        Tells a message to nearby locations, that are connected via exits (up to radius steps away).
+        The message can also be a function that is called with the distance (number of steps) and returns
+        the message for that distance, or None if nothing can be heard there anymore.
+        If the location has an obvious returning exit towards the source of the message (via one of the
+        most obvious routes n/e/s/w/up/down/etc.), it then also gets information on what direction
         the sound originated from.  This is used for loud noises such as yells!
+        All nearby locations are found in a single search of the driver's exit graph.
         """
-        if self.exits:
-            yelled_locations = set()
-            for exit in self.exits.values():
-                if exit.target in yelled_locations:
-                    continue   # skip double locations (possible because there can be multiple exits to the same location)
-                if exit.target is not self:
-                    exit.target.tell(message)
-                    yelled_locations.add(exit.target)
-                    for direction, return_exit in exit.target.exits.items():
-                        if return_exit.target is self:
-                            if direction in {"north", "east", "south", "west", "northeast", "northwest", "southeast",
-                                             "southwest", "left", "right", "front", "back"}:
-                                direction = "the " + direction
-                            elif direction in {"up", "above", "upstairs"}:
-                                direction = "above"
-                            elif direction in {"down", "below", "downstairs"}:
-                                direction = "below"
-                            else:
-                                continue  # no direction description possible for this exit
-                            exit.target.tell("The sound is coming from %s." % direction)
-                            break
-                    else:
-                        exit.target.tell("You can't hear where the sound is coming from.")
+        graph = getattr(mud_context.driver, "exit_graph", None)
+        if graph is None:
+            from .pathfinding import ExitGraph
+            graph = ExitGraph()   # no driver (or one without an exit graph), use a throwaway graph
+        for location, distance, exit in graph.nearby(self, radius):
+            text = message(distance) if callable(message) else message
+            if text:
+                location.tell(text)
+                direction = graph.return_direction(exit)
+                if direction:
+                    location.tell("The sound is coming from %s." % direction)
+                else:
+                    location.tell("You can't hear where the sound is coming from.")
 
     def nearby(self, no_traps=True):
         """
@@ -628,6 +694,8 @@ class Exit(MudObject):
     The exit's direction is stored as its name attribute (if more than one, the rest are aliases).
     Note that the exit's origin is not stored in the exit object.
     """
+    target_built = True    # subclasses that create their target location lazily set this to False until it exists
+
     def __init__(self, directions, target_location, short_description, long_description=None):
         assert isinstance(target_location, (Location, util.basestring_type)), "target must be a Location or a string"
         if isinstance(directions, util.basestring_type):
@@ -661,12 +729,15 @@ class Exit(MudObject):
             if direction in location.exits:
                 raise LocationIntegrityError("exit already exists: '%s' in %s" % (direction, location), direction, self, location)
             location.exits[direction] = self
+        graph = getattr(mud_context.driver, "exit_graph", None)
+        if graph is not None:
+            graph.location_changed(location)
 
     def _bind_target(self, game_zones_module):
         """
         Binds the exit to the actual target_location object.
-        Usually called by the driver before it starts player interaction.
         The caller needs to pass in the root module of the game zones (to avoid circular import dependencies)
+        The driver doesn't use this, it binds all exits at once using its location registry (see Driver.bind_exits).
         """
         if not self.bound:
             target_module, target_object = self.target.rsplit(".", 1)
@@ -677,11 +748,15 @@ class Exit(MudObject):
                 target = getattr(module, target_object)
             except AttributeError:
                 raise AttributeError("exit target error, cannot find target: '%s.%s' in exit: '%s'" % (target_module, target_object, self.short_description))
-            assert isinstance(target, Location)
-            self.target = target
-            self.title = "Exit to " + target.title
-            self.name = self.title.lower()
-            self.bound = True
+            self._set_target(target)
+
+    def _set_target(self, target):
+        """Binds the exit to the given target location (that was designated by the exit's target string)"""
+        assert isinstance(target, Location)
+        self.target = target
+        self.title = "Exit to " + target.title
+        self.name = self.title.lower()
+        self.bound = True
 
     def allow_passage(self, actor):
         """Is the actor allowed to move through the exit? Raise ActionRefused if not"""
@@ -1194,6 +1269,18 @@ class Door(Exit):
         other_door.key_code = self.key_code
         return other_door
 
+    @property
+    def opened(self):
+        return self._opened
+
+    @opened.setter
+    def opened(self, value):
+        changed = value != self.__dict__.get("_opened")
+        self._opened = value
+        graph = getattr(mud_context.driver, "exit_graph", None)
+        if changed and graph is not None and getattr(self, "bound", False):
+            graph.exit_changed(self)   # paths through this door may have changed
+
     @property
     def description(self):
         if self.opened:
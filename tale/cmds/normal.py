@@ -785,7 +785,12 @@ def do_yell(player, parsed, ctx):
         message += "!"
     player.tell("You yell:", message)
     player.tell_others("{Title} yells: %s" % message)
-    player.location.message_nearby_locations("Someone nearby is yelling: " + message)  # yell this to adjacent locations as well
+
+    def yelled_message(distance):
+        if distance == 1:
+            return "Someone nearby is yelling: " + message
+        return "Someone is yelling in the distance, but you can't make out the words."
+    player.location.message_nearby_locations(yelled_message, radius=2)  # yell this to nearby locations as well
 
 
 @cmd("say")
@@ -1136,6 +1141,41 @@ def do_exits(player, parsed, ctx):
             player.tell("Your current location doesn't seem to have any obvious exits.")
 
 
+@cmd("goto")
+@no_soul_parse
+def do_goto(player, parsed, ctx):
+    """Walk to a location that you've been before, taking the shortest route there."""
+    name = parsed.unparsed.strip().lower()
+    if not name:
+        raise ActionRefused("Go to where?")
+    known = sorted(player.known_locations, key=lambda loc: loc.name)
+    targets = [loc for loc in known if loc.name.lower() == name] or [loc for loc in known if loc.name.lower().startswith(name)]
+    if not targets:
+        raise ActionRefused("You don't remember a place called '%s'." % name)
+    target = targets[0]
+    if target is player.location:
+        raise ActionRefused("You're already there.")
+    route = ctx.driver.find_path(player.location, target)
+    if route is None:
+        raise ActionRefused("You don't know how to get there from here.")
+    directions = []
+    for exit in route:
+        try:
+            exit.allow_passage(player)
+        except ActionRefused as x:
+            if directions:
+                player.tell("You walk %s, but then you can't go further: %s" % (lang.join(directions), x), end=True)
+                player.tell("\n")
+                player.look()
+                return
+            raise
+        player.move(exit.target)
+        directions.append(exit.name)
+    player.tell("You walk %s, to %s." % (lang.join(directions), target.name), end=True)
+    player.tell("\n")
+    player.look()
+
+
 @cmd("use")
 def do_use(player, parsed, ctx):
     """General object use. Most of the time, you'll need to be more specific to say exactly what you want to do with it."""
@@ -1207,7 +1247,8 @@ def do_coin(player, parsed, ctx):
 @disabled_in_gamemode("if")
 def do_motd(player, parsed, ctx):
     """Show the message-of-the-day again."""
-    ctx.driver.show_motd(player, notify_no_motd=True)
+    motd = yield "async", ctx.driver.read_motd
+    ctx.driver.show_motd(player, motd, notify_no_motd=True)
 
 
 @cmd("flee")
@@ -1560,7 +1601,7 @@ def do_change_pw(player, parsed, ctx):
     current_pw = yield "input-noecho", "Type your current password."
     new_pw = yield "input-noecho", ("Type your new password.", MudAccounts.accept_password)
     try:
-        ctx.driver.mud_accounts.change_password_email(player.name, current_pw, new_password=new_pw)
+        yield "async", lambda: ctx.driver.mud_accounts.change_password_email(player.name, current_pw, new_password=new_pw)
         player.tell("Password updated.")
     except ValueError as x:
         raise ActionRefused("<it>%s</it>" % x)
@@ -1570,12 +1611,12 @@ def do_change_pw(player, parsed, ctx):
 @disabled_in_gamemode("if")
 def do_change_email(player, parsed, ctx):
     """Lets you change the email address on file for your account."""
-    account = ctx.driver.mud_accounts.get(player.name)
+    account = yield "async", lambda: ctx.driver.mud_accounts.get(player.name)
     player.tell("<it>Changing your email. It is currently set to: %s</>" % account["email"])
     current_pw = yield "input-noecho", "Type your current password."
     new_email = yield "input", ("Type your new email address.", MudAccounts.accept_email)
     try:
-        ctx.driver.mud_accounts.change_password_email(player.name, current_pw, new_email=new_email)
+        yield "async", lambda: ctx.driver.mud_accounts.change_password_email(player.name, current_pw, new_email=new_email)
         player.tell("Email address updated.")
     except ValueError as x:
         raise ActionRefused("<it>%s</it>" % x)
@@ -1585,7 +1626,7 @@ def do_change_email(player, parsed, ctx):
 @disabled_in_gamemode("if")
 def do_account(player, parsed, ctx):
     """Displays your player account data."""
-    account = ctx.driver.mud_accounts.get(player.name)
+    account = yield "async", lambda: ctx.driver.mud_accounts.get(player.name)
     player.tell("<ul>Your account data.</ul>", end=True)
     player.tell("name: %s" % account["name"], end=True)
     player.tell("email: %s" % account["email"], end=True)
@@ -13,11 +13,12 @@ import functools
 import sys
 import gc
 import platform
+import threading
 from .decorators import disabled_in_gamemode
 from ..errors import SecurityViolation, ParseError, ActionRefused
 from ..player import Player
 from ..soul import NonSoulVerb
-from .. import base, lang, util, pubsub, __version__
+from .. import base, lang, util, pubsub, perf, __version__
 
 all_commands = {}
 LIBRARY_MODULE_NAME = "tale"
@@ -447,6 +448,74 @@ def do_server(player, parsed, ctx):
         txt.append("Loop duration:  %.2f sec. (avg)" % avg_loop_duration)
     elif config.server_tick_method == "command":
         txt.append("Loop duration:  n/a (command driven)")
+    txt.append("Profiling:      %s" % ("on (see the perf command)" if driver.profiler.enabled else "off"))
+    stats = driver.resources.cache_statistics()
+    txt.append("Resource cache: %d files, %d Kb  (%d hits, %d revalidated, %d misses, %d evicted)" %
+               (stats["entries"], stats["size"] // 1024, stats["hits"], stats["revalidations"], stats["misses"], stats["evictions"]))
+    player.tell(*txt, format=False)
+
+
+@wizcmd("perf")
+def do_perf(player, parsed, ctx):
+    """Show the timings of the server tick and of the player commands (in milliseconds).
+Use 'perf on' or 'perf off' to enable or disable profiling, 'perf reset' to clear the timings.
+Add a name prefix (for instance 'perf verb') to show only the matching timings."""
+    profiler = ctx.driver.profiler
+    arg = parsed.args[0] if parsed.args else ""
+    if arg in ("on", "off"):
+        profiler.enable(arg == "on")
+        player.tell("Profiling is now %s." % arg)
+        return
+    if arg == "reset":
+        profiler.reset()
+        player.tell("Timings have been cleared.")
+        return
+    if not profiler.enabled:
+        player.tell("Profiling is off. Use 'perf on' to enable it.")
+    statistics = profiler.statistics()["timings"]
+    names = sorted(name for name in statistics if name.startswith(arg) and statistics[name]["samples"])
+    if not names:
+        player.tell("There are no timings.")
+        return
+    txt = ["<ul>name                     <dim>|</><ul>   count<dim>|</><ul>    p50<dim>|</><ul>    p95<dim>|</><ul>    p99<dim>|</><ul>    max</>"]
+    for name in names:
+        stats = statistics[name]
+        txt.append("%-24s <dim>|</>%8d<dim>|</>%7.2f<dim>|</>%7.2f<dim>|</>%7.2f<dim>|</>%7.2f" %
+                   (name, stats["count"], stats["p50"] * 1000, stats["p95"] * 1000, stats["p99"] * 1000, stats["max"] * 1000))
+    player.tell(*txt, format=False)
+
+
+@wizcmd("profile")
+@disabled_in_gamemode("if")
+def do_profile(player, parsed, ctx):
+    """Usage: profile [seconds]. Samples what the server is doing during some time (default 10 seconds).
+The most sampled functions are shown, and all samples are saved in a file (collapsed stacks, for a flame graph)."""
+    try:
+        duration = float(parsed.args[0]) if parsed.args else 10.0
+    except ValueError:
+        raise ParseError("For how many seconds?")
+    if not 0 < duration <= 300:
+        raise ActionRefused("The duration must be more than 0 and at most 300 seconds.")
+    if not ctx.driver.user_resources or ctx.driver.user_resources.readonly:
+        raise ActionRefused("There's no place to save the profile.")
+    sampler = perf.SamplingProfiler(threading.current_thread().ident)   # the driver thread
+    filename = datetime.datetime.now().strftime("profiles/profile-%Y%m%d-%H%M%S.txt")
+
+    def sample():
+        sampler.run(duration)
+        ctx.driver.user_resources[filename] = sampler.collapsed_stacks()
+    player.tell("Profiling for %g seconds..." % duration)
+    try:
+        yield "async", sample
+    except ValueError as x:
+        raise ActionRefused(str(x))
+    if not sampler.num_samples:
+        player.tell("No samples were taken.")
+        return
+    txt = ["Took %d samples, saved in %s." % (sampler.num_samples, filename),
+           "<ul>   self<dim>|</><ul>  total<dim>|</><ul> function</>"]
+    for function, own, total in sampler.top_functions(15):
+        txt.append("%6.1f%%<dim>|</>%6.1f%%<dim>|</> %s" % (100.0 * own / sampler.num_samples, 100.0 * total / sampler.num_samples, function))
     player.tell(*txt, format=False)
 
 
@@ -588,3 +657,11 @@ def do_remove_priv(player, parsed, ctx):
             player.tell("Player has been notified and forced to log off.")
     else:
         player.tell("No changes.")
+
+
+@wizcmd("snapshot")
+@disabled_in_gamemode("if")
+def do_snapshot(player, parsed, ctx):
+    """Write a snapshot of the game world (without the players). Start the server with --snapshot to restore it."""
+    num_locations, duration = ctx.driver.save_snapshot()
+    player.tell("World snapshot written: %d locations, in %.2f seconds." % (num_locations, duration))
@@ -14,6 +14,7 @@ import sys
 import time
 import os
 import heapq
+import math
 import argparse
 import pickle
 import inspect
@@ -23,10 +24,11 @@ import traceback
 import appdirs
 import distutils.version
 import pkgutil
-from . import mud_context, errors, util, soul, cmds, player, base, npc, pubsub, charbuilder, lang, races
+from . import mud_context, errors, util, soul, cmds, player, base, npc, pubsub, charbuilder, lang, races, savegames, pathfinding, perf, executor
 from . import __version__ as tale_version_str
 from .tio import vfs, DEFAULT_SCREEN_WIDTH, DEFAULT_SCREEN_DELAY
 from .base import Stats
+from .items.board import BoardStorage
 if sys.version_info < (3, 0):
     input = raw_input
 else:
@@ -47,11 +49,15 @@ class Driver(pubsub.Listener):
     def __init__(self):
         self.heartbeat_objects = set()
         self.unbound_exits = []
+        self.zone_locations = {}   # location registry: "zone.name" -> Location, filled when a zone module is loaded
+        self.__zone_modules = {}   # loaded zone modules by name (None if the module doesn't exist)
+        self.exit_graph = pathfinding.ExitGraph()   # locations and exits, for path finding
         self.deferreds = []  # heapq
         self.deferreds_lock = threading.Lock()
         self.server_started = datetime.datetime.now().replace(microsecond=0)
         self.config = None
         self.server_loop_durations = collections.deque(maxlen=10)
+        self.profiler = perf.Profiler()   # timings of the server tick and player commands (when enabled)
         self.commands = Commands()
         cmds.register_all(self.commands)
         self.all_players = {}   # maps playername to player connection object
@@ -62,6 +68,14 @@ class Driver(pubsub.Listener):
         self.game_clock = None
         self.__stop_mainloop = True
         self.waiting_for_input = {}   # maps playerconnection to tuple (dialog, validator, echo_input)
+        self.waiting_for_async = set()   # playerconnections whose dialog waits for the result of an async call
+        self.io_executor = executor.IoExecutor()   # worker threads for blocking work such as disk i/o
+        self.player_store = None   # incremental storage of player state (mud mode only)
+        self.board_storage = None   # messages of the bulletin boards
+        self.shard = None   # when running as a worker process of the sharded mud mode (see tale.shard)
+        self.shard_front = None   # when running as the front process of the sharded mud mode
+        self.startup_times = []    # (phase, duration) of the steps taken to load the story
+        self.__phase_start = time.time()
         topic_pending_actions.subscribe(self)
         topic_pending_tells.subscribe(self)
         topic_async_dialogs.subscribe(self)
@@ -81,6 +95,9 @@ class Driver(pubsub.Listener):
         parser.add_argument('-w', '--web', help='web browser interface', action='store_true')
         parser.add_argument('-v', '--verify', help='only verify the story files, dont run it', action='store_true')
         parser.add_argument('-z', '--wizard', help='force wizard mode on if story character (for debug purposes)', action='store_true')
+        parser.add_argument('-s', '--snapshot', help='mud mode: restore the game world from its snapshot instead of building the zones', action='store_true')
+        parser.add_argument('-p', '--profile', help='collect timings of the server tick and player commands (see the perf command)', action='store_true')
+        parser.add_argument('--shards', type=int, help='mud mode: run the game world in this many worker processes (sharded mode)', default=0)
         args = parser.parse_args(command_line_args)
         try:
             self.__start(args)
@@ -91,8 +108,18 @@ class Driver(pubsub.Listener):
                 tkinter_io.show_error_dialog("Exception during start", "An error occurred while starting up the game:\n\n" + tb)
             raise
 
+    def __phase_done(self, phase):
+        now = time.time()
+        self.startup_times.append((phase, now - self.__phase_start))
+        self.__phase_start = now
+
     def __start(self, args):
         """Start the driver from a parsed set of arguments"""
+        self.__phase_start = time.time()
+        self.profiler.enable(args.profile)
+        if args.shards and args.mode != "mud":
+            raise ValueError("the sharded mode is only available in 'mud' mode")
+        game_path = os.path.abspath(args.game)
         if os.path.isdir(args.game):
             # cd into the game directory (we can import it then), and load its config and zones
             os.chdir(args.game)
@@ -103,10 +130,12 @@ class Driver(pubsub.Listener):
         else:
             raise IOError("Cannot find specified game")
         assert "story" not in sys.modules
+        stale_zones = "zones" in sys.modules   # not imported by this story
         story = __import__("story", level=0)
         if not hasattr(story, "Story"):
             raise AttributeError("Story class not found in the story file. It should be called 'Story'.")
         self.story = story.Story()
+        self.__phase_done("story import")
         if len(self.story.supported_modes) == 1 and args.mode != "mud":
             # There's only one mode this story runs in. Just select that one.
             args.mode = list(self.story.supported_modes)[0]
@@ -121,7 +150,7 @@ class Driver(pubsub.Listener):
         # Register the driver and some other stuff in the global context.
         mud_context.driver = self
         mud_context.config = self.config
-        self.resources = vfs.VirtualFileSystem(root_package="story")   # read-only story resources
+        self.resources = vfs.VirtualFileSystem(root_package="story", cache_size=4 * 1024 * 1024)   # read-only story resources
         try:
             pkgutil.get_loader("cmds")
         except AttributeError:
@@ -149,29 +178,49 @@ class Driver(pubsub.Listener):
                 os.makedirs(user_data_dir, mode=0o700)
             except os.error:
                 pass
-        self.user_resources = vfs.VirtualFileSystem(root_path=user_data_dir, readonly=False)  # r/w to the local 'user data' directory
-        self.story.init(self)
-        if "zones" in sys.modules:
-            # slight hack to cope with scenario of multiple unit tests that may load different zones after each other
-            import imp
-            imp.reload(sys.modules["zones"])
-        import zones
-        self.zones = zones
-        self.config.startlocation_player = self.__lookup_location(self.config.startlocation_player)
-        self.config.startlocation_wizard = self.__lookup_location(self.config.startlocation_wizard)
+        self.user_resources = vfs.VirtualFileSystem(root_path=user_data_dir, readonly=False, cache_size=1024 * 1024)  # r/w to the local 'user data' directory
+        self.board_storage = BoardStorage(self.user_resources, self.io_executor)
+        self.__phase_done("configuration")
+        if args.snapshot:
+            if self.config.server_mode != "mud":
+                raise ValueError("a world snapshot can only be used in 'mud' mode")
+            self.story.init_snapshot(self)
+            world = self.__load_world_snapshot()
+            self.config.startlocation_player = world["startlocation_player"]
+            self.config.startlocation_wizard = world["startlocation_wizard"]
+        else:
+            self.story.init(self)
+            if stale_zones:
+                # slight hack to cope with scenario of multiple unit tests that may load different zones after each other
+                import imp
+                imp.reload(sys.modules["zones"])
+            import zones
+            self.zones = zones
+            self.config.startlocation_player = self.__lookup_location(self.config.startlocation_player)
+            self.config.startlocation_wizard = self.__lookup_location(self.config.startlocation_wizard)
         if self.config.server_tick_method == "command":
             # If the server tick is synchronized with player commands, this factor needs to be 1,
             # because at every command entered the game time simply advances 1 x server_tick_time.
             self.config.gametime_to_realtime = 1
         assert self.config.server_tick_time > 0
         assert self.config.max_wait_hours >= 0
-        self.game_clock = util.GameDateTime(self.config.epoch or self.server_started, self.config.gametime_to_realtime)
+        if args.snapshot:
+            self.deferreds = world["deferreds"]
+            heapq.heapify(self.deferreds)
+            self.heartbeat_objects = world["heartbeats"]
+            self.game_clock = world["clock"]
+        else:
+            self.game_clock = util.GameDateTime(self.config.epoch or self.server_started, self.config.gametime_to_realtime)
+        self.__phase_done("world snapshot" if args.snapshot else "zones")
         # convert textual exit strings to actual exit object bindings
-        for x in self.unbound_exits:
-            x._bind_target(self.zones)
-        del self.unbound_exits
+        self.bind_exits()
+        self.__phase_done("exit binding")
         if args.verify:
+            from . import verify
             print("Story: '%s' v%s, by %s." % (self.story.name, self.story.version, self.story.author))
+            num_errors = verify.print_report(self, verify.verify_world(self))
+            if num_errors:
+                raise SystemExit("Verification failed: %d errors." % num_errors)
             print("Verified, all seems to be fine.")
             return
         if args.delay < 0 or args.delay > 100:
@@ -195,15 +244,29 @@ class Driver(pubsub.Listener):
         else:
             # mud mode: driver runs as main thread, wsgi webserver runs in background thread
             base._limbo.init_inventory([LimboReaper()])  # add the grim reaper to Limbo
-            self.mud_accounts = player.MudAccounts()
-            from .tio.mud_browser_io import TaleMudWsgiApp
-            wsgi_server = TaleMudWsgiApp.create_app_server(self)
-            wsgi_thread = threading.Thread(name="wsgi", target=wsgi_server.serve_forever)
-            wsgi_thread.daemon = True
-            wsgi_thread.start()
-            self.__print_game_intro(None)
-            print("Web server url:   http://%s:%d/tale/" % wsgi_server.server_address, end="\n\n")
+            self.mud_accounts = None if self.shard else player.MudAccounts()   # in the sharded mode, the front handles the accounts
+            if args.shards:
+                # sharded mode: this is the front process, the world is played in the worker processes
+                from .shard import ShardFront
+                self.shard_front = ShardFront(game_path, args.shards)
+                self.shard_front.start()
+                print("Running the game world in %d worker processes." % args.shards)
+            else:
+                # (in the sharded mode, the workers store the player state)
+                self.player_store = player.MudPlayerStore(self.user_resources.validate_path("playerstate.sqlite"))
+            if self.shard:
+                # the front process has the player connections, it talks to this worker process via queues
+                self.shard.start()
+            else:
+                from .tio.mud_browser_io import TaleMudWsgiApp
+                wsgi_server = TaleMudWsgiApp.create_app_server(self)
+                wsgi_thread = threading.Thread(name="wsgi", target=wsgi_server.serve_forever)
+                wsgi_thread.daemon = True
+                wsgi_thread.start()
+                self.__print_game_intro(None)
+                print("Web server url:   http://%s:%d/tale/" % wsgi_server.server_address, end="\n\n")
             self.__startup_main_loop(None)
+            self.__close_player_store()
 
     def __startup_main_loop(self, conn):
         # Kick off the appropriate driver main event loop.
@@ -290,7 +353,13 @@ class Driver(pubsub.Listener):
         else:
             raise TypeError("connection or player object expected")
         assert self.all_players[name] is conn
+        if self.shard_front and name in self.shard_front.shards:
+            self.shard_front.disconnect(name)   # the player is in one of the worker processes
         conn.player.tell_others("{Title} suddenly shimmers and fades from sight. %s left the game." % lang.capital(conn.player.subjective))
+        if self.shard:
+            self.shard.player_left(name)
+        if self.player_store:
+            self.player_store.save(conn.player, logout=True)
         del self.all_players[name]
         conn.write_output()
         self.defer(1, conn.destroy)     # wait a little to allow the player's screen to display the last goodbye message before killing the connection
@@ -314,7 +383,7 @@ class Driver(pubsub.Listener):
                 continue
             else:
                 break
-        self.mud_accounts.create(name, password, email, gender[0], Stats.from_race(race), privileges={"wizard"})
+        yield "async", lambda: self.mud_accounts.create(name, password, email, gender[0], Stats.from_race(race), privileges={"wizard"})
         conn.output("\n")
         conn.output("\n")
         topic_async_dialogs.send((conn, self.__login_dialog_mud(conn)))   # continue with the normal login dialog
@@ -328,6 +397,9 @@ class Driver(pubsub.Listener):
         while True:
             name = yield "input-noecho", ("Please type in your player name.", player.MudAccounts.accept_name)
             existing_player = self.search_player(name)
+            if existing_player and self.shard_front:
+                conn.player.tell("That player is already logged in.")
+                continue
             if existing_player:
                 conn.player.tell("That player is already logged in elsewhere. Their current location is", existing_player.location.name)
                 conn.player.tell("and their idle time is %d seconds." % existing_player.idle_time)
@@ -338,7 +410,7 @@ class Driver(pubsub.Listener):
                     conn.player.tell("Okay, leaving them in peace.")
                     continue
             try:
-                self.mud_accounts.get(name)
+                yield "async", lambda: self.mud_accounts.get(name)
                 password = yield "input-noecho", "Please type in your password."
             except KeyError:
                 conn.player.tell("'<player>%s</>' is the name of a new character." % name)
@@ -360,11 +432,12 @@ class Driver(pubsub.Listener):
                     # abort
                     conn.player.tell("Ok, let's get back to the beginning then.", end=True)
                     continue
-                account = self.mud_accounts.create(name, password, email, gender[0], Stats.from_race(race))
+                account = yield "async", lambda: self.mud_accounts.create(name, password, email, gender[0], Stats.from_race(race))
                 conn.player.tell("\n<bright>Your new account has been created!</>  It will now be used to log in.", end=True)
                 conn.player.tell("\n")
             try:
-                self.mud_accounts.valid_password(name, password)
+                # password hashing is slow (on purpose), so it is done in a worker thread
+                yield "async", lambda: self.mud_accounts.valid_password(name, password)
             except ValueError as x:
                 conn.output("<it>%s</it>" % x)
                 continue
@@ -387,12 +460,12 @@ class Driver(pubsub.Listener):
                     name_info.gender = state["gender"]
                     name_info.stats = state["stats"]
                     self.__rename_player(conn.player, name_info)
+                    self.player_store.restore(conn.player, None)   # the state has been taken over already
                     conn.output("\n")
                     conn.player.move(existing_player_location)
                     break
                 # get the account and log in
-                account = self.mud_accounts.get(name)
-                self.mud_accounts.logged_in(name)
+                account = yield "async", lambda: self.__log_in_account(name)
                 if account["logged_in"]:
                     conn.output("Last login: " + account["logged_in"])
                 break
@@ -405,6 +478,15 @@ class Driver(pubsub.Listener):
             name_info.stats = account["stats"]
             self.__rename_player(conn.player, name_info)
             conn.player.privileges = set(account["privileges"])
+            if self.shard_front:
+                # sharded mode: the player enters the world in one of the worker processes
+                conn.output("\n")
+                motd = yield "async", self.read_motd
+                self.show_motd(conn.player, motd, True)
+                self.shard_front.connect(conn.player.name, conn.player.gender, conn.player.stats.race, "wizard" in conn.player.privileges)
+                return
+            saved_state = yield "async", lambda: self.player_store.load(name_info.name)
+            self.player_store.restore(conn.player, saved_state)
             conn.output("\n")
             if "wizard" in conn.player.privileges:
                 conn.player.move(self.config.startlocation_wizard)
@@ -415,23 +497,38 @@ class Driver(pubsub.Listener):
             yield "input", "\n" + prompt
         self.story.init_player(conn.player)
         conn.output("\n")
-        self.show_motd(conn.player, True)
+        motd = yield "async", self.read_motd
+        self.show_motd(conn.player, motd, True)
         conn.player.look(short=False)  # force a 'look' command to get our bearings
         # after this, the generator (dialog) ends and we drop down into the regular command loop
 
+    def __log_in_account(self, name):
+        account = self.mud_accounts.get(name)
+        self.mud_accounts.logged_in(name)
+        return account   # (with the time of the previous login)
+
     def _stop_driver(self):
         """
         Stop the driver mainloop in an orderly fashion.
         Flushes any pending output to the players, then closes down.
         """
         self.__stop_mainloop = True
+        self.__close_player_store()
         for conn in self.all_players.values():
             conn.write_output()
             conn.destroy()
         self.all_players.clear()
+        if self.shard_front:
+            self.shard_front.stop()
+        self.io_executor.shutdown()   # finishes the pending writes
         time.sleep(0.1)
 
-    def __continue_dialog(self, conn, dialog, message):
+    def __close_player_store(self):
+        if self.player_store:
+            self.player_store.close()   # saves all players that are still logged in
+            self.player_store = None
+
+    def __continue_dialog(self, conn, dialog, message, exception=None):
         # Notice that the try...except structure is very similar to
         # the one in __server_loop_process_player_input
         # That's no surprise because also in this async case, we need
@@ -439,7 +536,10 @@ class Driver(pubsub.Listener):
         # generator. The reguar player input function has to deal with
         # them as well, caused by normal player commands.
         try:
-            why, what = dialog.send(message)
+            if exception:
+                why, what = dialog.throw(exception)   # the async call failed, raise the error in the dialog
+            else:
+                why, what = dialog.send(message)
         except StopIteration:
             if conn.player:
                 conn.write_output()   # immediately give feedback (if any) once the dialog ends
@@ -464,9 +564,42 @@ class Driver(pubsub.Listener):
                 assert conn not in self.waiting_for_input, "can only run one async dialog at the same time"
                 conn.io.dont_echo_next_cmd = why == "input-noecho"  # this avoids echoing of the password
                 self.waiting_for_input[conn] = (dialog, validator, why != "input-noecho")
+            elif why == "async":
+                self.__call_async(conn, dialog, what)
             else:
                 raise ValueError("invalid generator wait reason: " + why)
 
+    def __call_async(self, conn, dialog, func):
+        """
+        Runs a blocking callable for a dialog (yield "async", callable) and continues
+        the dialog with its result (or raises its exception in the dialog).
+        In mud mode the call is done by the i/o executor so it doesn't stall the server tick.
+        """
+        assert callable(func)
+        if self.config.server_mode != "mud":
+            # single player mode: nobody else is waiting for the game to continue, just call it directly
+            try:
+                result = func()
+            except Exception as x:
+                self.__continue_dialog(conn, dialog, None, x)
+            else:
+                self.__continue_dialog(conn, dialog, result)
+            return
+
+        def continue_dialog(result, exception):
+            # called in the driver thread (see __main_loop_multiplayer)
+            self.waiting_for_async.discard(conn)
+            if conn.player:
+                try:
+                    self.__continue_dialog(conn, dialog, result, exception)
+                except Exception:
+                    tb = "".join(util.formatTraceback())
+                    txt = "\n<bright><rev>* internal error (please report this):</>\n" + tb
+                    conn.player.tell(txt, format=False)
+                    conn.player.tell("<rev><it>Please report this problem.</>")
+        self.waiting_for_async.add(conn)
+        self.io_executor.submit(func, callback=continue_dialog)
+
     def __print_game_intro(self, player_connection):
         try:
             # print game banner as supplied by the game
@@ -584,6 +717,7 @@ class Driver(pubsub.Listener):
         previous_server_tick = 0
         while not self.__stop_mainloop:
             pubsub.sync("driver-async-dialogs")
+            self.io_executor.run_callbacks()
             if conn not in self.waiting_for_input:
                 conn.write_input_prompt()
             if self.config.server_tick_method == "command":
@@ -631,6 +765,8 @@ class Driver(pubsub.Listener):
                     conn.player.tell("<rev><it>Please report this problem.</>")
             # sync pubsub events
             pubsub.sync("driver-pending-tells")
+            if self.shard:
+                self.shard.handoff_players()
             # server TICK
             now = time.time()
             if now - previous_server_tick >= self.config.server_tick_time:
@@ -643,6 +779,8 @@ class Driver(pubsub.Listener):
             # check if player reached the end of the story
             loop_duration = time.time() - loop_start
             self.server_loop_durations.append(loop_duration)
+            if self.profiler.enabled:
+                self.profiler.record("loop", loop_duration)
             if conn.player:
                 if conn.player.story_complete:
                     conn.player.tell("\n")
@@ -662,7 +800,19 @@ class Driver(pubsub.Listener):
                 continue
             try:
                 p.tell("\n")
-                self.__process_player_command(cmd, conn)
+                if self.player_store:
+                    self.player_store.mark_dirty(p)
+                stopwatch = self.profiler.stopwatch("command")
+                try:
+                    self.__process_player_command(cmd, conn)
+                finally:
+                    stopwatch.stop()
+                    if self.profiler.enabled:
+                        # also time it per verb (but not for garbage input, it would create too many timers)
+                        verb = cmd.partition(" ")[0]
+                        verb = cmds.abbreviations.get(verb, verb)
+                        if verb in soul.VERBS or verb in self.commands.get(p.privileges) or (p.location and verb in p.location.exits):
+                            stopwatch.stop("verb." + verb)
                 p.remember_parsed()
                 # to avoid flooding/abuse, we stop the loop after processing one command.
                 break
@@ -689,6 +839,10 @@ class Driver(pubsub.Listener):
         previous_server_tick = 0
         while not self.__stop_mainloop:
             pubsub.sync("driver-async-dialogs")
+            self.io_executor.run_callbacks()
+            if self.shard_front:
+                for name in self.shard_front.deliver_output(self.all_players):
+                    self._disconnect_mud_player(self.all_players[name])   # the player left the game in a worker process
             for conn in self.all_players.values():
                 conn.write_output()
                 if conn not in self.waiting_for_input:
@@ -697,16 +851,21 @@ class Driver(pubsub.Listener):
             # server tick goes on a timer
             wait_time = max(0.01, self.config.server_tick_time - loop_duration)
             while wait_time > 0:
-                if any(conn.player.input_is_available.is_set() for conn in self.all_players.values()):
+                if any(conn.player.input_is_available.is_set() and conn not in self.waiting_for_async for conn in self.all_players.values()):
                     # there was player input, abort the wait loop and deal with it
                     break
+                if self.io_executor.has_completed():
+                    break   # blocking work completed, for instance an async call of a dialog
+                if self.shard_front and self.shard_front.has_messages():
+                    break   # output of the worker processes
                 sub_wait = min(0.1, wait_time)  # keep things responsive
                 time.sleep(sub_wait)
                 wait_time -= sub_wait
 
             loop_start = time.time()
             for conn in list(self.all_players.values()):
-                if conn.player.input_is_available.is_set():
+                if conn.player.input_is_available.is_set() and conn not in self.waiting_for_async:
+                    # (input is left pending while the dialog is waiting for an async call to complete)
                     conn.need_new_input_prompt = True
                     try:
                         if conn in self.waiting_for_input:
@@ -738,6 +897,8 @@ class Driver(pubsub.Listener):
                         conn.player.tell(txt, format=False)
                         conn.player.tell("<rev><it>Please report this problem.</>")
             pubsub.sync("driver-pending-tells")
+            if self.shard:
+                self.shard.handoff_players()
             # server TICK
             now = time.time()
             if now - previous_server_tick >= self.config.server_tick_time:
@@ -745,6 +906,8 @@ class Driver(pubsub.Listener):
                 previous_server_tick = now
             loop_duration = time.time() - loop_start
             self.server_loop_durations.append(loop_duration)
+            if self.profiler.enabled:
+                self.profiler.record("loop", loop_duration)
 
     def __server_tick(self):
         """
@@ -757,10 +920,12 @@ class Driver(pubsub.Listener):
         6) verify validity and idle state of connected players
         7) remove idle wiretaps
         """
+        stopwatch = self.profiler.stopwatch("tick")
         self.game_clock.add_realtime(datetime.timedelta(seconds=self.config.server_tick_time))
         ctx = util.Context(self, self.game_clock, self.config, None)
         for obj in self.heartbeat_objects:
             obj.heartbeat(ctx)
+        stopwatch.lap("heartbeats")
         while self.deferreds:
             deferred = None
             with self.deferreds_lock:
@@ -777,7 +942,13 @@ class Driver(pubsub.Listener):
                     deferred(ctx=ctx)  # call the deferred and provide a context object
                 except Exception:
                     self.__report_deferred_exception(deferred)
+        stopwatch.lap("deferreds")
         pubsub.sync()
+        stopwatch.lap("pubsub")
+        if self.player_store:
+            self.player_store.save_dirty()
+            stopwatch.lap("player_store")
+        connected = []
         for name, conn in list(self.all_players.items()):
             if conn.player and conn.io and conn.player.location:
                 idle_limit = 3 * 60 * 60 if "wizard" in conn.player.privileges else 30 * 60
@@ -788,10 +959,14 @@ class Driver(pubsub.Listener):
                     conn.player.tell("\n")
                     conn.player.tell_others("{Title} has been idling around for too long.")
                     self._disconnect_mud_player(conn)   # remove players who stay idle too long
-                conn.write_output()
+                connected.append(conn)
             else:
                 # disconnect corrupt player connection
                 self._disconnect_mud_player(conn)
+        stopwatch.lap("idle_checks")
+        for conn in connected:
+            conn.write_output()
+        stopwatch.lap("output")
         # clean up idle wiretap topics
         topicinfo = pubsub.pending()
         for topicname in topicinfo:
@@ -799,6 +974,8 @@ class Driver(pubsub.Listener):
                 events, idle_time, subbers = topicinfo[topicname]
                 if events == 0 and not subbers and idle_time > 30:
                     pubsub.topic(topicname).destroy()
+        stopwatch.lap("wiretaps")
+        stopwatch.stop()
 
     def __report_deferred_exception(self, deferred):
         print("\n* Exception while executing deferred action {0}:".format(deferred), file=sys.stderr)
@@ -883,41 +1060,91 @@ class Driver(pubsub.Listener):
     def _go_through_exit(self, player, direction):
         xt = player.location.exits[direction]
         xt.allow_passage(player)
+        if self.shard and self.shard.leave_through_exit(player, xt):
+            return   # the exit leads to a zone of another shard, the player has been handed off to it
         player.move(xt.target)
         player.look()
 
-    def __lookup_location(self, location_name, only_module=False):
-        location = self.zones
-        modulename = "zones"
-        for name in location_name.split('.'):
-            if hasattr(location, name):
-                location = getattr(location, name)
+    def __lookup_location(self, location_name):
+        """Find a location by its name such as "town.square" (the square location in the zones.town module)"""
+        location = self.zone_locations.get(location_name)
+        if location is None:
+            zone_name = location_name.rpartition(".")[0]
+            if zone_name not in self.__zone_modules:
+                self.__load_zone_module(zone_name)
             else:
-                modulename = modulename + "." + name
-                try:
-                    imported_module = __import__(modulename)
-                    if only_module:
-                        return getattr(imported_module, name)
-                    location = getattr(location, name)
-                except (ImportError, AttributeError):
-                    raise ValueError("location not found: " + location_name)
+                self.register_zone(zone_name)   # it may have gotten new locations since it was loaded
+            location = self.zone_locations.get(location_name)
+            if location is None:
+                raise ValueError("location not found: " + location_name)
         return location
 
+    def __load_zone_module(self, zone_name):
+        modulename = "zones." + zone_name if zone_name else "zones"
+        try:
+            __import__(modulename)
+            module = sys.modules[modulename]
+        except ImportError:
+            module = None
+        self.__zone_modules[zone_name] = module
+        if module:
+            self.register_zone(zone_name)
+        return module
+
+    def register_zone(self, zone_name):
+        """Add the locations defined in the (loaded) zone module to the location registry"""
+        module = self.__zone_modules.get(zone_name)
+        if module:
+            prefix = zone_name + "." if zone_name else ""
+            for name, value in vars(module).items():
+                if isinstance(value, base.Location):
+                    self.zone_locations[prefix + name] = value
+
+    def bind_exits(self):
+        """
+        Bind all exits that were created with a location name as target, to the actual location.
+        Reports all targets that can't be found at once, rather than only the first.
+        """
+        unresolved = collections.defaultdict(list)
+        for exit in self.unbound_exits:
+            if not exit.bound:
+                try:
+                    exit._set_target(self.__lookup_location(exit.target))
+                except ValueError:
+                    unresolved[exit.target].append(exit)
+        self.unbound_exits = []
+        if unresolved:
+            raise errors.LocationIntegrityError("cannot find exit targets: " +
+                                                "; ".join("%s (exit: %s)" % (target, ", ".join("'%s'" % exit.short_description for exit in exits))
+                                                          for target, exits in sorted(unresolved.items())), None, None, None)
+
     def load_zones(self, zone_names):
         """Pre-load the provided zones (essentially, load the named modules from the zones package"""
         for zone in zone_names:
-            module = self.__lookup_location(zone, only_module=True)
+            module = self.__load_zone_module(zone)
+            if module is None:
+                raise ValueError("zone not found: " + zone)
             module.init(self)
+            self.register_zone(zone)   # init may have created more locations
 
     def __load_saved_game(self, player):
         assert self.config.server_mode == "if", "games can only be loaded in single player 'if' mode"
         assert len(self.all_players) == 1
         conn = list(self.all_players.values())[0]
         try:
-            savegame = self.user_resources[util.storyname_to_filename(self.config.name) + ".savegame"].data
-            state = pickle.loads(savegame)
-            del savegame
-        except (pickle.PickleError, ValueError, TypeError) as x:
+            savegame = self.user_resources.open_read(util.storyname_to_filename(self.config.name) + ".savegame")
+            with savegames.SavegameReader(savegame) as savegame:
+                # check the version in the header before loading the rest of the data
+                if savegame.game_version != self.config.version:
+                    player.tell("This saved game data was from a different version of the game and cannot be used.")
+                    player.tell("(Current game version: %s  Saved game data version: %s)" % (self.config.version, savegame.game_version))
+                    player.tell("\n")
+                    return None
+                state = savegame.load()
+        except savegames.SavegameFormatError as x:
+            player.tell("The saved game data cannot be used: %s." % x, end=True)
+            return None
+        except (pickle.PickleError, ValueError, TypeError, EOFError) as x:
             print("There was a problem loading the saved game data:")
             print(type(x).__name__, x)
             self._stop_driver()
@@ -926,11 +1153,6 @@ class Driver(pubsub.Listener):
             player.tell("No saved game data found.", end=True)
             return None
         else:
-            if state["version"] != self.config.version:
-                player.tell("This saved game data was from a different version of the game and cannot be used.")
-                player.tell("(Current game version: %s  Saved game data version: %s)" % (self.config.version, state["version"]))
-                player.tell("\n")
-                return None
             # Because loading a complete saved game is strictly for single player 'if' mode,
             # we load a new player and simply replace all players with this one.
             player = state["player"]
@@ -947,6 +1169,42 @@ class Driver(pubsub.Listener):
             player.tell("\n")
             return player
 
+    def __snapshot_path(self):
+        return self.user_resources.validate_path(util.storyname_to_filename(self.config.name) + ".snapshot")
+
+    def __load_world_snapshot(self):
+        start = time.time()
+        snapshot = self.user_resources.open_read(util.storyname_to_filename(self.config.name) + ".snapshot")
+        with savegames.SavegameReader(snapshot) as snapshot:
+            if snapshot.game_version != self.config.version:
+                raise ValueError("world snapshot is from a different version of the game (%s)" % snapshot.game_version)
+            world = savegames.load_world_snapshot(snapshot)
+        print("World restored from snapshot in %.2f seconds." % (time.time() - start))
+        return world
+
+    def save_snapshot(self):
+        """
+        Write a snapshot of the whole game world (mud mode) to the user data directory.
+        It contains all locations, npcs, items, deferreds and the game clock, but no players.
+        The server can quickly restore the world from it when it is started with --snapshot.
+        Returns the number of locations and the time it took.
+        """
+        assert self.config.server_mode == "mud", "snapshots are only for 'mud' mode"
+        players = set(conn.player for conn in self.all_players.values())
+        owners = players | set(self.all_players.values())
+        with self.deferreds_lock:
+            deferreds = [d for d in self.deferreds if d.owner not in owners]
+        world = {
+            "deferreds": deferreds,
+            "clock": self.game_clock,
+            "heartbeats": set(obj for obj in self.heartbeat_objects if obj not in players and getattr(obj, "location", None) is not base._limbo),
+            "startlocation_player": self.config.startlocation_player,
+            "startlocation_wizard": self.config.startlocation_wizard
+        }
+        start = time.time()
+        num_locations = savegames.write_world_snapshot(self.__snapshot_path(), self.config.version, world)
+        return num_locations, time.time() - start
+
     def current_custom_verbs(self, player):
         """returns dict of the currently recognised custom verbs (verb->helptext mapping)"""
         verbs = player.verbs.copy()
@@ -968,13 +1226,15 @@ class Driver(pubsub.Listener):
         verbs.update(self.current_custom_verbs(player))
         return verbs
 
-    def show_motd(self, player, notify_no_motd=False):
-        """Prints the Message-Of-The-Day file, if present. Does nothing in IF mode."""
+    def read_motd(self):
+        """Reads the Message-Of-The-Day file (blocking, use it as async call in a dialog). None if there's no motd."""
         try:
-            motd = self.resources["messages/motd.txt"]
-            message = motd.data.rstrip()
+            return self.resources["messages/motd.txt"].data.rstrip() or None
         except IOError:
-            message = None
+            return None
+
+    def show_motd(self, player, message, notify_no_motd=False):
+        """Prints the Message-Of-The-Day (see read_motd)."""
         if message:
             player.tell("<bright>Message-of-the-day:</>", end=True)
             player.tell("\n")
@@ -993,10 +1253,21 @@ class Driver(pubsub.Listener):
         conn = self.all_players.get(name)
         return conn.player if conn else None
 
+    def find_path(self, source, target, heuristic=None):
+        """
+        Returns the shortest route between two locations, as a list of the exits to take,
+        or None if there is no way to get there. See pathfinding.ExitGraph.find_path.
+        """
+        return self.exit_graph.find_path(source, target, heuristic)
+
     def do_wait(self, duration):
-        # let time pass, duration is in game time (not real time).
-        # We do let the game tick for the correct number of times.
-        # @todo be able to detect if something happened during the wait
+        """
+        Let time pass, duration is in game time (not real time).
+        The game ticks for the correct number of times, but ticks in which nothing can happen are skipped:
+        the clock is advanced directly to the next due deferred, unless there are heartbeat objects
+        that aren't skippable. The wait stops as soon as the player gets to see something.
+        Returns (True, None) if the wait was uneventful, otherwise (False, message).
+        """
         assert self.config.server_mode == "if"
         if self.config.gametime_to_realtime == 0:
             # game is running with a 'frozen' clock
@@ -1004,12 +1275,42 @@ class Driver(pubsub.Listener):
             self.game_clock.add_gametime(duration)
             self.__server_tick()
             return True, None      # uneventful
-        num_ticks = int(duration.seconds / self.config.gametime_to_realtime / self.config.server_tick_time)
+        num_ticks = int(duration.total_seconds() / self.config.gametime_to_realtime / self.config.server_tick_time)
         if num_ticks < 1:
             return False, "It's no use waiting such a short while."
-        for _ in range(num_ticks):
+        tick_duration = datetime.timedelta(seconds=self.config.server_tick_time) * self.game_clock.times_realtime
+        lines_written = self.__lines_written()
+        ticks_done = 0
+        while ticks_done < num_ticks:
+            skip = self.__skippable_ticks(num_ticks - ticks_done - 1, tick_duration)
+            if skip:
+                self.game_clock.add_gametime(tick_duration * skip)
+                ctx = util.Context(self, self.game_clock, self.config, None)
+                for obj in self.heartbeat_objects:
+                    obj.skip_heartbeats(ctx, skip)
+                ticks_done += skip
             self.__server_tick()
-        return True, None     # wait was uneventful. (@todo return False if something happened)
+            ticks_done += 1
+            if self.__lines_written() != lines_written:
+                # something happened
+                if ticks_done < num_ticks:
+                    return False, "You stop waiting after %s." % util.duration_display(tick_duration * ticks_done)
+                return False, "Time passes. You've waited %s." % util.duration_display(duration)
+        return True, None
+
+    def __skippable_ticks(self, max_ticks, tick_duration):
+        # how many ticks can be skipped without missing anything (the tick after those has to be done normally)
+        if max_ticks <= 0 or not all(obj.heartbeat_skippable for obj in self.heartbeat_objects):
+            return 0
+        with self.deferreds_lock:
+            if not self.deferreds:
+                return max_ticks
+            due = self.deferreds[0].due
+        ticks_until_due = int(math.ceil((due - self.game_clock.clock).total_seconds() / tick_duration.total_seconds()))
+        return max(0, min(max_ticks, ticks_until_due - 1))
+
+    def __lines_written(self):
+        return sum(conn.player._output.lines_written for conn in self.all_players.values() if conn.player)
 
     def do_save(self, player):
         if not self.config.savegames_enabled:
@@ -1023,8 +1324,8 @@ class Driver(pubsub.Listener):
             "heartbeats": self.heartbeat_objects,
             "config": self.config
         }
-        savedata = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
-        self.user_resources[util.storyname_to_filename(self.config.name) + ".savegame"] = savedata
+        savegame_path = self.user_resources.validate_path(util.storyname_to_filename(self.config.name) + ".savegame")
+        savegames.write_savegame(savegame_path, self.config.version, state)   # streams to disk, doesn't build it in memory first
         player.tell("Game saved.")
         if self.config.display_gametime:
             player.tell("Game time:", self.game_clock)
@@ -1219,6 +1520,7 @@ class Commands(object):
 @base.heartbeat
 class LimboReaper(npc.NPC):
     """The Grim Reaper hangs about in Limbo, and makes sure no one stays there for too long."""
+    heartbeat_skippable = True   # it uses real time, which doesn't pass when the game time is fast forwarded
     def __init__(self):
         super(LimboReaper, self).__init__(
             "reaper", "m", "elemental", "Grim Reaper",
@@ -0,0 +1,101 @@
+# coding=utf-8
+"""
+Worker threads for blocking work (mostly disk i/o), so that it doesn't hold up the driver thread
+and the server tick. The driver has one (driver.io_executor). Dialogs use it via yield "async", callable.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import sys
+import threading
+from . import util
+from .util import queue
+
+__all__ = ["IoExecutor"]
+
+
+class IoExecutor(object):
+    """
+    Runs callables in a small pool of worker threads (they're started when the first work is submitted).
+    Work that is submitted with the same key is done in order, by the same thread: use the file name as key
+    for writes to the same file. The callbacks that get the results are called in the driver thread (run_callbacks).
+    """
+    def __init__(self, num_threads=4):
+        self.num_threads = num_threads
+        self.work_queues = []
+        self.threads = []
+        self.completed = queue.Queue()   # (callback, result, exception)
+        self.lock = threading.Lock()
+
+    def submit(self, func, key=None, callback=None):
+        """
+        Call func in a worker thread. If a callback is given, it is called with (result, exception)
+        once the call completed. If there's no callback, exceptions are reported on stderr.
+        """
+        assert callable(func)
+        with self.lock:
+            if not self.threads:
+                self.__start_threads()
+            if key is None:
+                work_queue = min(self.work_queues, key=lambda q: q.unfinished_tasks)   # (includes the work in progress)
+            else:
+                work_queue = self.work_queues[hash(key) % self.num_threads]
+            work_queue.put((func, callback))
+
+    def __start_threads(self):
+        for num in range(self.num_threads):
+            work_queue = queue.Queue()
+            thread = threading.Thread(name="io-worker-%d" % num, target=self.__work, args=(work_queue,))
+            thread.daemon = True
+            thread.start()
+            self.work_queues.append(work_queue)
+            self.threads.append(thread)
+
+    def __work(self, work_queue):
+        while True:
+            work = work_queue.get()
+            if work is None:
+                work_queue.task_done()
+                return
+            func, callback = work
+            try:
+                result, exception = func(), None
+            except Exception as x:
+                result, exception = None, x
+                if not callback:
+                    print("\n* Exception in i/o worker thread:", file=sys.stderr)
+                    print("".join(util.formatTraceback()), file=sys.stderr)
+                    print("(Please report this problem)", file=sys.stderr)
+            if callback:
+                self.completed.put((callback, result, exception))
+            work_queue.task_done()
+
+    def has_completed(self):
+        """is there completed work of which the callback hasn't been called yet?"""
+        return not self.completed.empty()
+
+    def run_callbacks(self):
+        """Calls the callbacks of the completed work. Call this from the driver thread."""
+        while True:
+            try:
+                callback, result, exception = self.completed.get_nowait()
+            except queue.Empty:
+                return
+            callback(result, exception)
+
+    def flush(self):
+        """Blocks until all submitted work has been done (the callbacks aren't called)"""
+        for work_queue in self.work_queues:
+            work_queue.join()
+
+    def shutdown(self):
+        """Finishes the submitted work, and stops the worker threads"""
+        with self.lock:
+            for work_queue in self.work_queues:
+                work_queue.put(None)
+            for thread in self.threads:
+                thread.join()
+            self.work_queues = []
+            self.threads = []
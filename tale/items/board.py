@@ -1,6 +1,6 @@
 # coding=utf-8
 """
-Bulletin boards.
+Bulletin boards, and the storage of their messages.
 
 'Tale' mud driver, mudlib and interactive fiction framework
 Copyright by Irmen de Jong (irmen@razorvine.net)
@@ -10,16 +10,144 @@ from __future__ import absolute_import, print_function, division, unicode_litera
 from ..base import Item
 from ..errors import ActionRefused, ParseError, AsyncDialog
 from .. import lang, mud_context
+import os
 import json
 import datetime
 
-__all__ = ["BulletinBoard", "bulletinboard"]
+__all__ = ["BulletinBoard", "bulletinboard", "BoardStorage"]
+
+
+class BoardStorage(object):
+    """
+    Keeps the messages of the bulletin boards, one in-memory copy per storage file (boards that
+    use the same file share their messages). A change is appended to a journal file next to the
+    storage file, and every so often the storage file is rewritten and the journal is cleared.
+    The files are written by the driver's i/o executor. The driver has one (driver.board_storage).
+    """
+    compact_after = 50    # number of journaled changes after which the storage file is rewritten
+
+    class _Stored(object):
+        def __init__(self, posts, seq, name, title):
+            self.posts = posts
+            self.seq = seq          # sequence number of the last change
+            self.snapshot_seq = seq   # sequence number of the last change that's in the storage file
+            self.name = name
+            self.title = title
+            self.damaged = False    # the files were damaged (by a crash), they must be rewritten
+
+    def __init__(self, resources, executor):
+        self.resources = resources
+        self.executor = executor
+        self.boards = {}    # storage file -> _Stored
+
+    def posts(self, board):
+        """The (shared) list of posts of the board's storage file. Loaded on first use; the board's own posts are the default."""
+        stored = self.boards.get(board.storage_file)
+        if stored is None:
+            stored = self.boards[board.storage_file] = self._load(board)
+            if stored.damaged:
+                self.compact(board.storage_file)
+        return stored.posts
+
+    def _load(self, board):
+        try:
+            data = json.loads(self.resources[board.storage_file].data.decode("UTF-8"))
+            stored = self._Stored(data["posts"], data.get("journal-seq", 0), data.get("board-name", board.name), data.get("board-title", board.title))
+        except IOError:
+            stored = self._Stored(list(board._posts), 0, board.name, board.title)
+        except (ValueError, KeyError):
+            # the storage file is corrupt; start from the board's own posts and replay what's in the journal
+            stored = self._Stored(list(board._posts), 0, board.name, board.title)
+            stored.damaged = True
+        try:
+            journal = self.resources[board.storage_file + ".journal"].data
+        except IOError:
+            return stored
+        for line in journal.decode("UTF-8").splitlines():
+            try:
+                change = json.loads(line)
+            except ValueError:
+                # the last line got cut off, the journal is rewritten without it (new changes would be appended to it)
+                stored.damaged = True
+                break
+            if change["seq"] > stored.seq:
+                self.apply(stored.posts, change)
+                stored.seq = change["seq"]
+        return stored
+
+    @staticmethod
+    def apply(posts, change):
+        if "post" in change:
+            posts.insert(0, change["post"])
+            del posts[change["keep"]:]
+        elif "remove" in change:
+            del posts[change["remove"]]
+
+    def change(self, board, change):
+        """Apply a change ({"post": post, "keep": max_num_posts} or {"remove": index}) to the board's posts, and journal it."""
+        self.posts(board)
+        stored = self.boards[board.storage_file]
+        self.apply(stored.posts, change)
+        stored.seq += 1
+        change["seq"] = stored.seq
+        line = (json.dumps(change, sort_keys=True) + "\n").encode("UTF-8")
+        resources, journal = self.resources, board.storage_file + ".journal"
+
+        def append():
+            with resources.open_write(journal, append=True) as f:
+                f.write(line)
+        self.executor.submit(append, key=board.storage_file)
+        if stored.seq - stored.snapshot_seq >= self.compact_after:
+            self.compact(board.storage_file)
+
+    def replace(self, board, posts):
+        """Replace all posts of the board's storage file (the storage file is rewritten)"""
+        self.posts(board)
+        stored = self.boards[board.storage_file]
+        stored.posts[:] = posts
+        stored.seq += 1
+        self.compact(board.storage_file)
+
+    def compact(self, storage_file):
+        """Rewrite the storage file with the current posts, and clear the journal"""
+        stored = self.boards[storage_file]
+        data = {
+            "board-name": stored.name,
+            "board-title": stored.title,
+            "journal-seq": stored.seq,
+            "posts": stored.posts
+        }
+        data = json.dumps(data, sort_keys=True).encode("UTF-8")
+        stored.snapshot_seq = stored.seq
+        resources = self.resources
+
+        def write():
+            # write a temporary file first, so that a crash never leaves a half written storage file
+            temp_file = storage_file + ".tmp"
+            with resources.open_write(temp_file) as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            temp_path, path = resources.validate_path(temp_file), resources.validate_path(storage_file)
+            if hasattr(os, "replace"):
+                os.replace(temp_path, path)
+            else:
+                # python 2 has no atomic replace; on windows rename fails if the target exists
+                if os.name == "nt" and os.path.exists(path):
+                    os.remove(path)
+                os.rename(temp_path, path)
+            resources.invalidate(storage_file)
+            try:
+                del resources[storage_file + ".journal"]
+            except OSError:
+                pass    # there was no journal
+        self.executor.submit(write, key=storage_file)
 
 
 class BulletinBoard(Item):
     def init(self):
         super(BulletinBoard, self).init()
-        self.posts = []
+        self._posts = []
         self.max_num_posts = 20
         self.readonly = False
         self.storage_file = None
@@ -31,6 +159,19 @@ class BulletinBoard(Item):
             "reply": "Write a reply to a message already on the board (indicate the number of the message).",
             "remove": "Remove a message that you wrote earlier (indicate the number of the message)."}
 
+    @property
+    def posts(self):
+        storage = mud_context.driver.board_storage if self.storage_file else None
+        return storage.posts(self) if storage else self._posts
+
+    @posts.setter
+    def posts(self, posts):
+        storage = mud_context.driver.board_storage if self.storage_file else None
+        if storage:
+            storage.replace(self, posts)
+        else:
+            self._posts = posts
+
     def allow_item_move(self, actor, verb="move"):
         raise ActionRefused("You can't %s %s." % (verb, self.title))
 
@@ -151,9 +292,7 @@ class BulletinBoard(Item):
                     "subject": subject,
                     "text": text
                 }
-                self.posts.insert(0, post)
-                self.posts = self.posts[:self.max_num_posts]
-                self.save()
+                self._change({"post": post, "keep": self.max_num_posts})
                 actor.tell("\n")
                 actor.tell("You've added the message on top of the list on the %s." % self.name)
                 return
@@ -177,10 +316,9 @@ class BulletinBoard(Item):
             raise ActionRefused("You can't remove messages from it.")
         num, post = self._get_post(arg)
         if "wizard" in actor.privileges or actor.name == post["author"]:
-            del self.posts[num - 1]
+            self._change({"remove": num - 1})
             actor.tell("You've removed message #%d ('%s') from the board." % (num, post["subject"]))
             actor.tell_others("{Title} took a message off the %s." % self.title)
-            self.save()
         else:
             raise ActionRefused("You cannot remove that message.")
 
@@ -191,26 +329,25 @@ class BulletinBoard(Item):
         for paragraph in post["text"].split("\n\n"):
             actor.tell(paragraph, end=True)
 
+    def _change(self, change):
+        storage = mud_context.driver.board_storage if self.storage_file else None
+        if storage:
+            storage.change(self, change)
+        else:
+            BoardStorage.apply(self._posts, change)
+
     def load(self):
-        """Load persisted messages from the datafile. Note: only the posts are loaded from the datafile, not the descriptive texts"""
-        if not self.storage_file:
-            return
-        try:
-            data = json.loads(mud_context.driver.user_resources[self.storage_file].data.decode("UTF-8"))
-            self.posts = data["posts"][:self.max_num_posts]
-        except IOError:
-            pass
+        """
+        Load the persisted messages (only the posts, not the descriptive texts). Boards with the same storage
+        file share their messages. The posts that the board already has are used if nothing has been stored yet.
+        """
+        if self.storage_file and mud_context.driver.board_storage:
+            del self.posts[self.max_num_posts:]
 
     def save(self):
-        """save the messages to persistent data file"""
-        if not self.storage_file:
-            return
-        data = {
-            "board-name": self.name,
-            "board-title": self.title,
-            "posts": self.posts
-        }
-        mud_context.driver.user_resources[self.storage_file] = json.dumps(data, indent=4, sort_keys=True).encode("UTF-8")
+        """save all messages to the persistent data file (changes are saved automatically)"""
+        if self.storage_file and mud_context.driver.board_storage:
+            mud_context.driver.board_storage.compact(self.storage_file)
 
 
 bulletinboard = BulletinBoard("board", "wooden bulletin board", "The board contains a little plaque: \"important announcements\".",
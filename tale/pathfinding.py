@@ -0,0 +1,238 @@
+# coding=utf-8
+"""
+Exit graph of the game world, and path finding on it.
+
+The locations are the nodes of the graph (with an integer node id), the bound exits are the edges.
+Locations are added to the graph when they're first encountered by a search, so the graph only
+contains the part of the world that has actually been used for path finding.
+The driver keeps the graph up to date: exits that are bound to a location and doors
+that are opened or closed are reported to it.
+
+Locations can be grouped into zones (see ExitGraph.zone_of). For paths inside a zone, the shortest
+path trees from the source locations are cached (together they form the zone's all-pairs next-hop table),
+so repeated searches in the same zone are cheap.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import heapq
+from collections import deque
+from . import base
+
+__all__ = ["ExitGraph", "describe_direction"]
+
+
+def describe_direction(direction):
+    """Describe where a direction points to (as in: 'the sound is coming from ...'), or None if that's not possible"""
+    if direction in {"north", "east", "south", "west", "northeast", "northwest", "southeast",
+                     "southwest", "left", "right", "front", "back"}:
+        return "the " + direction
+    if direction in {"up", "above", "upstairs"}:
+        return "above"
+    if direction in {"down", "below", "downstairs"}:
+        return "below"
+    return None
+
+
+class ExitGraph(object):
+    """
+    Graph of all locations (nodes) and the exits between them (edges).
+    Closed doors are not passable. Exits that are not yet bound, or whose target
+    has not been built yet (target_built is False), are checked again every time they're needed.
+    """
+    max_zone_table_size = 1000   # zones with more locations than this don't get a cached next-hop table
+
+    def __init__(self):
+        self.locations = []      # node id -> Location
+        self.node_ids = {}       # Location -> node id
+        self.adjacency = []      # node id -> list of (target node id, exit)
+        self.zones = []          # node id -> zone key
+        self.incomplete = set()  # node ids whose exits have to be (re)scanned
+        self.exit_nodes = {}     # exit -> node id of the location that has the exit
+        self.zone_tables = {}    # zone key -> {source node id: shortest path tree from it (see search)}
+        self.return_directions = {}   # exit -> description of the way back from its target (see return_direction)
+
+    def zone_of(self, location):
+        """
+        The zone key for the location (any hashable). All locations are in the same zone by default,
+        a story can replace this with a function that knows about its own zones.
+        """
+        return None
+
+    def __len__(self):
+        return len(self.locations)
+
+    def node(self, location):
+        """The node id of the location (the location is added to the graph if it's new)"""
+        node = self.node_ids.get(location)
+        if node is None:
+            node = self.node_ids[location] = len(self.locations)
+            self.locations.append(location)
+            self.zones.append(self.zone_of(location))
+            self.adjacency.append([])
+            self.incomplete.add(node)   # its exits are scanned when they're first needed
+        return node
+
+    def neighbours(self, node):
+        """The (target node id, exit) pairs of the location with the given node id"""
+        if node in self.incomplete:
+            self.__scan_exits(node)
+        return self.adjacency[node]
+
+    def __scan_exits(self, node):
+        self.incomplete.discard(node)
+        edges = []
+        seen = set()
+        for exit in self.locations[node].exits.values():
+            if exit in seen:
+                continue   # the same exit is often present under several directions
+            seen.add(exit)
+            if not exit.bound or not exit.target_built:
+                self.incomplete.add(node)
+                continue
+            self.exit_nodes[exit] = node
+            edges.append((self.node(exit.target), exit))
+        self.adjacency[node] = edges
+
+    def location_changed(self, location):
+        """The exits of the location have changed"""
+        node = self.node_ids.get(location)
+        if node is not None:
+            self.__scan_exits(node)
+            self.zone_tables.pop(self.zones[node], None)
+            self.return_directions.clear()
+
+    def exit_changed(self, exit):
+        """The exit has changed (a door has been opened or closed)"""
+        node = self.exit_nodes.get(exit)
+        if node is not None:
+            self.zone_tables.pop(self.zones[node], None)
+
+    def nearby(self, source, radius):
+        """
+        Breadth first search over all exits (also through closed doors) up to the given number of steps.
+        Returns a list of (location, distance, exit) tuples for every location within that radius,
+        excluding the source location itself. The exit is the last one on the way to the location.
+        """
+        source = self.node(source)
+        found = []
+        distances = {source: 0}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            distance = distances[node] + 1
+            if distance > radius:
+                break
+            for next_node, exit in self.neighbours(node):
+                if next_node not in distances:
+                    distances[next_node] = distance
+                    found.append((self.locations[next_node], distance, exit))
+                    queue.append(next_node)
+        return found
+
+    def return_direction(self, exit):
+        """
+        Describes the direction of the way back from the exit's target location to where it came from
+        (for instance 'the south' or 'above'), or None if there's no obvious way back.
+        The result is cached per exit.
+        """
+        try:
+            return self.return_directions[exit]
+        except KeyError:
+            origin = self.locations[self.exit_nodes[exit]]
+            description = None
+            for direction, return_exit in exit.target.exits.items():
+                if return_exit.target is origin:
+                    description = describe_direction(direction)
+                    if description:
+                        break
+            self.return_directions[exit] = description
+            return description
+
+    @staticmethod
+    def passable(exit):
+        return exit.opened if isinstance(exit, base.Door) else True
+
+    def find_path(self, source, target, heuristic=None):
+        """
+        Returns the shortest route from the source to the target location as a list of exits,
+        or None if there is no route. If both are in the same zone, the route stays inside
+        that zone if possible (using the cached shortest path trees of the zone).
+        Otherwise, a breadth first search is done, or an A* search if you provide a heuristic function
+        that estimates the number of steps between two locations (it must never overestimate it).
+        """
+        source, target = self.node(source), self.node(target)
+        if source == target:
+            return []
+        zone = self.zones[source]
+        if heuristic is None and zone == self.zones[target]:
+            path = self.__zone_path(zone, source, target)
+            if path is not None:
+                return path
+        if heuristic:
+            return self.__astar(source, target, heuristic)
+        return self.__bfs(source, target)
+
+    def search(self, source, zone=None, target=None):
+        """
+        Breadth first search from the source node (only within the given zone, if not None).
+        Returns the shortest path tree: a dict from every reached node id to a (previous node id, exit) pair.
+        If a target node id is given, the search stops as soon as it is reached.
+        """
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            if node == target:
+                break
+            for next_node, exit in self.neighbours(node):
+                if next_node not in previous and self.passable(exit) and (zone is None or self.zones[next_node] == zone):
+                    previous[next_node] = (node, exit)
+                    queue.append(next_node)
+        return previous
+
+    def __zone_path(self, zone, source, target):
+        # use the zone's table of shortest path trees (one per source node, computed when it's first needed)
+        table = self.zone_tables.get(zone)
+        if table is None:
+            if self.zones.count(zone) > self.max_zone_table_size:
+                return None
+            table = self.zone_tables[zone] = {}
+        tree = table.get(source)
+        if tree is None:
+            tree = table[source] = self.search(source, zone)
+        if target in tree:
+            return self.__route(tree, target)
+        return None   # not reachable within the zone, maybe it is via another zone
+
+    def __bfs(self, source, target):
+        previous = self.search(source, target=target)
+        return self.__route(previous, target) if target in previous else None
+
+    def __astar(self, source, target, heuristic):
+        target_location = self.locations[target]
+        previous = {source: None}
+        distance = {source: 0}
+        queue = [(heuristic(self.locations[source], target_location), source)]
+        while queue:
+            _, node = heapq.heappop(queue)
+            if node == target:
+                return self.__route(previous, target)
+            for next_node, exit in self.neighbours(node):
+                steps = distance[node] + 1
+                if steps < distance.get(next_node, steps + 1) and self.passable(exit):
+                    distance[next_node] = steps
+                    previous[next_node] = (node, exit)
+                    heapq.heappush(queue, (steps + heuristic(self.locations[next_node], target_location), next_node))
+        return None
+
+    @staticmethod
+    def __route(previous, node):
+        route = []
+        while previous[node]:
+            node, exit = previous[node]
+            route.append(exit)
+        route.reverse()
+        return route
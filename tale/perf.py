@@ -0,0 +1,201 @@
+# coding=utf-8
+"""
+Performance instrumentation of the driver: timings of the phases of the server tick,
+of the main loop, and of the player commands (per verb).
+
+The durations are kept in fixed size ring buffers, from which percentiles are calculated
+when the statistics are requested (wizard 'perf' command, or the web interface's /tale/perf json).
+When profiling is disabled (the default) the driver gets a dummy stopwatch that does nothing.
+
+There's also a sampling profiler (wizard 'profile' command) that periodically looks at the stack
+of the driver thread from another thread, to find the hot spots of a running server.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import os
+import sys
+import time
+import collections
+import threading
+
+__all__ = ["Profiler", "Timings", "SamplingProfiler"]
+
+clock = getattr(time, "perf_counter", time.time)    # python 2.x has no monotonic clock
+
+
+class Timings(object):
+    """The most recent durations of something (a ring buffer), and the total number of times it was timed"""
+    def __init__(self, size):
+        self.durations = collections.deque(maxlen=size)
+        self.count = 0
+
+    def add(self, duration):
+        self.durations.append(duration)
+        self.count += 1
+
+    def statistics(self):
+        """dict with count, samples, mean, p50, p95, p99 and max (durations in seconds)"""
+        durations = sorted(self.durations)
+        num = len(durations)
+        if not num:
+            return {"count": self.count, "samples": 0}
+
+        def percentile(p):
+            return durations[min(num - 1, int(num * p / 100.0))]
+
+        return {
+            "count": self.count,
+            "samples": num,
+            "mean": sum(durations) / num,
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "max": durations[-1]
+        }
+
+
+class _Stopwatch(object):
+    """Times the consecutive phases of something, see Profiler.stopwatch"""
+    __slots__ = ("profiler", "name", "start", "lap_start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = self.lap_start = clock()
+
+    def lap(self, phase):
+        """the given phase has just ended"""
+        now = clock()
+        self.profiler.record(self.name + "." + phase, now - self.lap_start)
+        self.lap_start = now
+
+    def stop(self, name=None):
+        """Stop timing. The total duration is recorded under the stopwatch's name, or under the given name."""
+        self.profiler.record(name or self.name, clock() - self.start)
+
+
+class _NullStopwatch(object):
+    """Used when profiling is disabled"""
+    __slots__ = ()
+
+    def lap(self, phase):
+        pass
+
+    def stop(self, name=None):
+        pass
+
+
+_null_stopwatch = _NullStopwatch()
+
+
+class Profiler(object):
+    """
+    Collects the timings. Names are dotted, such as 'tick.heartbeats' or 'verb.look'.
+    To prevent unbounded growth, at most max_timers different names are tracked.
+    """
+    max_timers = 500
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.enabled = False
+        self.started = None
+        self.timings = {}
+        self.lock = threading.Lock()   # the web server thread can request the statistics
+
+    def enable(self, enabled=True):
+        if enabled and not self.enabled:
+            self.started = time.time()
+        self.enabled = enabled
+
+    def reset(self):
+        with self.lock:
+            self.timings = {}
+            self.started = time.time() if self.enabled else None
+
+    def stopwatch(self, name):
+        """A stopwatch to time the phases of something (does nothing if profiling is disabled)"""
+        return _Stopwatch(self, name) if self.enabled else _null_stopwatch
+
+    def record(self, name, duration):
+        timings = self.timings.get(name)
+        if timings is None:
+            if len(self.timings) >= self.max_timers:
+                return
+            with self.lock:
+                timings = self.timings[name] = Timings(self.size)
+        timings.add(duration)
+
+    def statistics(self):
+        """The statistics of all timings as a dict (suitable for conversion to json)"""
+        with self.lock:
+            timings = list(self.timings.items())
+        return {
+            "enabled": self.enabled,
+            "started": self.started,
+            "timings": dict((name, t.statistics()) for name, t in timings)
+        }
+
+
+class SamplingProfiler(object):
+    """
+    Samples the call stack of a thread at a regular interval, from another thread.
+    The overhead for the sampled thread is small (it doesn't have to be traced),
+    but the results are statistical. Only one sampling profiler can run at a time.
+    """
+    _running = threading.Lock()
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()   # collapsed stack -> number of samples
+        self.num_samples = 0
+
+    def run(self, duration):
+        """Take samples during the given number of seconds (blocks). Returns self."""
+        if not self._running.acquire(False):
+            raise ValueError("a profiler is already running")
+        try:
+            end = time.time() + duration
+            while time.time() < end:
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is None:
+                    break   # the thread has ended
+                self.stacks[self.collapse(frame)] += 1
+                self.num_samples += 1
+                del frame
+                time.sleep(self.interval)
+        finally:
+            self._running.release()
+        return self
+
+    @staticmethod
+    def collapse(frame):
+        """The stack of the frame in 'collapsed' form: outermost;...;innermost function"""
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        names.reverse()
+        return ";".join(names)
+
+    def collapsed_stacks(self):
+        """The samples in the collapsed stack format that flame graph tools understand (one stack per line)"""
+        return "".join("%s %d\n" % (stack, count) for stack, count in sorted(self.stacks.items()))
+
+    def top_functions(self, amount=10):
+        """
+        The functions that were sampled most often, as a list of (function, self samples, total samples),
+        sorted by the number of samples in which the function itself was running.
+        """
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            functions = stack.split(";")
+            own[functions[-1]] += count
+            for function in set(functions):
+                total[function] += count
+        return [(function, own[function], total[function]) for function, _ in own.most_common(amount)]
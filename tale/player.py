@@ -9,8 +9,12 @@ Copyright by Irmen de Jong (irmen@razorvine.net)
 from __future__ import absolute_import, print_function, division, unicode_literals
 import time
 import random
-from hashlib import sha1
+import hashlib
+import hmac
+import binascii
 import shelve
+import sqlite3
+import pickle
 import threading
 import datetime
 import re
@@ -173,8 +177,7 @@ class Player(base.Living, pubsub.Listener):
         """store a line of entered text in the input command buffer"""
         cmd = cmd.strip()
         self._input.put(cmd)
-        if self.transcript:
-            self.transcript.write(u"\n\n>> %s\n" % cmd)
+        self.write_transcript(u"\n\n>> %s\n" % cmd)
         self.input_is_available.set()
         self.last_input_time = time.time()
 
@@ -188,14 +191,21 @@ class Player(base.Living, pubsub.Listener):
                 raise ActionRefused("There's already a transcript being made to " + self.transcript.name)
             self.transcript = vfs.open_write(file, append=True)
             self.tell("Transcript is being written to", self.transcript.name)
-            self.transcript.write("\n*Transcript starting at %s*\n\n" % time.ctime())
+            self.write_transcript("\n*Transcript starting at %s*\n\n" % time.ctime())
         else:
             if self.transcript:
-                self.transcript.write("\n*Transcript ending at %s*\n\n" % time.ctime())
-                self.transcript.close()
+                transcript = self.transcript
+                self.write_transcript("\n*Transcript ending at %s*\n\n" % time.ctime())
+                mud_context.driver.io_executor.submit(transcript.close, key=transcript.name)
                 self.transcript = None
                 self.tell("Transcript ended.")
 
+    def write_transcript(self, text):
+        """Adds the text to the transcript, if one is being made. The file is written by the driver's i/o executor."""
+        transcript = self.transcript
+        if transcript:
+            mud_context.driver.io_executor.submit(lambda: transcript.write(text), key=transcript.name)
+
     def search_extradesc(self, keyword, include_inventory=True, include_containers_in_inventory=False):
         """
         Searches the extradesc keywords for an location/living/item within the 'visible' world around the player,
@@ -268,6 +278,7 @@ class TextBuffer(object):
 
     def __init__(self):
         self.init()
+        self.lines_written = 0   # total, is not reset when the buffer is cleared
 
     def init(self):
         self.paragraphs = []
@@ -302,6 +313,7 @@ class TextBuffer(object):
         if format:
             line = line.strip()
         p.add(line)
+        self.lines_written += 1
         if end:
             self.in_paragraph = False
 
@@ -329,8 +341,8 @@ class PlayerConnection(object):
         If there is nothing to be outputted, None is returned.
         """
         formatted = self.io.render_output(self.player._output.get_paragraphs(), width=self.player.screen_width, indent=self.player.screen_indent)
-        if formatted and self.player.transcript:
-            self.player.transcript.write(formatted)
+        if formatted:
+            self.player.write_transcript(formatted)
         return formatted or None
 
     @property
@@ -351,9 +363,7 @@ class PlayerConnection(object):
             self.io.do_styles = self.player.screen_styles_enabled
             self.io.do_smartquotes = self.player.smartquotes_enabled
             if mud_context.config.server_mode == "if" and self.player.output_line_delay > 0:
-                for line in output.rstrip().splitlines():
-                    self.io.output(line)
-                    time.sleep(self.player.output_line_delay / 1000.0)  # delay the output for a short period
+                self.io.output_paced(output.rstrip(), self.player.output_line_delay)   # the i/o adapter delays the lines
             else:
                 self.io.output(output.rstrip())
 
@@ -416,6 +426,22 @@ class PlayerConnection(object):
             self.player = None
 
 
+def _pbkdf2_sha256(password, salt, iterations):
+    """PBKDF2-HMAC-SHA256 in plain Python, for Pythons that don't have hashlib.pbkdf2_hmac (3.3)"""
+    mac = hmac.new(password, digestmod=hashlib.sha256)
+
+    def prf(data):
+        m = mac.copy()
+        m.update(data)
+        return m.digest()
+    block = prf(salt + b"\x00\x00\x00\x01")   # one block is enough, the key is as long as the digest
+    result = int(binascii.hexlify(block), 16)
+    for _ in range(iterations - 1):
+        block = prf(block)
+        result ^= int(binascii.hexlify(block), 16)
+    return binascii.unhexlify("%064x" % result)
+
+
 class MudAccounts(object):
     """Handles the accounts (login, creation, etc) of mud users"""
     def __init__(self, database_opener=None):
@@ -463,21 +489,67 @@ class MudAccounts(object):
             db[name] = account
 
     def valid_password(self, name, password):
+        """
+        Checks the password of the account, raises ValueError if it is invalid.
+        This is potentially slow (it runs the key derivation function) so the driver
+        should call it from a worker thread. If the stored password hash was created with
+        an older (weaker) hashing method, it is transparently replaced by a new hash.
+        """
         name = self.__shelve_encode_key(name)
         with self.db_lock, self.open_db() as db:
-            if name in db:
-                account = db[name]
-                pwhash, _ = self._pwhash(password, account["pw_salt"])
-                if pwhash == account["pw_hash"]:
-                    return
-            raise ValueError("Invalid name or password.")
+            account = db[name] if name in db else None
+        if account:
+            method = self._pwhash_method(account["pw_hash"])
+            pwhash, _ = self._pwhash(password, account["pw_salt"], method)
+            if hmac.compare_digest(pwhash, account["pw_hash"]):
+                if method != self.pw_hash_method:
+                    # rehash-on-login: upgrade the stored hash to the current method
+                    pwhash, salt = self._pwhash(password)
+                    with self.db_lock, self.open_db() as db:
+                        account = db[name]
+                        account["pw_hash"] = pwhash
+                        account["pw_salt"] = salt
+                        db[name] = account
+                return
+        raise ValueError("Invalid name or password.")
+
+    # The key derivation function (and its parameters) used to hash new passwords.
+    # Scrypt is preferred, but it is only available in Python 3.6+ built with OpenSSL 1.1+.
+    pw_hash_method = "scrypt$16384$8$1" if hasattr(hashlib, "scrypt") else "pbkdf2_sha256$100000"
 
     @staticmethod
-    def _pwhash(password, salt=None):
+    def _pwhash_method(pwhash):
+        """returns the hashing method (including its parameters) that was used to create the given password hash"""
+        if "$" not in pwhash:
+            return "sha1"   # plain salted sha1 hash, created by older versions
+        return pwhash.rpartition("$")[0]
+
+    @staticmethod
+    def _pwhash(password, salt=None, method=None):
+        """
+        Hashes the password with the given method (default is pw_hash_method).
+        Returns a tuple (encoded hash, salt). The encoded hash is prefixed with the method and its parameters.
+        """
         if not salt:
             salt = str(random.random() * time.time() + id(password)).replace('.', '')
-        pwhash = sha1((salt + password).encode("utf-8")).hexdigest()
-        return pwhash, salt
+        method = method or MudAccounts.pw_hash_method
+        pw_bytes = password.encode("utf-8")
+        salt_bytes = salt.encode("utf-8")
+        if method == "sha1":
+            return hashlib.sha1(salt_bytes + pw_bytes).hexdigest(), salt
+        kdf, _, params = method.partition("$")
+        params = [int(p) for p in params.split("$")]
+        if kdf == "scrypt":
+            n, r, p = params
+            digest = hashlib.scrypt(pw_bytes, salt=salt_bytes, n=n, r=r, p=p, maxmem=256 * n * r * p)
+        elif kdf == "pbkdf2_sha256":
+            if hasattr(hashlib, "pbkdf2_hmac"):
+                digest = hashlib.pbkdf2_hmac(str("sha256"), pw_bytes, salt_bytes, params[0])
+            else:
+                digest = _pbkdf2_sha256(pw_bytes, salt_bytes, params[0])
+        else:
+            raise ValueError("unknown password hash method: " + method)
+        return method + "$" + binascii.hexlify(digest).decode("ascii"), salt
 
     @staticmethod
     def accept_password(password):
@@ -502,17 +574,18 @@ class MudAccounts(object):
         raise ValueError("Invalid email address.")
 
     def create(self, name, password, email, gender, stats, privileges=[]):
+        """Creates a new account. This runs the password hash so call it from a worker thread."""
         name = name.strip()
         dbname = self.__shelve_encode_key(name)
         email = email.strip()
         gender = gender.strip()
         self.accept_name(name)
+        self.accept_password(password)
+        self.accept_email(email)
+        pwhash, salt = self._pwhash(password)   # outside of the lock, it takes a while
         with self.db_lock, self.open_db() as db:
             if dbname in db:
                 raise ValueError("That name is not available.")
-            self.accept_password(password)
-            self.accept_email(email)
-            pwhash, salt = self._pwhash(password)
             db[dbname] = {"name": name,
                           "email": email,
                           "pw_hash": pwhash,
@@ -525,15 +598,17 @@ class MudAccounts(object):
             return db[dbname]
 
     def change_password_email(self, name, old_password, new_password=None, new_email=None):
+        """Changes the account's password and/or email. This runs the password hash so call it from a worker thread."""
         self.valid_password(name, old_password)
+        if new_password:
+            self.accept_password(new_password)
+            pwhash, salt = self._pwhash(new_password)
         name = self.__shelve_encode_key(name)
         with self.db_lock, self.open_db() as db:
             if name not in db:
                 raise KeyError("Unknown name.")
             account = db[name]
             if new_password:
-                self.accept_password(new_password)
-                pwhash, salt = self._pwhash(new_password)
                 account["pw_hash"] = pwhash
                 account["pw_salt"] = salt
             new_email = new_email.strip() if new_email else None
@@ -607,3 +682,121 @@ bitch
 motherfucker
 fucker
 """.split()
+
+
+class MudPlayerStore(object):
+    """
+    Incremental storage of the state of mud players, in a sqlite database.
+    The driver marks players as 'dirty' when they did something, and periodically saves only
+    those players (and a player is always saved when they log out). Only the state is stored
+    that isn't tied to the game world (money, stats, preferences, etc), not the location or inventory.
+    The database writes are done in batches by a background writer thread, so they don't stall the server tick.
+    """
+    saved_attributes = ["money", "turns", "state", "stats", "brief", "screen_width", "screen_indent",
+                        "screen_styles_enabled", "smartquotes_enabled"]
+
+    def __init__(self, dbpath, save_interval=60):
+        self.dbpath = dbpath
+        self.save_interval = save_interval
+        self.tracked = {}    # maps player name to the player object, for all logged in players
+        self.dirty = set()   # names of the players that need to be saved
+        self.last_save = time.time()
+        self.write_queue = queue.Queue()
+        with closing(sqlite3.connect(self.dbpath)) as db:
+            db.execute("CREATE TABLE IF NOT EXISTS player_state(name TEXT PRIMARY KEY, state BLOB NOT NULL, saved TEXT NOT NULL)")
+            db.commit()
+        self.writer = threading.Thread(name="playerstore-writer", target=self.__writer)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def load(self, name):
+        """Returns the stored state dict of the player, or None if nothing was stored yet. Blocks on the database."""
+        with closing(sqlite3.connect(self.dbpath)) as db:
+            row = db.execute("SELECT state FROM player_state WHERE name=?", (name,)).fetchone()
+        return pickle.loads(bytes(row[0])) if row else None
+
+    def restore(self, player, state):
+        """Applies the (loaded) state to the player, who will be tracked for saving from now on. State can be None."""
+        if state:
+            for attr in self.saved_attributes:
+                if attr in state:
+                    setattr(player, attr, state[attr])
+        self.tracked[player.name] = player
+
+    def mark_dirty(self, player):
+        """Remember that the player's state changed and needs to be saved."""
+        if player.name in self.tracked:
+            self.dirty.add(player.name)
+
+    def save_dirty(self, force=False):
+        """
+        Queues the dirty players for writing, once every save_interval seconds (or immediately if forced).
+        The player state is captured here, the actual writing is done by the writer thread.
+        """
+        if not force and time.time() - self.last_save < self.save_interval:
+            return
+        self.last_save = time.time()
+        batch = [self.__record(self.tracked[name]) for name in self.dirty if name in self.tracked]
+        self.dirty.clear()
+        if batch:
+            self.write_queue.put(batch)
+
+    def save(self, player, logout=False):
+        """Queues the player for writing right away. If it's a logout, the player is no longer tracked afterwards."""
+        if player.name not in self.tracked:
+            return
+        self.write_queue.put([self.__record(player)])
+        self.dirty.discard(player.name)
+        if logout:
+            del self.tracked[player.name]
+
+    def flush(self):
+        """Blocks until everything that's been queued, has been written."""
+        self.write_queue.join()
+
+    def close(self):
+        """Saves all tracked players, waits until they've been written, and stops the writer thread."""
+        for player in list(self.tracked.values()):
+            self.save(player, logout=True)
+        self.write_queue.put(None)
+        self.flush()
+        self.writer.join()
+
+    def __record(self, player):
+        state = {attr: getattr(player, attr) for attr in self.saved_attributes}
+        return player.name, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __writer(self):
+        # sqlite connections can only be used in the thread that created them
+        db = sqlite3.connect(self.dbpath)
+        try:
+            while True:
+                batch = self.write_queue.get()
+                if batch is None:
+                    self.write_queue.task_done()
+                    break
+                # combine everything else that's queued up, into a single transaction
+                num_batches = 1
+                try:
+                    while True:
+                        more = self.write_queue.get_nowait()
+                        num_batches += 1
+                        if more is None:
+                            self.write_queue.put(None)   # handle the stop request after this transaction
+                            break
+                        batch.extend(more)
+                except queue.Empty:
+                    pass
+                try:
+                    now = str(datetime.datetime.now().replace(microsecond=0))
+                    with db:
+                        db.executemany("INSERT OR REPLACE INTO player_state(name, state, saved) VALUES (?,?,?)",
+                                       [(name, sqlite3.Binary(state), now) for name, state in batch])
+                except sqlite3.Error as x:
+                    print("ERROR storing player state:", x, file=sys.stderr)
+                finally:
+                    for _ in range(num_batches):
+                        self.write_queue.task_done()
+        finally:
+            db.close()
+
@@ -0,0 +1,276 @@
+# coding=utf-8
+"""
+Savegame file format.
+The game state is pickled and streamed through zlib directly into a temporary file,
+which replaces the actual savegame file once it's complete (so a crash while saving
+never leaves a half-written savegame behind). The file starts with a small header
+that contains the format version, the game version and a checksum of the compressed data.
+This allows the game version to be checked before the (possibly large) rest is read.
+
+A world snapshot (mud mode) uses the same file format, but the world is pickled
+location by location instead of as one single object graph.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import io
+import os
+import pickle
+import struct
+import zlib
+from . import base, player
+
+__all__ = ["SavegameFormatError", "SavegameReader", "write_savegame", "write_world_snapshot", "load_world_snapshot"]
+
+MAGIC = b"TALESAVE"
+FORMAT_VERSION = 1
+_header_struct = struct.Struct(">8sHIH")     # magic, format version, crc32 of the compressed data, length of game version
+CHUNK_SIZE = 64 * 1024
+
+
+class SavegameFormatError(ValueError):
+    """The file is not a savegame, or it has an unsupported format version."""
+    pass
+
+
+def write_savegame(path, game_version, state, dumper=None):
+    """
+    Pickle the state into a new savegame file on the given path (atomically replacing an existing file).
+    Instead of simply pickling the state, a custom dumper function can be given that
+    is called with the (compressing) output stream and the state.
+    """
+    game_version = game_version.encode("utf-8")
+    temp_path = path + ".tmp"
+    try:
+        with io.open(temp_path, "wb") as f:
+            f.write(_header_struct.pack(MAGIC, FORMAT_VERSION, 0, len(game_version)))
+            f.write(game_version)
+            stream = _CompressingWriter(f)
+            if dumper:
+                dumper(stream, state)
+            else:
+                pickle.Pickler(stream, pickle.HIGHEST_PROTOCOL).dump(state)
+            stream.close()
+            # now that the checksum is known, fill it in in the header
+            f.seek(0)
+            f.write(_header_struct.pack(MAGIC, FORMAT_VERSION, stream.crc, len(game_version)))
+            f.flush()
+            os.fsync(f.fileno())
+    except Exception:
+        # don't leave a half written file behind (an existing savegame is untouched)
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    if hasattr(os, "replace"):
+        os.replace(temp_path, path)
+    else:
+        # python 2 has no atomic replace; on windows rename fails if the target exists
+        if os.name == "nt" and os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
+
+
+class SavegameReader(object):
+    """
+    Reads a savegame file. The header is read when it is opened, so you can check
+    the game_version before loading the state. Use it as a context manager.
+    Reads from the file with the given path, or from a binary stream (such as vfs.open_read returns).
+    """
+    def __init__(self, path):
+        self.file = path if hasattr(path, "read") else io.open(path, "rb")
+        try:
+            header = self.file.read(_header_struct.size)
+            if len(header) < _header_struct.size:
+                raise SavegameFormatError("not a savegame file")
+            magic, self.format_version, self.crc, version_length = _header_struct.unpack(header)
+            if magic != MAGIC:
+                raise SavegameFormatError("not a savegame file (or from an older version of Tale)")
+            if self.format_version != FORMAT_VERSION:
+                raise SavegameFormatError("unsupported savegame format version %d" % self.format_version)
+            self.game_version = self.file.read(version_length).decode("utf-8")
+        except Exception:
+            self.file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def load(self, loader=None):
+        """
+        Unpickle and return the game state. Raises SavegameFormatError if the data is corrupt.
+        Instead of simply unpickling the state, a custom loader function can be given that
+        is called with the (decompressing) input stream and returns the state.
+        """
+        stream = _DecompressingReader(self.file)
+        try:
+            if loader:
+                state = loader(stream)
+            else:
+                state = pickle.Unpickler(stream).load()
+        except SavegameFormatError:
+            raise
+        except Exception:
+            # unpickling garbage can fail in many ways, report it as corrupt data if the checksum is wrong
+            self._check_crc(stream)
+            raise
+        self._check_crc(stream)
+        return state
+
+    def _check_crc(self, stream):
+        stream.read_to_end()
+        if stream.crc != self.crc:
+            raise SavegameFormatError("savegame data is corrupt (checksum mismatch)")
+
+
+def write_world_snapshot(path, game_version, world):
+    """
+    Write a snapshot of the whole game world. The world is a dict with the global state (deferreds,
+    game clock, heartbeat objects, start locations...); all locations that can be reached
+    from it (including via exits) are included as well. Players are left out.
+    Every location is pickled as a separate record in which references to other locations
+    are replaced by an id, so the pickle recursion depth doesn't grow with the size of the world.
+    Returns the number of locations written.
+    """
+    result = []
+
+    def dumper(stream, world):
+        pickler = _WorldPickler(stream)
+        pickler.dump(world)
+        while pickler.pending:
+            location_id, location = pickler.pending.pop()
+            state = location.__getstate__()
+            if "livings" in state:
+                state["livings"] = set(living for living in state["livings"] if not isinstance(living, player.Player))
+            pickler.dump((location_id, state))
+        pickler.dump(None)
+        result.append(len(pickler.location_ids))
+
+    write_savegame(path, game_version, world, dumper)
+    return result[0]
+
+
+def load_world_snapshot(savegame):
+    """Restore and return the world dict from a snapshot (opened by a SavegameReader)."""
+    def loader(stream):
+        unpickler = _WorldUnpickler(stream)
+        world = unpickler.load()
+        record = unpickler.load()
+        while record:
+            location_id, state = record
+            unpickler.locations[location_id].__setstate__(state)
+            record = unpickler.load()
+        return world
+    return savegame.load(loader)
+
+
+class _WorldPickler(pickle.Pickler):
+    """Pickler that writes locations (and players) as references instead of including them directly"""
+    def __init__(self, file):
+        pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+        self.location_ids = {}
+        self.pending = []
+
+    def persistent_id(self, obj):
+        if isinstance(obj, base.Location):
+            if obj is base._limbo:
+                return "limbo"
+            location_id = self.location_ids.get(id(obj))
+            if location_id is None:
+                location_id = self.location_ids[id(obj)] = len(self.location_ids)
+                self.pending.append((location_id, obj))
+            return location_id, type(obj)
+        if isinstance(obj, player.Player):
+            return "player"    # players are not part of the world snapshot
+        return None
+
+
+class _WorldUnpickler(pickle.Unpickler):
+    """Unpickler that creates (empty) locations for the location references, their state is loaded later"""
+    def __init__(self, file):
+        pickle.Unpickler.__init__(self, file)
+        self.locations = {}
+
+    def persistent_load(self, pid):
+        if pid == "limbo":
+            return base._limbo
+        if pid == "player":
+            return None
+        location_id, location_class = pid
+        if location_id not in self.locations:
+            self.locations[location_id] = location_class.__new__(location_class)
+        return self.locations[location_id]
+
+
+class _CompressingWriter(object):
+    """file-like object that compresses everything written to it into the underlying file"""
+    def __init__(self, file):
+        self.file = file
+        self.compressor = zlib.compressobj(6)
+        self.crc = 0
+
+    def write(self, data):
+        self.__write_compressed(self.compressor.compress(data))
+
+    def close(self):
+        self.__write_compressed(self.compressor.flush())
+
+    def __write_compressed(self, data):
+        if data:
+            self.crc = zlib.crc32(data, self.crc) & 0xffffffff
+            self.file.write(data)
+
+
+class _DecompressingReader(object):
+    """file-like object that decompresses the data read from the underlying file (just enough for unpickling)"""
+    def __init__(self, file):
+        self.file = file
+        self.decompressor = zlib.decompressobj()
+        self.buffer = bytearray()
+        self.eof = False
+        self.crc = 0
+
+    def __fill(self, size):
+        while len(self.buffer) < size and not self.eof:
+            chunk = self.file.read(CHUNK_SIZE)
+            try:
+                if chunk:
+                    self.crc = zlib.crc32(chunk, self.crc) & 0xffffffff
+                    self.buffer.extend(self.decompressor.decompress(chunk))
+                else:
+                    self.buffer.extend(self.decompressor.flush())
+                    self.eof = True
+            except zlib.error as x:
+                raise SavegameFormatError("savegame data is corrupt (%s)" % x)
+
+    def read(self, size=-1):
+        if size < 0:
+            self.__fill(float("inf"))
+            size = len(self.buffer)
+        else:
+            self.__fill(size)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readline(self):
+        while True:
+            index = self.buffer.find(b"\n")
+            if index >= 0 or self.eof:
+                return self.read(index + 1 if index >= 0 else len(self.buffer))
+            self.__fill(len(self.buffer) + CHUNK_SIZE)
+
+    def read_to_end(self):
+        """consume the remaining data (to finish the checksum calculation)"""
+        while not self.eof:
+            del self.buffer[:]
+            self.__fill(1)
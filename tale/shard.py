@@ -0,0 +1,428 @@
+# coding=utf-8
+"""
+Sharded mud mode: the zones of the world are divided over several worker processes (shards),
+so that the game logic can use more than one cpu core.
+
+Every worker process is a regular mud driver that loads the story, but it only has the players
+whose location is in one of its own zones. When a player goes through an exit to a zone of another shard,
+the player object is pickled (see Player.__getstate__) and handed off to that shard via the front process.
+References to locations (such as the player's known locations) are pickled as their key, and the receiving
+shard replaces them with its own location objects again.
+The front process starts the workers, and routes the input and output of the players to the right shard.
+The front is a regular mud driver as well (start it with the --shards option): it has the web server,
+and it takes care of the accounts and the login. After the login the player enters the world in a worker.
+
+Stories that build their zones lazily (such as Circle with lazy_zones) only build the zones
+that the players of a shard actually visit, so most of the world is simulated by one process only.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import io
+import os
+import sys
+import time
+import zlib
+import pickle
+import threading
+import collections
+import multiprocessing
+from . import pubsub, lang
+from . import base
+from .util import queue
+from .player import Player, PlayerConnection
+from .tio.mud_browser_io import MudHttpIo
+
+__all__ = ["ShardMap", "ShardFront", "run_worker"]
+
+pending_tells = pubsub.topic("driver-pending-tells")
+
+
+class ShardMap(object):
+    """
+    Tells in which shard a location is. Locations are identified by a key that is the same in every process.
+    By default this is the name of the location in the driver's location registry (such as "town.square"),
+    and the zone is the part before the dot. Zones are assigned to shards by the given assignment dict,
+    other zones are spread over the shards by their name (or number).
+    A story whose locations are not in the registry replaces location_key, target_key, zone_of_key
+    and find_location with functions of its own (see Storybase.init_shards).
+    """
+    def __init__(self, driver, num_shards, assignment=None):
+        self.driver = driver
+        self.num_shards = num_shards
+        self.assignment = assignment or {}
+        self.registry_keys = {}   # location -> its name in the registry
+
+    def location_key(self, location):
+        """The key of the location, or None if it doesn't have one (it then belongs to no shard)"""
+        if len(self.registry_keys) != len(self.driver.zone_locations):
+            self.registry_keys = dict((loc, name) for name, loc in self.driver.zone_locations.items())
+        return self.registry_keys.get(location)
+
+    def target_key(self, exit):
+        """The key of the target location of the exit (without building that location)"""
+        return self.location_key(exit.target)
+
+    def zone_of_key(self, key):
+        return key.partition(".")[0]
+
+    def find_location(self, key):
+        return self.driver.zone_locations[key]
+
+    def shard_of_key(self, key):
+        """The shard that the location with the given key is in (None if the key is None)"""
+        if key is None:
+            return None
+        zone = self.zone_of_key(key)
+        shard = self.assignment.get(zone)
+        if shard is None:
+            if isinstance(zone, int):
+                shard = zone % self.num_shards
+            else:
+                shard = (zlib.crc32(zone.encode("utf-8")) & 0xffffffff) % self.num_shards
+        return shard
+
+
+class ShardIo(MudHttpIo):
+    """I/O adapter for the players of a shard worker: the html output is sent to the front process"""
+    def __init__(self, player_connection, outbox):
+        super(ShardIo, self).__init__(player_connection)
+        self.outbox = outbox
+
+    def __repr__(self):
+        return "<ShardIo @ 0x%x>" % id(self)
+
+    def render_output(self, paragraphs, **params):
+        super(ShardIo, self).render_output(paragraphs, **params)
+        self.send()
+
+    def output_no_newline(self, text):
+        super(ShardIo, self).output_no_newline(text)
+        self.send()
+
+    def clear_screen(self):
+        super(ShardIo, self).clear_screen()
+        self.send()
+
+    def send(self):
+        if self.html_to_browser or self.html_special:
+            player = self.player_connection.player
+            location = player.location.title if player.location else ""
+            self.outbox.put(("output", player.name, self.html_to_browser, self.html_special, location, player.turns))
+            self.html_to_browser = []
+            self.html_special = []
+
+
+class ShardWorker(object):
+    """
+    The shard part of a worker process' driver (driver.shard). It receives the messages of the front
+    process in a background thread, and hands off the players that leave the shard's zones.
+    Everything that changes the world is done in the driver's thread (via the pending tells).
+    """
+    def __init__(self, driver, shard, num_shards, assignment, inbox, outbox):
+        self.driver = driver
+        self.shard = shard
+        self.num_shards = num_shards
+        self.assignment = assignment
+        self.inbox = inbox
+        self.outbox = outbox
+        self.shard_map = None
+        self.lock = threading.Lock()
+        self.expected = set()   # names of the players that are about to arrive
+        self.pending_input = collections.defaultdict(list)   # input of players that are about to arrive
+
+    def start(self):
+        """Called by the driver when the story has been loaded (instead of starting the web server)"""
+        self.shard_map = ShardMap(self.driver, self.num_shards, self.assignment)
+        self.driver.story.init_shards(self.driver, self.shard_map)
+        receiver = threading.Thread(name="shard-inbox", target=self.__receive)
+        receiver.daemon = True
+        receiver.start()
+        start_shards = [self.shard_map.shard_of_key(self.shard_map.location_key(location)) or 0
+                        for location in (self.driver.config.startlocation_player, self.driver.config.startlocation_wizard)]
+        self.outbox.put(("ready", self.shard, start_shards))
+
+    def __receive(self):
+        while True:
+            message = self.inbox.get()
+            if message is None:
+                pending_tells.send(self.driver._stop_driver)
+                return
+            kind, name = message[:2]
+            if kind == "input":
+                self.__input(name, message[2])
+            elif kind == "connect":
+                with self.lock:
+                    self.expected.add(name)
+                pending_tells.send(lambda args=message[1:]: self.__connect(*args))
+            elif kind == "enter":
+                with self.lock:
+                    self.expected.add(name)
+                pending_tells.send(lambda args=message[1:]: self.__enter(*args))
+            elif kind == "disconnect":
+                pending_tells.send(lambda name=name: self.__disconnect(name))
+            else:
+                raise ValueError("invalid shard message: " + kind)
+
+    def __input(self, name, line):
+        with self.lock:
+            conn = self.driver.all_players.get(name)
+            if conn:
+                conn.player.store_input_line(line)
+            elif name in self.expected:
+                self.pending_input[name].append(line)
+            else:
+                self.outbox.put(("reroute", name, line))   # the player has just left this shard
+
+    def __add_player(self, player):
+        conn = PlayerConnection(player)
+        conn.io = ShardIo(conn, self.outbox)
+        with self.lock:
+            self.driver.all_players[player.name] = conn
+            self.expected.discard(player.name)
+            for line in self.pending_input.pop(player.name, []):
+                player.store_input_line(line)
+        return conn
+
+    def __connect(self, name, gender, race, privileges):
+        # a new login, the front process has taken care of the account
+        player = Player(name, gender, race)
+        player.privileges = set(privileges)
+        self.__add_player(player)
+        if self.driver.player_store:
+            self.driver.player_store.restore(player, self.driver.player_store.load(name))
+        if "wizard" in player.privileges:
+            player.move(self.driver.config.startlocation_wizard)
+        else:
+            player.move(self.driver.config.startlocation_player)
+        self.driver.story.init_player(player)
+        player.look(short=False)
+
+    def __enter(self, name, data, key):
+        # a player handed off by another shard
+        player = _HandoffUnpickler(io.BytesIO(data), self.shard_map).load()
+        player.known_locations.discard(base._limbo)
+        self.__add_player(player)
+        if self.driver.player_store:
+            self.driver.player_store.restore(player, None)
+        player.move(self.shard_map.find_location(key), is_player=True)
+        player.look()
+
+    def __disconnect(self, name):
+        conn = self.driver.all_players.get(name)
+        if conn:
+            self.driver._disconnect_mud_player(conn)
+
+    def player_left(self, name):
+        """The player has left the game (the driver disconnected it)"""
+        self.outbox.put(("quit", name))
+
+    def leave_through_exit(self, player, exit):
+        """Hands off the player if the exit leads to another shard. Returns True if that was done."""
+        key = self.shard_map.target_key(exit)
+        shard = self.shard_map.shard_of_key(key)
+        if shard is None or shard == self.shard:
+            return False
+        self.handoff(player, key, shard)
+        return True
+
+    def handoff_players(self):
+        """Hands off the players that ended up in a location of another shard (by other means than an exit)"""
+        for conn in list(self.driver.all_players.values()):
+            if conn.player and conn.player.location:
+                key = self.shard_map.location_key(conn.player.location)
+                shard = self.shard_map.shard_of_key(key)
+                if shard is not None and shard != self.shard:
+                    self.handoff(conn.player, key, shard)
+
+    def handoff(self, player, key, shard):
+        """Remove the player from this shard, and send it to the given shard (via the front process)"""
+        location = player.location
+        location.remove(player, player)
+        location.tell("%s leaves." % lang.capital(player.title), exclude_living=player)
+        with self.lock:
+            conn = self.driver.all_players.pop(player.name)
+        conn.write_output()
+        if self.driver.player_store:
+            self.driver.player_store.save(player, logout=True)
+        player.location = None
+        player._previous_parsed = None   # can refer to things in the world we're leaving
+        player.clear_wiretaps()   # they're subscriptions in this process, they can't go along
+        stream = io.BytesIO()
+        _HandoffPickler(stream, self.shard_map).dump(player)
+        data = stream.getvalue()
+        self.outbox.put(("handoff", player.name, data, key, shard))
+        for line in player.get_pending_input():
+            self.outbox.put(("reroute", player.name, line))   # the input that hasn't been processed yet goes along
+        conn.player = conn.io = None
+
+
+class _HandoffPickler(pickle.Pickler):
+    """Pickler for a player that is handed off: locations are written as their key instead of as a copy"""
+    def __init__(self, file, shard_map):
+        pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+        self.shard_map = shard_map
+
+    def persistent_id(self, obj):
+        if isinstance(obj, base.Location):
+            return ("location", self.shard_map.location_key(obj))
+        return None
+
+
+class _HandoffUnpickler(pickle.Unpickler):
+    """Unpickler for a player that is handed off: the location keys are replaced by the locations of this shard"""
+    def __init__(self, file, shard_map):
+        pickle.Unpickler.__init__(self, file)
+        self.shard_map = shard_map
+
+    def persistent_load(self, pid):
+        _, key = pid
+        if key is None:
+            return base._limbo   # a location that has no key (and no shard)
+        return self.shard_map.find_location(key)
+
+
+def run_worker(game, shard, num_shards, assignment, inbox, outbox):
+    """Entry point of a worker process: runs the mud driver for the given shard of the game"""
+    # The worker inherits the working directory and sys.path of the front process, which may have loaded
+    # a story before (the driver changes into the game directory and puts '.' on the path).
+    # Start from the game directory with only absolute path entries, so that the right story gets imported.
+    if os.path.isdir(game):
+        os.chdir(game)
+    sys.path[:] = [path for path in sys.path if path and os.path.isabs(path)]
+    for module in list(sys.modules):
+        if module == "story" or module == "zones" or module.startswith("zones."):
+            del sys.modules[module]   # left over in a forked worker
+    from .driver import Driver
+    driver = Driver()
+    driver.shard = ShardWorker(driver, shard, num_shards, assignment, inbox, outbox)
+    driver.start(["--game", game, "--mode", "mud"])
+
+
+class ShardFront(object):
+    """
+    The front process of the sharded mud mode. It starts a worker process for every shard, and routes
+    the players' input to the shard that has the player. The html output of the players is collected
+    per player (get_output), or delivered to their connections (deliver_output).
+    The driver of the front process (driver.shard_front) does the account handling and the login.
+    """
+    def __init__(self, game, num_shards, assignment=None):
+        self.game = os.path.abspath(game)
+        self.num_shards = num_shards
+        self.assignment = assignment
+        self.shards = {}    # player name -> shard
+        self.output = collections.defaultdict(list)    # player name -> html lines not yet fetched
+        self.special = collections.defaultdict(list)   # player name -> special output commands not yet fetched
+        self.status = {}    # player name -> (location title, turns) as of the latest output
+        self.quits = []     # names of the players that left the game in a worker
+        self.start_shards = None    # shards of the player and wizard start locations
+        self.inboxes = []
+        self.processes = []
+        self.outbox = None
+
+    def start(self, timeout=120):
+        """Start the worker processes, and wait until they've all loaded the story"""
+        # if possible, every worker is started in a fresh interpreter (it loads its own copy of the story)
+        get_context = getattr(multiprocessing, "get_context", None)
+        context = get_context("spawn") if get_context else multiprocessing
+        tale_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if tale_path not in sys.path:
+            sys.path.append(tale_path)   # the workers must be able to import tale, even if it's not installed
+        self.outbox = context.Queue()
+        for shard in range(self.num_shards):
+            inbox = context.Queue()
+            process = context.Process(name="shard-%d" % shard, target=run_worker,
+                                      args=(self.game, shard, self.num_shards, self.assignment, inbox, self.outbox))
+            process.daemon = True
+            process.start()
+            self.inboxes.append(inbox)
+            self.processes.append(process)
+        ready = set()
+        end = time.time() + timeout
+        while len(ready) < self.num_shards:
+            if time.time() > end or not all(process.is_alive() for process in self.processes):
+                self.stop(0)
+                raise RuntimeError("not all shards could be started")
+            try:
+                message = self.outbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if message[0] != "ready":
+                raise RuntimeError("unexpected message from a starting shard: %r" % (message,))
+            ready.add(message[1])
+            self.start_shards = message[2]
+
+    def stop(self, timeout=10):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.inboxes = []
+        self.processes = []
+
+    def connect(self, name, gender="n", race="human", wizard=False):
+        """Log in a player (that has been authenticated already)"""
+        shard = self.start_shards[1 if wizard else 0]
+        self.shards[name] = shard
+        self.inboxes[shard].put(("connect", name, gender, race, ["wizard"] if wizard else []))
+
+    def disconnect(self, name):
+        self.inboxes[self.shards.pop(name)].put(("disconnect", name))
+
+    def input(self, name, line):
+        shard = self.shards.get(name)   # (can be called from other threads)
+        if shard is not None:
+            self.inboxes[shard].put(("input", name, line))
+
+    def get_output(self, name):
+        """The html lines and the special commands (such as 'clear') for the player, received since the previous call"""
+        return self.output.pop(name, []), self.special.pop(name, [])
+
+    def has_messages(self):
+        return not self.outbox.empty()
+
+    def deliver_output(self, connections):
+        """
+        Handle the messages of the workers, and add the output to the i/o of the player connections (name -> connection).
+        Returns the names of the connected players that have left the game in a worker process.
+        """
+        self.process_messages()
+        for name, conn in connections.items():
+            html, special = self.get_output(name)
+            if html or special:
+                conn.io.html_to_browser.extend(html)
+                conn.io.html_special.extend(special)
+                conn.io.location_title, conn.player.turns = self.status[name]
+        quits, self.quits = [name for name in self.quits if name in connections], []
+        return quits
+
+    def process_messages(self, timeout=0.0):
+        """Handle the messages of the workers, waits at most the given time for the first one. Returns how many there were."""
+        count = 0
+        while True:
+            try:
+                message = self.outbox.get(timeout=timeout) if timeout and not count else self.outbox.get_nowait()
+            except queue.Empty:
+                return count
+            count += 1
+            kind, name = message[:2]
+            if kind == "output":
+                self.output[name].extend(message[2])
+                self.special[name].extend(message[3])
+                self.status[name] = message[4:6]
+            elif kind == "handoff":
+                data, key, shard = message[2:]
+                self.shards[name] = shard
+                self.inboxes[shard].put(("enter", name, data, key))
+            elif kind == "reroute":
+                if name in self.shards:
+                    self.input(name, message[2])
+            elif kind == "quit":
+                if self.shards.pop(name, None) is not None:
+                    self.quits.append(name)
+            else:
+                raise ValueError("invalid shard message: " + kind)
@@ -76,7 +76,7 @@ class Shopkeeper(NPC):
         assert isinstance(current_time, datetime.time)
         for from_hr, to_hr in self.shop.open_hours:
             from_t = datetime.time(from_hr)
-            to_t = datetime.time(to_hr)
+            to_t = datetime.time(to_hr) if to_hr < 24 else datetime.time.max   # closing at 24 means: until midnight
             if from_hr < to_hr:
                 if from_t <= current_time < to_t:  # normal order such as 9..17
                     return  # we're open!
@@ -78,6 +78,21 @@ class Storybase(object):
         """
         pass
 
+    def init_snapshot(self, driver):
+        """
+        Called by the game driver instead of init(), when it restores the game world from a snapshot.
+        The zones are not built in that case (the whole world comes from the snapshot).
+        """
+        pass
+
+    def init_shards(self, driver, shard_map):
+        """
+        Called in every worker process of the sharded mud mode, after init() (see tale.shard).
+        If not all locations of the story are in the driver's location registry (zone module globals),
+        tell the shard map how to identify and find them.
+        """
+        pass
+
     def init_player(self, player):
         """
         Called by the game driver when it has created the player object.
@@ -11,7 +11,9 @@ import os
 import signal
 import locale
 import threading
+import time
 from . import styleaware_wrapper, iobase
+from ..util import queue
 try:
     from . import colorama_patched as colorama
     colorama.init()
@@ -74,6 +76,10 @@ class ConsoleIo(iobase.IoAdapterBase):
         self.stop_main_loop = False
         self.input_not_paused = threading.Event()
         self.input_not_paused.set()
+        self.output_lock = threading.Lock()
+        self.paced_output = queue.Queue()   # (text, end, delay) that the pacing thread still has to write
+        self.num_paced = 0     # number of items in the paced output queue that haven't been written yet
+        self.pacing_thread = None
 
     def __repr__(self):
         return "<ConsoleIo @ 0x%x, local console, pid %d>" % (id(self), os.getpid())
@@ -109,12 +115,15 @@ class ConsoleIo(iobase.IoAdapterBase):
         else:
             self.input_not_paused.clear()
 
+    def destroy(self):
+        self.paced_output.join()    # wait until the paced output has been written
+
     def clear_screen(self):
         """Clear the screen"""
         if style_words:
-            print("\033[1;1H\033[2J", end="")
+            self._write("\033[1;1H\033[2J", end="")
         else:
-            print("\n" * 5)
+            self._write("\n" * 5)
 
     def install_tab_completion(self, driver):
         """Install tab completion using readline, if available, and if not running on windows (it behaves weird)"""
@@ -168,19 +177,49 @@ class ConsoleIo(iobase.IoAdapterBase):
         """Write some text to the screen. Takes care of style tags that are embedded."""
         super(ConsoleIo, self).output(*lines)
         for line in lines:
-            print(self._apply_style(line, self.do_styles))
-        sys.stdout.flush()
+            self._write(self._apply_style(line, self.do_styles))
 
     def output_no_newline(self, text):
         """Like output, but just writes a single line, without end-of-line."""
         super(ConsoleIo, self).output_no_newline(text)
-        print(self._apply_style(text, self.do_styles), end="")
-        sys.stdout.flush()
+        self._write(self._apply_style(text, self.do_styles), end="")
+
+    def output_paced(self, text, line_delay):
+        """Write the lines of the text with a delay after each line, this is done by a background thread."""
+        lines = text.splitlines()
+        super(ConsoleIo, self).output(*lines)
+        for line in lines:
+            self._write(self._apply_style(line, self.do_styles), delay=line_delay / 1000.0)
 
     def write_input_prompt(self):
         """write the input prompt '>>'"""
-        print(self._apply_style("\n<dim>>></> ", self.do_styles), end="")
-        sys.stdout.flush()
+        self._write(self._apply_style("\n<dim>>></> ", self.do_styles), end="")
+
+    def _write(self, text, end="\n", delay=0.0):
+        # Writes the text directly, unless there is paced output that is still being written;
+        # then it is queued to be written after that (to keep everything in the right order).
+        with self.output_lock:
+            if not delay and not self.num_paced:
+                print(text, end=end)
+                sys.stdout.flush()
+                return
+            self.num_paced += 1
+            self.paced_output.put((text, end, delay))
+            if not self.pacing_thread:
+                self.pacing_thread = threading.Thread(name="console-output", target=self._pacing_loop)
+                self.pacing_thread.daemon = True
+                self.pacing_thread.start()
+
+    def _pacing_loop(self):
+        while True:
+            text, end, delay = self.paced_output.get()
+            with self.output_lock:
+                print(text, end=end)
+                sys.stdout.flush()
+                self.num_paced -= 1
+            self.paced_output.task_done()
+            if delay:
+                time.sleep(delay)
 
     def break_pressed(self):
         """do something when the player types ctrl-C (break)"""
@@ -192,8 +231,7 @@ class ConsoleIo(iobase.IoAdapterBase):
         if self.stop_main_loop:
             # don't write the feedback if the loop is already stopping
             return
-        print(self._apply_style("\n* break: Use <quit> if you want to quit.", self.do_styles))
-        sys.stdout.flush()
+        self._write(self._apply_style("\n* break: Use <quit> if you want to quit.", self.do_styles))
 
     def _apply_style(self, line, do_styles):
         """Convert style tags to ansi escape sequences suitable for console text output"""
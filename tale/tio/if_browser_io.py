@@ -10,6 +10,7 @@ from wsgiref.simple_server import make_server, WSGIRequestHandler, WSGIServer
 import json
 import time
 import sys
+import mimetypes
 from hashlib import md5
 from email.utils import formatdate, parsedate
 from . import iobase
@@ -67,6 +68,7 @@ class HttpIo(iobase.IoAdapterBase):
         self.wsgi_server = wsgi_server
         self.html_to_browser = []     # the lines that need to be displayed in the player's browser
         self.html_special = []      # special out of band commands (such as 'clear')
+        self.html_line_delay = 0    # if not zero, the browser shows the lines one by one with this delay (milliseconds)
 
     def __repr__(self):
         return "<HttpIo @ 0x%x, port %d>" % (id(self), self.port)
@@ -105,6 +107,11 @@ class HttpIo(iobase.IoAdapterBase):
         for line in lines:
             self.output_no_newline(line)
 
+    def output_paced(self, text, line_delay):
+        """The lines are shown one by one in the browser itself (see the 'delay' in the text response)."""
+        self.html_line_delay = line_delay
+        self.output(*text.splitlines())
+
     def output_no_newline(self, text):
         super(HttpIo, self).output_no_newline(text)
         text = self.convert_to_html(text)
@@ -200,6 +207,8 @@ class TaleWsgiAppBase(object):
             return self.wsgi_handle_static(environ, path, start_response)
         elif path == "quit":
             return self.wsgi_handle_quit(environ, parameters, start_response)
+        elif path == "perf":
+            return self.wsgi_handle_perf(environ, parameters, start_response)
         return self.wsgi_not_found(start_response)
 
     def wsgi_invalid_request(self, start_response):
@@ -212,6 +221,11 @@ class TaleWsgiAppBase(object):
         start_response('404 Not Found', [('Content-Type', 'text/plain')])
         return [b'Error 404: Not Found']
 
+    def wsgi_forbidden(self, start_response):
+        """Called if access to the Url is not allowed."""
+        start_response('403 Forbidden', [('Content-Type', 'text/plain')])
+        return [b'Error 403: Forbidden']
+
     def wsgi_redirect(self, start_response, target):
         """Called to do a redirect"""
         start_response('302 Found', [('Location', target)])
@@ -270,14 +284,19 @@ class TaleWsgiAppBase(object):
             return self.wsgi_internal_server_error(start_response, "not logged in")
         html, conn.io.html_to_browser = conn.io.html_to_browser, []
         special, conn.io.html_special = conn.io.html_special, []
+        line_delay, conn.io.html_line_delay = conn.io.html_line_delay, 0
         start_response('200 OK', [('Content-Type', 'application/json; charset=utf-8'),
                                   ('Cache-Control', 'no-cache, no-store, must-revalidate'),
                                   ('Pragma', 'no-cache'),
                                   ('Expires', '0')])
         response = {"text": "\n".join(html)}
+        if line_delay:
+            response["lines"] = html
+            response["delay"] = line_delay
         if html and conn.player:
             response["turns"] = conn.player.turns
-            response["location"] = conn.player.location.title
+            # (in the front process of the sharded mud mode, the player's location is in a worker process)
+            response["location"] = getattr(conn.io, "location_title", "") or conn.player.location.title
             response["special"] = special
         return [json.dumps(response).encode("utf-8")]
 
@@ -312,10 +331,28 @@ class TaleWsgiAppBase(object):
                     conn.io.dont_echo_next_cmd = False
                 else:
                     conn.io.html_to_browser.append("<span class='txt-userinput'>%s</span>" % cmd)
-            conn.player.store_input_line(cmd)
+            self.wsgi_store_input(conn, cmd)
         start_response('200 OK', [('Content-Type', 'text/plain')])
         return []
 
+    def wsgi_store_input(self, conn, cmd):
+        conn.player.store_input_line(cmd)
+
+    def wsgi_handle_perf(self, environ, parameters, start_response):
+        # timings of the server (see the perf wizard command), only available when profiling is enabled.
+        # They're only for wizards, or for requests from the server machine itself.
+        if not self.driver.profiler.enabled:
+            return self.wsgi_not_found(start_response)
+        conn = environ.get("wsgi.session", {}).get("player_connection")
+        wizard = conn and conn.player and "wizard" in conn.player.privileges
+        if not wizard and environ.get("REMOTE_ADDR") not in ("127.0.0.1", "::1"):
+            return self.wsgi_forbidden(start_response)
+        start_response('200 OK', [('Content-Type', 'application/json; charset=utf-8'),
+                                  ('Cache-Control', 'no-cache, no-store, must-revalidate'),
+                                  ('Pragma', 'no-cache'),
+                                  ('Expires', '0')])
+        return [json.dumps(self.driver.profiler.statistics()).encode("utf-8")]
+
     def wsgi_handle_license(self, environ, parameters, start_response):
         license = "The author hasn't provided any license information."
         if self.driver.config.license_file:
@@ -353,11 +390,17 @@ class TaleWsgiAppBase(object):
 
     def wsgi_serve_static(self, path, environ, start_response):
         headers = []
-        resource = vfs.internal_resources[path]
-        if resource.mtime:
-            # unfortunately, this is usually only present when running under python 3.x...
-            mtime_formatted = formatdate(resource.mtime)
-            etag = self.etag(id(vfs.internal_resources), resource.mtime, path)
+        size = vfs.internal_resources.size(path)
+        if size is not None and size > vfs.internal_resources.cache_size:
+            resource = None   # too big for the resource cache, it is streamed instead
+            mtime = vfs.internal_resources.mtime(path)
+        else:
+            resource = vfs.internal_resources[path]
+            mtime = resource.mtime
+        if mtime:
+            # unfortunately, this is not present when the resources are in a zip file...
+            mtime_formatted = formatdate(mtime)
+            etag = self.etag(id(vfs.internal_resources), mtime, path)
             if_modified = environ.get('HTTP_IF_MODIFIED_SINCE')
             if if_modified:
                 if parsedate(if_modified) >= parsedate(mtime_formatted):
@@ -367,15 +410,36 @@ class TaleWsgiAppBase(object):
             if if_none and (if_none == '*' or etag in if_none):
                 return self.wsgi_not_modified(start_response)
             headers.append(("ETag", etag))
-            headers.append(("Last-Modified", formatdate(resource.mtime)))
-        if type(resource.data) is bytes:
-            headers.append(('Content-Type', resource.mimetype))
-            data = resource.data
-        else:
-            headers.append(('Content-Type', resource.mimetype + "; charset=utf-8"))
-            data = resource.data.encode("utf-8")
+            headers.append(("Last-Modified", mtime_formatted))
+        if resource:
+            if type(resource.data) is bytes:
+                headers.append(('Content-Type', resource.mimetype))
+                data = resource.data
+            else:
+                headers.append(('Content-Type', resource.mimetype + "; charset=utf-8"))
+                data = resource.data.encode("utf-8")
+            start_response('200 OK', headers)
+            return [data]
+        stream = vfs.internal_resources.open_read(path, binary=True)
+        mimetype = mimetypes.guess_type(path)[0] or ""
+        # same content type as a resource read by the vfs: its text resources are utf-8
+        headers.append(('Content-Type', mimetype + "; charset=utf-8" if mimetype.startswith("text/") else mimetype))
+        headers.append(('Content-Length', str(size)))
         start_response('200 OK', headers)
-        return [data]
+        if "wsgi.file_wrapper" in environ:
+            return environ["wsgi.file_wrapper"](stream, 64 * 1024)
+        return self.stream_chunks(stream)
+
+    @staticmethod
+    def stream_chunks(stream, chunk_size=64 * 1024):
+        try:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            stream.close()
 
 
 class TaleWsgiApp(TaleWsgiAppBase):
@@ -109,6 +109,14 @@ class IoAdapterBase(object):
         """
         self.last_output_line = text
 
+    def output_paced(self, text, line_delay):
+        """
+        Write the lines of the text with a pause of line_delay milliseconds after each line.
+        This must not block the caller (the driver), so the pacing has to be done asynchronously.
+        This default implementation simply writes all lines at once.
+        """
+        self.output(*text.splitlines())
+
     def write_input_prompt(self):
         """write the input prompt '>>'"""
         pass
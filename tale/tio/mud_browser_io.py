@@ -34,6 +34,7 @@ class MudHttpIo(HttpIo):
         super(MudHttpIo, self).__init__(player_connection, None)
         self.supports_blocking_input = False
         self.dont_echo_next_cmd = False   # used to cloak password input
+        self.location_title = ""   # sharded mud mode: the player's location in the worker process
 
     def __repr__(self):
         return "<MudHttpIo @ 0x%x>" % id(self)
@@ -77,6 +78,13 @@ class TaleMudWsgiApp(TaleWsgiAppBase):
             raise SessionMiddleware.CloseSession("{\"error\": \"no longer a valid connection\"}", "application/json")
         return super(TaleMudWsgiApp, self).wsgi_handle_text(environ, parameters, start_response)
 
+    def wsgi_store_input(self, conn, cmd):
+        front = self.driver.shard_front
+        if front and conn.player.name in front.shards:
+            front.input(conn.player.name, cmd)   # sharded mode: the player is in a worker process
+        else:
+            super(TaleMudWsgiApp, self).wsgi_store_input(conn, cmd)
+
     def wsgi_handle_quit(self, environ, parameters, start_response):
         # Quit/logged out page. For multi player, get rid of the player connection.
         session = environ["wsgi.session"]
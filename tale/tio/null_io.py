@@ -0,0 +1,36 @@
+# coding=utf-8
+"""
+I/O adapter that doesn't do any actual input or output, for headless players
+(such as the synthetic players of the load benchmark).
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import absolute_import, print_function, division, unicode_literals
+from .iobase import IoAdapterBase, strip_text_styles
+
+
+class NullIo(IoAdapterBase):
+    """
+    Discards all output, only the number of output lines and characters is counted.
+    Input is entered directly on the player (player.store_input_line).
+    """
+    def __init__(self, player_connection):
+        super(NullIo, self).__init__(player_connection)
+        self.supports_smartquotes = False
+        self.output_lines = 0
+        self.output_chars = 0
+
+    def render_output(self, paragraphs, **params):
+        if not paragraphs:
+            return None
+        return "\n".join(strip_text_styles(text) for text, formatted in paragraphs) + "\n"
+
+    def output(self, *lines):
+        super(NullIo, self).output(*lines)
+        self.output_lines += len(lines)
+        self.output_chars += sum(len(line) for line in lines)
+
+    def output_no_newline(self, text):
+        super(NullIo, self).output_no_newline(text)
+        self.output_chars += len(text)
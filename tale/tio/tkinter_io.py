@@ -98,6 +98,13 @@ class TkinterIo(iobase.IoAdapterBase):
         super(TkinterIo, self).output_no_newline(text)
         self.gui.write_line(text)
 
+    def output_paced(self, text, line_delay):
+        """Write the lines of the text with a delay after each line, the gui schedules this."""
+        lines = text.splitlines()
+        super(TkinterIo, self).output(*lines)
+        for line in lines:
+            self.gui.write_line(line, line_delay)
+
 
 class TaleWindow(Toplevel):
     """The actual gui-window, containing the output text and the input command bar."""
@@ -290,6 +297,9 @@ class TaleGUI(object):
         self.root.withdraw()
         self.root.update()
         self.install_tab_completion()
+        self.pending_lines = collections.deque()   # (line, delay) to be written by the gui thread
+        self.pending_lines_lock = threading.Lock()
+        self.writing_lines = False
 
     def install_tab_completion(self):
         def tab_pressed(event):
@@ -341,9 +351,28 @@ class TaleGUI(object):
         if self.root:
             self.root.after_idle(lambda: self.window.clear_text())
 
-    def write_line(self, line):
+    def write_line(self, line, delay=0):
+        """Write a line (from any thread). If a delay (milliseconds) is given, the next line is written after that time."""
         if self.root:
-            self.root.after_idle(lambda: self.window.write_line(line, self.io.do_styles))
+            with self.pending_lines_lock:
+                self.pending_lines.append((line, delay))
+                if self.writing_lines:
+                    return
+                self.writing_lines = True
+            self.root.after_idle(self.write_pending_lines)
+
+    def write_pending_lines(self):
+        # runs in the gui thread
+        while self.window:
+            with self.pending_lines_lock:
+                if not self.pending_lines:
+                    self.writing_lines = False
+                    return
+                line, delay = self.pending_lines.popleft()
+            self.window.write_line(line, self.io.do_styles)
+            if delay:
+                self.root.after(delay, self.write_pending_lines)
+                return
 
     def register_cmd(self, cmd):
         self.io.player_connection.player.store_input_line(cmd)
@@ -1,6 +1,7 @@
 # coding=utf-8
 """
-Virtual file system.
+Virtual file system, with an optional cache of the resources that are read.
+Large resources can also be read as a stream (open_read) or memory mapped (mmap_read).
 
 'Tale' mud driver, mudlib and interactive fiction framework
 Copyright by Irmen de Jong (irmen@razorvine.net)
@@ -10,7 +11,12 @@ from __future__ import absolute_import, print_function, division, unicode_litera
 import os
 import io
 import sys
+import time
+import mmap
 import errno
+import zipfile
+import threading
+import collections
 import mimetypes
 import pkgutil
 
@@ -45,13 +51,21 @@ class VirtualFileSystem(object):
     Simple filesystem abstraction. Loads resource files embedded inside a package directory.
     If not readonly, you can write data as well. The API is loosely based on a dict.
     Can be based off an already imported module, or from a file system path somewhere else.
+    If cache_size is set (in bytes), the resources that are read are kept in a least-recently-used cache.
+    A cached resource is checked against the modification time of its file at most every revalidate seconds.
     """
-    def __init__(self, root_package=None, root_path=None, readonly=True):
+    def __init__(self, root_package=None, root_path=None, readonly=True, cache_size=0, revalidate=5.0):
         if root_package is not None and root_path is not None:
             raise ValueError("specify only one root argument")
         if not readonly and not root_path:
             raise ValueError("Read-write vfs requires path string")
         self.readonly = readonly
+        self.cache_size = cache_size
+        self.revalidate = revalidate
+        self.cache = collections.OrderedDict()   # name -> (resource, size, time of last validation), least recently used first
+        self.cache_used = 0
+        self.cache_stats = {"hits": 0, "misses": 0, "revalidations": 0, "evictions": 0}
+        self.cache_lock = threading.Lock()   # the vfs is also used from the web server and i/o executor threads
         if root_path:
             self.root = os.path.abspath(os.path.normpath(root_path))
             self.use_pkgutil = False
@@ -91,6 +105,90 @@ class VirtualFileSystem(object):
 
     def __getitem__(self, name):
         """Reads the resource data (text or binary) for the given name and returns it as a Resource object"""
+        if not self.cache_size:
+            return self._read(name)
+        now = time.time()
+        with self.cache_lock:
+            entry = self.cache.pop(name, None)
+            if entry:
+                self.cache[name] = entry   # it's now the most recently used
+                resource, size, validated = entry
+                if now - validated < self.revalidate or resource.mtime is None:
+                    self.cache_stats["hits"] += 1
+                    return resource
+        if entry and resource.mtime == self.mtime(name):
+            with self.cache_lock:
+                if name in self.cache:
+                    self.cache[name] = (resource, size, now)
+                self.cache_stats["revalidations"] += 1
+            return resource
+        with self.cache_lock:
+            self.cache_stats["misses"] += 1
+        resource = self._read(name)
+        self._cache_store(name, resource, now)
+        return resource
+
+    def _cache_store(self, name, resource, now):
+        size = len(resource.data)
+        if size > self.cache_size:
+            return
+        with self.cache_lock:
+            old = self.cache.pop(name, None)
+            if old:
+                self.cache_used -= old[1]
+            while self.cache and self.cache_used + size > self.cache_size:
+                _, (_, evicted_size, _) = self.cache.popitem(last=False)
+                self.cache_used -= evicted_size
+                self.cache_stats["evictions"] += 1
+            self.cache[name] = (resource, size, now)
+            self.cache_used += size
+
+    def invalidate(self, name=None):
+        """Removes the given resource from the cache (or all of them, if no name is given)"""
+        with self.cache_lock:
+            if name is None:
+                self.cache.clear()
+                self.cache_used = 0
+            else:
+                entry = self.cache.pop(name, None)
+                if entry:
+                    self.cache_used -= entry[1]
+
+    def cache_statistics(self):
+        """dict with the number of cache hits, misses, revalidations and evictions, and the number and total size of the cached resources"""
+        with self.cache_lock:
+            stats = dict(self.cache_stats)
+            stats["entries"] = len(self.cache)
+            stats["size"] = self.cache_used
+        return stats
+
+    def _package_path(self, name):
+        """the path of the resource inside the root package"""
+        parts = name.split('/')
+        parts.insert(0, os.path.dirname(sys.modules[self.root].__file__))
+        return os.path.join(*parts)
+
+    def mtime(self, name):
+        """the modification time of the resource's file, None if it is unknown or if the file doesn't exist"""
+        try:
+            if not self.use_pkgutil:
+                return os.path.getmtime(self.validate_path(name))
+            loader = pkgutil.get_loader(self.root)
+            if hasattr(loader, "path_stats"):
+                # this method only exists in Python 3.3 or newer...
+                return loader.path_stats(self._package_path(name))["mtime"]
+            return os.path.getmtime(self._package_path(name))   # fails if the package is in a zip file
+        except (IOError, OSError):
+            return None
+
+    def size(self, name):
+        """the size of the resource's file, None if it is unknown (such as for a resource inside a zip file)"""
+        try:
+            return os.path.getsize(self._package_path(name) if self.use_pkgutil else self.validate_path(name))
+        except (IOError, OSError):
+            return None
+
+    def _read(self, name):
         phys_path = self.validate_path(name)
         mimetype = mimetypes.guess_type(name)[0] or ""
         if mimetype.startswith("text/"):
@@ -104,14 +202,8 @@ class VirtualFileSystem(object):
             # we can't use pkgutil.get_data directly, because we also need the mtime
             # so we do some of the work that get_data does ourselves...
             loader = pkgutil.get_loader(self.root)
-            rootmodule = sys.modules[self.root]
-            parts = name.split('/')
-            parts.insert(0, os.path.dirname(rootmodule.__file__))
-            name = os.path.join(*parts)
-            mtime = None
-            if hasattr(loader, "path_stats"):
-                # this method only exists in Python 3.3 or newer...
-                mtime = loader.path_stats(name)["mtime"]
+            mtime = self.mtime(name)
+            name = self._package_path(name)
             data = loader.get_data(name)
             if encoding:
                 with io.StringIO(data.decode(encoding), newline=None) as f:
@@ -124,6 +216,50 @@ class VirtualFileSystem(object):
                 mtime = os.path.getmtime(phys_path)  # os.fstat(f.fileno()).st_mtime
                 return Resource(name, f.read(), mimetype, mtime)
 
+    def open_read(self, name, binary=None):
+        """
+        Returns a readable stream of the resource, so that it doesn't have to be read in memory at once.
+        It's a text stream (utf-8) or a binary stream depending on the mime type, unless binary is given.
+        A resource of a package inside a zip file is decompressed in chunks while it is read.
+        """
+        phys_path = self.validate_path(name)
+        if binary is None:
+            binary = not (mimetypes.guess_type(name)[0] or "").startswith("text/")
+        stream = self._open_package_resource(name) if self.use_pkgutil else io.open(phys_path, "rb")
+        return stream if binary else io.TextIOWrapper(stream, encoding="utf-8", newline=None)
+
+    def _open_package_resource(self, name):
+        path = self._package_path(name)
+        if os.path.isfile(path):
+            return io.open(path, "rb")
+        loader = pkgutil.get_loader(self.root)
+        archive = getattr(loader, "archive", None)
+        if archive:
+            # the package is in a zip file (zipimport)
+            member = os.path.relpath(path, archive).replace(os.sep, "/")
+            with zipfile.ZipFile(archive) as zipped:
+                try:
+                    return zipped.open(member)   # (it stays readable after the zip file is closed)
+                except KeyError:
+                    raise VfsError(errno.ENOENT, "resource not found", name)
+        return io.BytesIO(loader.get_data(path))
+
+    def mmap_read(self, name):
+        """
+        Returns a read-only memory map of the resource's file (a bytes-like object: use slicing, find, len etc.)
+        The operating system pages in the data when it is accessed. Close the map when you're done with it.
+        Only possible for resources that are a file on disk (not inside a zip file), and not empty.
+        """
+        phys_path = self.validate_path(name)
+        if self.use_pkgutil:
+            phys_path = self._package_path(name)
+            if not os.path.isfile(phys_path) and getattr(pkgutil.get_loader(self.root), "archive", None):
+                raise VfsError("can't memory map a resource inside a zip file, use open_read instead")
+        with io.open(phys_path, "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                raise VfsError("can't memory map an empty file")
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
     def __setitem__(self, name, data):
         """
         Stores the data on the given resource name.
@@ -137,12 +273,14 @@ class VirtualFileSystem(object):
             data = data.data
         with self.open_write(name) as f:
             f.write(data)
+        self.invalidate(name)
 
     def __delitem__(self, name):
         """Deletes the given resource"""
         if self.readonly:
             raise VfsError("attempt to write a read-only vfs")
         phys_path = self.validate_path(name)
+        self.invalidate(name)
         try:
             os.remove(phys_path)
         except IOError:
@@ -153,6 +291,7 @@ class VirtualFileSystem(object):
         if self.readonly:
             raise VfsError("attempt to write to a read-only vfs")
         phys_path = self.validate_path(name)
+        self.invalidate(name)
         dirname = os.path.dirname(phys_path)
         try:
             if dirname:
@@ -167,4 +306,4 @@ class VirtualFileSystem(object):
 
 
 # create a readonly resource loader for Tale's own internal resources:
-internal_resources = VirtualFileSystem(root_package="tale")
+internal_resources = VirtualFileSystem(root_package="tale", cache_size=2 * 1024 * 1024)
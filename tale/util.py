@@ -22,6 +22,12 @@ if sys.version_info < (3, 0):
 
     def next_iter(iterable):
         return iterable.next()
+
+    _interned = {}
+
+    def intern_str(string):
+        """intern a (unicode) string, python 2's intern() doesn't accept those"""
+        return _interned.setdefault(string, string)
 else:
     basestring_type = str
     import queue
@@ -29,6 +35,8 @@ else:
     def next_iter(iterable):
         return next(iterable)
 
+    intern_str = sys.intern
+
 
 def roll_dice(number=1, sides=6):
     """rolls a number (max 300) of dice with configurable number of sides"""
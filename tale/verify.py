@@ -0,0 +1,174 @@
+# coding=utf-8
+"""
+Story verification (the driver's --verify mode).
+After the story and its zones have been loaded, a number of independent checks are done on
+the resulting game world. They run concurrently in a small thread pool.
+Errors are problems that will break the game, warnings are things that are probably a mistake.
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import absolute_import, print_function, division, unicode_literals
+import sys
+import json
+import time
+from multiprocessing.pool import ThreadPool
+from . import base, shop
+from .items.board import BulletinBoard
+
+__all__ = ["verify_world", "print_report", "VerificationResult"]
+
+
+class VerificationResult(object):
+    """The problems found by a check, and the time it took"""
+    def __init__(self, name):
+        self.name = name
+        self.errors = []
+        self.warnings = []
+        self.duration = 0.0
+
+
+def all_locations(driver):
+    """
+    All locations of the story: the ones defined in its zone modules (directly, or in a dict),
+    the start locations, and everything that can be reached from those. Limbo is excluded.
+    """
+    found = set([driver.config.startlocation_player, driver.config.startlocation_wizard])
+    for name, module in list(sys.modules.items()):
+        if module is None or not (name == "zones" or name.startswith("zones.")):
+            continue
+        for value in vars(module).values():
+            if isinstance(value, base.Location):
+                found.add(value)
+            elif isinstance(value, dict):
+                found.update(v for v in value.values() if isinstance(v, base.Location))
+    for location in list(found):
+        found.update(reached for reached, _, _ in driver.exit_graph.nearby(location, float("inf")))
+    found.discard(base._limbo)
+    return list(found)
+
+
+def verify_world(driver, locations=None, parallel=True):
+    """
+    Run all checks on the game world (or only on the given locations).
+    Returns a list of VerificationResults.
+    """
+    if locations is None:
+        locations = all_locations(driver)
+    checks = [("exit binding", check_exits), ("connectivity", check_connectivity),
+              ("shops", check_shops), ("bulletin boards", check_boards)]
+
+    def run(name_check):
+        name, check = name_check
+        result = VerificationResult(name)
+        start = time.time()
+        check(driver, locations, result)
+        result.duration = time.time() - start
+        return result
+
+    if parallel:
+        pool = ThreadPool(len(checks))
+        try:
+            return pool.map(run, checks)
+        finally:
+            pool.close()
+            pool.join()
+    return [run(check) for check in checks]
+
+
+def print_report(driver, results):
+    """Print the load times and the verification results. Returns the total number of errors."""
+    print("Load times:")
+    for phase, duration in driver.startup_times:
+        print("  %-20s %.3f sec." % (phase, duration))
+    print("Checks:")
+    for result in results:
+        print("  %-20s %.3f sec.  %d errors, %d warnings" % (result.name, result.duration, len(result.errors), len(result.warnings)))
+    for result in results:
+        for warning in result.warnings:
+            print("WARNING (%s): %s" % (result.name, warning))
+    for result in results:
+        for error in result.errors:
+            print("ERROR (%s): %s" % (result.name, error))
+    return sum(len(result.errors) for result in results)
+
+
+def _names(locations, maximum=5):
+    names = sorted(location.name for location in locations)
+    if len(names) > maximum:
+        names = names[:maximum] + ["..."]
+    return ", ".join(names)
+
+
+def check_exits(driver, locations, result):
+    """every exit must be bound to a location that exists"""
+    for location in locations:
+        for direction, exit in location.exits.items():
+            if not exit.bound:
+                result.errors.append("exit '%s' in %s is not bound (target: %s)" % (direction, location.name, exit.target))
+            elif not exit.target_built:
+                continue   # the target will be created when it's first needed
+            elif not isinstance(exit.target, base.Location):
+                result.errors.append("exit '%s' in %s doesn't lead to a location but to %r" % (direction, location.name, exit.target))
+            elif exit.target is base._limbo:
+                result.warnings.append("exit '%s' in %s leads to Limbo" % (direction, location.name))
+
+
+def check_connectivity(driver, locations, result):
+    """all locations should be reachable from the start locations (closed doors are assumed to be openable)"""
+    reachable = set()
+    for start in (driver.config.startlocation_player, driver.config.startlocation_wizard):
+        if start not in reachable:
+            reachable.add(start)
+            reachable.update(location for location, _, _ in driver.exit_graph.nearby(start, float("inf")))
+    unreachable = [location for location in locations if location not in reachable]
+    if unreachable:
+        result.warnings.append("%d locations can't be reached from the start locations: %s" % (len(unreachable), _names(unreachable)))
+    traps = [location for location in reachable if not location.exits and location is not base._limbo]
+    if traps:
+        result.warnings.append("%d locations have no exits: %s" % (len(traps), _names(traps)))
+
+
+def check_shops(driver, locations, result):
+    """the shop data of the shopkeepers must be consistent"""
+    for location in locations:
+        for keeper in location.livings:
+            if not isinstance(keeper, shop.Shopkeeper):
+                continue
+            name = "shopkeeper %s in %s" % (keeper.name, location.name)
+            data = keeper.shop
+            if data.buyprofit > data.sellprofit:
+                result.errors.append("%s buys items for more than it sells them" % name)
+            for hours in data.open_hours:
+                if len(hours) != 2 or not 0 <= hours[0] <= 23 or not 0 <= hours[1] <= 24 or hours[0] == hours[1]:
+                    result.errors.append("%s has invalid opening hours: %s" % (name, hours))
+            titles_in_stock = set(item.title for item in keeper.inventory)
+            for item in data.forsale:
+                if not isinstance(item, base.Item):
+                    result.errors.append("%s sells something that is not an item: %r" % (name, item))
+                elif item.title not in titles_in_stock:
+                    result.errors.append("%s has '%s' for sale that is not in its inventory" % (name, item.name))
+                elif item.value <= 0:
+                    result.warnings.append("%s sells '%s' for nothing" % (name, item.name))
+
+
+def check_boards(driver, locations, result):
+    """the storage of the bulletin boards must be readable"""
+    for location in locations:
+        for board in location.items:
+            if not isinstance(board, BulletinBoard) or not board.storage_file:
+                continue
+            name = "bulletin board '%s' in %s" % (board.name, location.name)
+            if driver.user_resources is None or driver.user_resources.readonly:
+                result.errors.append("%s can't store its messages: no writable user resources" % name)
+                continue
+            try:
+                data = json.loads(driver.user_resources[board.storage_file].data.decode("UTF-8"))
+            except IOError:
+                continue    # no messages have been posted yet
+            except ValueError as x:
+                result.errors.append("%s has a corrupt storage file %s: %s" % (name, board.storage_file, x))
+                continue
+            if not isinstance(data, dict) or not isinstance(data.get("posts"), list):
+                result.errors.append("%s has no posts in its storage file %s" % (name, board.storage_file))
@@ -32,8 +32,13 @@ function poll_text() {
             if(json["text"]) {
                 document.getElementById("player-location").innerHTML = json["location"];
                 // document.getElementById("player-turns").innerHTML = json["turns"];
-                txtdiv.innerHTML += json["text"];
-                smoothscroll(txtdiv, 0);
+                if(json["delay"]) {
+                    for(var i=0; i<json["lines"].length; i++) {
+                        queue_output(txtdiv, json["lines"][i], json["delay"]);
+                    }
+                } else {
+                    queue_output(txtdiv, json["text"], 0);
+                }
             }
         }
     }
@@ -47,6 +52,31 @@ function poll_text() {
     ajax.send(null);
 }
 
+// text is shown in order, text that has a delay makes the text after it wait for that long
+document.output_queue = [];
+document.output_busy = false;
+
+function queue_output(div, html, delay) {
+    document.output_queue.push([html, delay]);
+    if(!document.output_busy) {
+        write_output(div);
+    }
+}
+
+function write_output(div) {
+    while(document.output_queue.length > 0) {
+        var item = document.output_queue.shift();
+        div.innerHTML += item[0];
+        smoothscroll(div, 0);
+        if(item[1] > 0) {
+            document.output_busy = true;
+            setTimeout(function(){write_output(div);}, item[1]);
+            return;
+        }
+    }
+    document.output_busy = false;
+}
+
 function smoothscroll(div, previousTop) {
     if(div.scrollTop < div.scrollHeight) {
         div.scrollTop += 3;
@@ -0,0 +1,50 @@
+"""
+Benchmark of the spawn rate of base.clone compared to a plain copy.deepcopy.
+Run with: python -m tests.benchmark_clone
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+import copy
+import time
+from tale import mud_context, base, npc
+from tale.items.basic import Boxlike
+from tests.supportstuff import TestDriver
+
+
+def make_prototypes():
+    sword = base.Weapon("sword", "sharp sword", description="A long and very sharp sword. " * 10, short_description="A sword lies here.")
+    sword.aliases = {"blade", "longsword", "weapon"}
+    sword.add_extradesc(["hilt", "handle"], "The hilt is decorated with small gems. " * 5)
+    sword.add_extradesc(["blade"], "The blade has some ancient runes on it. " * 5)
+    box = Boxlike("box", "wooden box", description="A sturdy wooden box with iron fittings. " * 5)
+    box.verbs = {"kick": "kick the box", "shake": "shake the box"}
+    rat = npc.NPC("rat", "n", race="rodent", title="big brown rat", description="It looks hungry. " * 10)
+    rat.aliases = {"rodent", "vermin"}
+    rat.add_extradesc(["tail"], "The long tail is pink and hairless.")
+    return sword, box, rat
+
+
+def spawn_rate(clone_func, prototype, duration=1.0):
+    count = 0
+    start = time.time()
+    while time.time() - start < duration:
+        for _ in range(100):
+            clone_func(prototype)
+        count += 100
+    return count / (time.time() - start)
+
+
+def main():
+    mud_context.driver = TestDriver()
+    print("Spawns per second:")
+    print("%-10s %12s %12s" % ("prototype", "deepcopy", "clone"))
+    for prototype in make_prototypes():
+        deepcopied = spawn_rate(copy.deepcopy, prototype)
+        cloned = spawn_rate(base.clone, prototype)
+        print("%-10s %12.0f %12.0f   (%.1fx)" % (prototype.name, deepcopied, cloned, cloned / deepcopied))
+
+
+if __name__ == "__main__":
+    main()
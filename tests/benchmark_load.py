@@ -0,0 +1,170 @@
+"""
+End to end load benchmark: boots the driver in mud mode with the demo or the Circle story,
+connects a number of synthetic players (that use a null i/o adapter) and lets them play
+a scripted mix of commands: movement, emotes, look, shopping and bulletin boards.
+Every round, all players enter a command and then a server tick is done.
+Reports the number of commands per second, the durations of the server tick and
+the commands, and the memory use. Use --json to get the results in machine readable form.
+Run with: python -m tests.benchmark_load [--story circle] [--players 50] [--rounds 200] [--json results.json]
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from tale import pubsub
+from tale.driver import Driver
+from tale.player import Player, PlayerConnection
+from tale.items.board import BulletinBoard
+from tale.shop import Shopkeeper
+from tale.tio.null_io import NullIo
+try:
+    import resource
+except ImportError:
+    resource = None     # not available on windows
+
+stories = {
+    "demo": os.path.join(os.path.dirname(__file__), "..", "stories", "demo"),
+    "circle": os.path.join(os.path.dirname(__file__), "..", "stories", "circle")
+}
+emotes = ["smile", "nod", "wave", "grin", "shrug", "laugh", "yawn", "bow"]
+
+
+def boot(story):
+    """Load the story in mud mode (without starting the web server and the main loop)"""
+    driver = Driver()
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        driver.start(["-g", os.path.abspath(stories[story]), "-m", "mud", "--verify"])
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    driver.profiler.enable()
+    driver.profiler.reset()   # forget the timings of the startup
+    return driver
+
+
+def connect_players(driver, amount):
+    connections = []
+    for num in range(amount):
+        conn = PlayerConnection()
+        conn.player = Player("bot%d" % num, random.choice("mf"), "human")
+        conn.player.money = 1000.0
+        conn.io = NullIo(conn)
+        driver.all_players[conn.player.name] = conn
+        conn.player.move(driver.config.startlocation_player, silent=True)
+        connections.append(conn)
+    return connections
+
+
+def next_command(player, rnd):
+    """The next command of the scripted command mix, depending on where the player is"""
+    location = player.location
+    choice = rnd.random()
+    if choice < 0.4 and location.exits:
+        return rnd.choice(sorted(location.exits))
+    if choice < 0.55:
+        return rnd.choice(emotes)
+    if choice < 0.65:
+        return "look"
+    if choice < 0.75:
+        if any(isinstance(living, Shopkeeper) for living in location.livings):
+            return "list"
+        return "inventory"
+    if choice < 0.8:
+        if any(isinstance(item, BulletinBoard) for item in location.items):
+            return "read board"
+        return "say hello"
+    things = [thing.name for thing in list(location.items) + list(location.livings) if thing is not player]
+    return "examine " + rnd.choice(things) if things else "look"
+
+
+def run(driver, connections, rounds, seed=42):
+    """Every round, every player enters a command and then a server tick is done. Returns the duration."""
+    rnd = random.Random(seed)
+    # the driver's main loop does all this, but it also waits for the server tick time (we don't want that)
+    process_input = driver._Driver__server_loop_process_player_input
+    server_tick = driver._Driver__server_tick
+    errors = 0
+    start = time.time()
+    for _ in range(rounds):
+        for conn in connections:
+            conn.player.store_input_line(next_command(conn.player, rnd))
+            try:
+                process_input(conn)
+            except Exception:
+                errors += 1
+        pubsub.sync("driver-pending-tells")
+        server_tick()
+    return time.time() - start, errors
+
+
+def max_memory():
+    """peak memory use of the process in Mb (or None if unknown)"""
+    if not resource:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024   # bytes on osx, Kb elsewhere
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Load benchmark: synthetic players play a story in mud mode.")
+    parser.add_argument("-s", "--story", help="the story to load", choices=sorted(stories), default="demo")
+    parser.add_argument("-p", "--players", type=int, help="number of players", default=50)
+    parser.add_argument("-r", "--rounds", type=int, help="number of rounds (every player enters a command, then a tick is done)", default=200)
+    parser.add_argument("-j", "--json", help="write the results as json to this file ('-' is the screen)")
+    args = parser.parse_args(args)
+    cwd = os.getcwd()
+    boot_start = time.time()
+    driver = boot(args.story)
+    boot_duration = time.time() - boot_start
+    connections = connect_players(driver, args.players)
+    duration, errors = run(driver, connections, args.rounds)
+    os.chdir(cwd)   # the driver moved into the story directory
+    timings = driver.profiler.statistics()["timings"]
+    num_commands = args.players * args.rounds
+    verbs = dict((name[5:], stats) for name, stats in timings.items() if name.startswith("verb."))
+    results = {
+        "python": "%d.%d.%d" % sys.version_info[:3],
+        "story": args.story,
+        "players": args.players,
+        "rounds": args.rounds,
+        "boot_seconds": boot_duration,
+        "seconds": duration,
+        "commands": num_commands,
+        "commands_per_second": num_commands / duration,
+        "errors": errors,
+        "output_chars": sum(conn.io.output_chars for conn in connections),
+        "max_memory_mb": max_memory(),
+        "tick": timings.get("tick"),
+        "command": timings.get("command"),
+        "verbs": verbs
+    }
+    if args.json:
+        if args.json == "-":
+            print(json.dumps(results, indent=2, sort_keys=True))
+        else:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+    if args.json != "-":
+        print("Python %s, story '%s', %d players, %d rounds." % (results["python"], args.story, args.players, args.rounds))
+        print("Boot time:         %.2f sec." % boot_duration)
+        print("Commands:          %d in %.2f sec. = %.0f commands/sec.  (%d errors)" % (num_commands, duration, results["commands_per_second"], errors))
+        for name in ("tick", "command"):
+            stats = timings[name]
+            print("%-18s p50 %.2f ms, p95 %.2f ms, p99 %.2f ms, max %.2f ms" %
+                  (name.capitalize() + ":", stats["p50"] * 1000, stats["p95"] * 1000, stats["p99"] * 1000, stats["max"] * 1000))
+        if results["max_memory_mb"]:
+            print("Peak memory:       %.1f Mb" % results["max_memory_mb"])
+        print("Slowest verbs (p95):")
+        for verb in sorted(verbs, key=lambda verb: verbs[verb]["p95"], reverse=True)[:5]:
+            print("  %-12s %.2f ms  (%d times)" % (verb, verbs[verb]["p95"] * 1000, verbs[verb]["count"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Memory benchmark: boots the full Circle world (in verify mode) and reports
+the memory that is in use afterwards, and how it is distributed over the mud objects.
+Requires the tracemalloc module (python 3.4+).
+Run with: python -m tests.benchmark_memory
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+from __future__ import print_function, division, unicode_literals, absolute_import
+import gc
+import os
+import sys
+import tracemalloc
+from collections import Counter
+
+
+def main():
+    tracemalloc.start()
+    from tale.driver import Driver
+    from tale import base
+    driver = Driver()
+    driver.start(["-g", os.path.join(os.path.dirname(__file__), "..", "stories", "circle"), "-m", "mud", "--verify"])
+    gc.collect()
+    total = tracemalloc.get_traced_memory()[0]
+    snapshot = tracemalloc.take_snapshot()
+    counts = Counter()
+    for obj in gc.get_objects():
+        if isinstance(obj, base.MudObject):
+            for cls in (base.Location, base.Exit, base.Item, base.Living):
+                if isinstance(obj, cls):
+                    counts[cls.__name__] += 1
+    print("\nPython %d.%d, Circle world loaded." % sys.version_info[:2])
+    print("Mud objects: " + ", ".join("%d %ss" % (counts[name], name) for name in sorted(counts)))
+    print("Total memory in use: %.1f Mb" % (total / 1024 / 1024))
+    mudlib_file = os.path.abspath(base.__file__)
+    base_statistics = snapshot.filter_traces([tracemalloc.Filter(True, mudlib_file)]).statistics("lineno")
+    print("Allocated by tale.base: %.1f Mb. Top 10 lines:" % (sum(stat.size for stat in base_statistics) / 1024 / 1024))
+    for stat in base_statistics[:10]:
+        frame = stat.traceback[0]
+        print("  line %4d: %7.1f Kb in %5d blocks" % (frame.lineno, stat.size / 1024, stat.count))
+
+
+if __name__ == "__main__":
+    main()
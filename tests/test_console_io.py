@@ -8,6 +8,7 @@ from __future__ import absolute_import, print_function, division, unicode_litera
 import unittest
 import sys
 import io
+import time
 from tale.tio import console_io, styleaware_wrapper, iobase
 from tale.player import TextBuffer
 
@@ -26,6 +27,18 @@ class TestConsoleIo(unittest.TestCase):
         io.break_pressed()
         io.output("line1", "line2")
 
+    def test_paced_output(self):
+        io = console_io.ConsoleIo(None)
+        io.do_styles = False
+        start = time.time()
+        io.output_paced("line1\nline2\nline3", 50)
+        io.output("after")
+        self.assertLess(time.time() - start, 0.05, "paced output must not block")
+        io.destroy()
+        self.assertGreaterEqual(time.time() - start, 0.1)
+        self.assertEqual("line1\nline2\nline3\nafter\n", sys.stdout.getvalue())
+        self.assertEqual("after", io.last_output_line)
+
     def test_text(self):
         output = TextBuffer()
         output.print("one two three four five six seven")
@@ -10,17 +10,27 @@ import unittest
 import heapq
 import datetime
 import os
+import sys
 import inspect
 import pickle
 import tale.driver as the_driver
 import tale.cmds.normal
 import tale.cmds.wizard
 import tale.base
+import tale.errors
 import tale.util
+import tale.story
+import tale.player
 import tale.demo
 from tale.cmds.decorators import cmd, wizcmd, disabled_in_gamemode
+from tale.tio.null_io import NullIo
 from tests.supportstuff import Thing
 
+if sys.version_info < (3, 0):
+    from StringIO import StringIO
+else:
+    from io import StringIO
+
 
 def module_level_func(ctx):
     assert ctx is not None
@@ -152,17 +162,106 @@ class TestVarious(unittest.TestCase):
         self.assertGreater(len(tale.cmds.wizard.all_commands), 1)
 
     def testEnableNotifyActionSetAndDocstring(self):
-        for cmd in tale.cmds.normal.all_commands.values():
-            self.assertIsNotNone(cmd.__doc__, "all commands must have docstring")
-            self.assertTrue(cmd.enable_notify_action in (True, False))
-        for cmd in tale.cmds.wizard.all_commands.values():
-            self.assertIsNotNone(cmd.__doc__, "all commands must have docstring")
-            self.assertFalse(cmd.enable_notify_action, "all wizard commands must have enable_notify_action set to False")
+        for command in tale.cmds.normal.all_commands.values():
+            self.assertIsNotNone(command.__doc__, "all commands must have docstring")
+            self.assertTrue(command.enable_notify_action in (True, False))
+        for command in tale.cmds.wizard.all_commands.values():
+            self.assertIsNotNone(command.__doc__, "all commands must have docstring")
+            self.assertFalse(command.enable_notify_action, "all wizard commands must have enable_notify_action set to False")
 
     def testStoryVerify(self):
         gamedir = os.path.dirname(inspect.getabsfile(tale.demo))
         d = the_driver.Driver()
-        d.start(["--game", gamedir, "--verify"])
+        stdout, sys.stdout = sys.stdout, StringIO()   # the verification report is printed
+        try:
+            d.start(["--game", gamedir, "--verify"])
+            report = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertIn("Verified, all seems to be fine.", report)
+
+    def testBindExits(self):
+        d = the_driver.Driver()
+        tale.mud_context.driver = d
+        square = tale.base.Location("square")
+        d.zone_locations["testtown.square"] = square
+        exit1 = tale.base.Exit("square", "testtown.square", "to the square")
+        exit2 = tale.base.Exit("north", "testtown.nowhere", "to nowhere")
+        exit3 = tale.base.Exit("up", "testmoon.base", "to the moon")
+        with self.assertRaises(tale.errors.LocationIntegrityError) as x:
+            d.bind_exits()
+        self.assertTrue(exit1.bound)
+        self.assertIs(square, exit1.target)
+        self.assertFalse(exit2.bound or exit3.bound)
+        self.assertIn("testmoon.base (exit: 'to the moon'); testtown.nowhere (exit: 'to nowhere')", str(x.exception))
+
+
+class Ticker(tale.base.Item):
+    heartbeat_skippable = True
+
+    def init(self):
+        self.beats = 0
+
+    def heartbeat(self, ctx):
+        self.beats += 1
+
+    def skip_heartbeats(self, ctx, beats):
+        self.beats += beats
+
+
+class TestWait(unittest.TestCase):
+    def setUp(self):
+        self.driver = the_driver.Driver()
+        tale.mud_context.driver = self.driver
+        self.driver.config = tale.story.Storybase()._get_config()
+        self.driver.config.server_mode = "if"
+        self.driver.config.server_tick_time = 1.0
+        self.driver.config.gametime_to_realtime = 5
+        self.start = datetime.datetime(2016, 1, 1, 12, 0, 0)
+        self.driver.game_clock = tale.util.GameDateTime(self.start, 5)
+        self.player = tale.player.Player("julie", "f")
+        self.player.move(tale.base.Location("room"), silent=True)
+        conn = tale.player.PlayerConnection(self.player)
+        conn.io = NullIo(conn)
+        self.driver.all_players["julie"] = conn
+        self.driver.profiler.enable()   # to count the ticks
+
+    @property
+    def ticks(self):
+        return self.driver.profiler.statistics()["timings"]["tick"]["count"]
+
+    def testTooShort(self):
+        self.assertEqual((False, "It's no use waiting such a short while."), self.driver.do_wait(datetime.timedelta(seconds=4)))
+        self.assertFalse(self.driver.profiler.timings)
+
+    def testSkipTicks(self):
+        ticker = Ticker("ticker")
+        self.driver.register_heartbeat(ticker)
+        self.assertEqual((True, None), self.driver.do_wait(datetime.timedelta(minutes=10)))
+        self.assertEqual(1, self.ticks)
+        self.assertEqual(120, ticker.beats)
+        self.assertEqual(self.start + datetime.timedelta(minutes=10), self.driver.game_clock.clock)
+
+    def testTickForDeferreds(self):
+        self.driver.defer(self.start + datetime.timedelta(minutes=3), module_level_func)
+        self.driver.defer(self.start + datetime.timedelta(minutes=4, seconds=2), module_level_func)
+        self.assertEqual((True, None), self.driver.do_wait(datetime.timedelta(minutes=10)))
+        self.assertEqual(3, self.ticks)
+        self.assertEqual(self.start + datetime.timedelta(minutes=10), self.driver.game_clock.clock)
+
+    def testNoSkipping(self):
+        ticker = Ticker("ticker")
+        ticker.heartbeat_skippable = False
+        self.driver.register_heartbeat(ticker)
+        self.assertEqual((True, None), self.driver.do_wait(datetime.timedelta(minutes=10)))
+        self.assertEqual(120, self.ticks)
+
+    def testEventful(self):
+        self.driver.defer(self.start + datetime.timedelta(minutes=3), self.player.tell, "A bird flies by.")
+        ok, message = self.driver.do_wait(datetime.timedelta(minutes=10))
+        self.assertFalse(ok)
+        self.assertEqual("You stop waiting after 3 minutes.", message)
+        self.assertEqual(self.start + datetime.timedelta(minutes=3), self.driver.game_clock.clock)
 
 
 @cmd
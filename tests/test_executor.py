@@ -0,0 +1,51 @@
+"""
+Unittests for the i/o executor
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import print_function, division, unicode_literals, absolute_import
+import time
+import threading
+import unittest
+from tale.executor import IoExecutor
+
+
+class TestIoExecutor(unittest.TestCase):
+    def test_callbacks(self):
+        executor = IoExecutor(2)
+        results = []
+        executor.submit(lambda: 42, callback=lambda result, exception: results.append((result, exception)))
+        executor.submit(lambda: 1 // 0, callback=lambda result, exception: results.append((result, type(exception))))
+        executor.flush()
+        self.assertEqual([], results, "callbacks are only called by run_callbacks")
+        self.assertTrue(executor.has_completed())
+        executor.run_callbacks()
+        self.assertFalse(executor.has_completed())
+        self.assertEqual([(42, None), (None, ZeroDivisionError)], sorted(results, key=lambda r: r[0] is None))
+        executor.shutdown()
+
+    def test_keyed_order(self):
+        executor = IoExecutor(4)
+        written = []
+        for num in range(50):
+            executor.submit(lambda num=num: written.append(num), key="board.json")
+        executor.shutdown()
+        self.assertEqual(list(range(50)), written)
+        self.assertEqual([], executor.threads)
+
+    def test_not_blocked_by_busy_thread(self):
+        executor = IoExecutor(2)
+        release = threading.Event()
+        executor.submit(release.wait)
+        time.sleep(0.05)
+        done = threading.Event()
+        executor.submit(done.set)
+        self.assertTrue(done.wait(2), "work should go to the idle thread")
+        release.set()
+        executor.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,9 +6,15 @@ Copyright by Irmen de Jong (irmen@razorvine.net)
 """
 from __future__ import print_function, division, unicode_literals, absolute_import
 import datetime
+import json
+import os
+import shutil
+import tempfile
 import unittest
 from tale.errors import ActionRefused
 from tale.items import basic
+from tale.items.board import BulletinBoard, BoardStorage
+from tale.tio.vfs import VirtualFileSystem
 from tale import mud_context
 from tale import util, player, base
 from tests.supportstuff import TestDriver
@@ -65,5 +71,100 @@ class TestItems(unittest.TestCase):
         self.assertFalse(thing in t)
 
 
+class TestBoards(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = TestDriver()
+        self.tempdir = tempfile.mkdtemp()
+        self.resources = VirtualFileSystem(root_path=self.tempdir, readonly=False)
+        mud_context.driver.board_storage = BoardStorage(self.resources, mud_context.driver.io_executor)
+
+    def tearDown(self):
+        mud_context.driver.io_executor.shutdown()
+        shutil.rmtree(self.tempdir)
+
+    def board(self):
+        board = BulletinBoard("board", "bulletin board")
+        board.storage_file = "boards/board.json"
+        board.load()
+        return board
+
+    def post(self, subject):
+        return {"author": "julie", "date": "2016-01-01", "subject": subject, "text": "text of " + subject}
+
+    def test_shared_posts(self):
+        board1 = self.board()
+        board2 = base.clone(board1)
+        board1._change({"post": self.post("first"), "keep": 20})
+        self.assertEqual(["first"], [post["subject"] for post in board2.posts])
+        board2._change({"post": self.post("second"), "keep": 20})
+        board3 = self.board()
+        self.assertEqual(["second", "first"], [post["subject"] for post in board3.posts])
+        board3._change({"remove": 1})
+        self.assertEqual(["second"], [post["subject"] for post in board1.posts])
+
+    def test_journal_and_compaction(self):
+        storage = mud_context.driver.board_storage
+        storage.compact_after = 5
+        board = self.board()
+        for num in range(7):
+            board._change({"post": self.post("post %d" % num), "keep": 4})
+        board._change({"remove": 0})
+        mud_context.driver.io_executor.flush()
+        with open(self.resources.validate_path("boards/board.json")) as f:
+            data = json.load(f)
+        self.assertEqual(5, data["journal-seq"])
+        self.assertEqual(["post 4", "post 3", "post 2", "post 1"], [post["subject"] for post in data["posts"]])
+        with open(self.resources.validate_path("boards/board.json.journal")) as f:
+            self.assertEqual(3, len(f.readlines()))
+        # a new storage replays the journal on top of the storage file
+        mud_context.driver.board_storage = BoardStorage(self.resources, mud_context.driver.io_executor)
+        self.assertEqual(["post 5", "post 4", "post 3"], [post["subject"] for post in self.board().posts])
+
+    def test_damaged_journal(self):
+        board = self.board()
+        for num in range(3):
+            board._change({"post": self.post("post %d" % num), "keep": 4})
+        mud_context.driver.io_executor.flush()
+        journal = self.resources.validate_path("boards/board.json.journal")
+        with open(journal, "ab") as f:
+            f.write(b'{"post": {"auth')    # cut off by a crash
+        mud_context.driver.board_storage = BoardStorage(self.resources, mud_context.driver.io_executor)
+        board = self.board()
+        self.assertEqual(["post 2", "post 1", "post 0"], [post["subject"] for post in board.posts])
+        board._change({"post": self.post("post 3"), "keep": 4})
+        mud_context.driver.io_executor.flush()
+        # the damaged journal was compacted away on load, so the new change is not appended to the bad line
+        with open(journal) as f:
+            self.assertEqual(1, len(f.readlines()))
+        mud_context.driver.board_storage = BoardStorage(self.resources, mud_context.driver.io_executor)
+        self.assertEqual(["post 3", "post 2", "post 1", "post 0"], [post["subject"] for post in self.board().posts])
+        self.assertFalse(os.path.exists(self.resources.validate_path("boards/board.json.tmp")))
+
+    def test_corrupt_storage_file(self):
+        self.resources["boards/board.json"] = b'{"posts": [{"auth'
+        board = self.board()
+        self.assertEqual([], board.posts)
+        mud_context.driver.io_executor.flush()
+        with open(self.resources.validate_path("boards/board.json")) as f:
+            self.assertEqual([], json.load(f)["posts"])
+
+    def test_without_storage(self):
+        mud_context.driver.board_storage = None
+        board = self.board()
+        board.posts = [self.post("first")]
+        board._change({"post": self.post("second"), "keep": 1})
+        self.assertEqual(["second"], [post["subject"] for post in board.posts])
+
+    def test_assign_posts(self):
+        board1 = self.board()
+        board1._change({"post": self.post("first"), "keep": 20})
+        board2 = base.clone(board1)
+        board2.posts = [self.post("second"), self.post("third")]
+        self.assertEqual(["second", "third"], [post["subject"] for post in board1.posts])
+        mud_context.driver.io_executor.flush()
+        mud_context.driver.board_storage = BoardStorage(self.resources, mud_context.driver.io_executor)
+        self.assertEqual(["second", "third"], [post["subject"] for post in self.board().posts])
+
+
 if __name__ == '__main__':
     unittest.main()
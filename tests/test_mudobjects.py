@@ -161,6 +161,12 @@ class TestLocations(unittest.TestCase):
         self.assertTrue(("road", "The sound is coming from the south.") in wiretap_road.msgs, "road should give sound direction")
         self.assertTrue(("house", "boing") in wiretap_house.msgs)
         self.assertTrue(("house", "You can't hear where the sound is coming from.") in wiretap_house.msgs, "in the house you can't locate the sound direction")
+        wiretap_road.clear()
+        wiretap_attic.clear()
+        plaza.message_nearby_locations(lambda distance: "boing" if distance == 1 else "faint boing", radius=2)
+        pubsub.sync()
+        self.assertEqual([("road", "boing"), ("road", "The sound is coming from the south.")], wiretap_road.msgs)
+        self.assertEqual([("attic", "faint boing"), ("attic", "You can't hear where the sound is coming from.")], wiretap_attic.msgs)
 
     def test_nearby(self):
         plaza = Location("plaza")
@@ -1017,6 +1023,48 @@ class TestFunctions(unittest.TestCase):
         self.assertFalse(item in player)
         self.assertFalse(item in player2)
 
+    def test_clone_shares_prototype_data(self):
+        item = Item("thing", "thing", description="a rather long description")
+        item.add_extradesc(["scratch"], "a scratch")
+        item.verbs = {"kick": "kick it"}
+        box = Container("box")
+        room = Location("room")
+        room.insert(box, None)
+        box.insert(item, None)
+        item2 = clone(item)
+        self.assertIs(item.description, item2.description)
+        self.assertEqual(item.extra_desc, item2.extra_desc)
+        item2.add_extradesc(["dent"], "a dent")
+        item2.verbs["shake"] = "shake it"
+        self.assertEqual({"scratch"}, set(item.extra_desc))
+        self.assertEqual({"kick"}, set(item.verbs))
+        self.assertIs(box, item.contained_in, "original must stay in its container")
+        self.assertIs(room, item2.location)
+        self.assertFalse(item2 in box)
+        rat = NPC("rat", "n", race="rodent")
+        rat.move(room)
+        rat2 = clone(rat)
+        self.assertIs(room, rat2.location)
+        self.assertIsNot(rat.stats, rat2.stats)
+        self.assertEqual(rat.stats.race, rat2.stats.race)
+
+    def test_collections_created_on_demand(self):
+        room = Location("Room")
+        item = Item("thing")
+        self.assertEqual({"name", "_title", "_description", "_short_description"}, set(room.__dict__))
+        self.assertEqual({"name", "_title", "_description", "_short_description"}, set(item.__dict__))
+        self.assertEqual(set(), room.livings)
+        room.insert(item, None)
+        self.assertEqual({item}, room.items)
+        self.assertIn("items", room.__dict__)
+        self.assertEqual(0.0, item.value)
+        item.value = 42
+        self.assertEqual(0.0, Item("other").value)
+        room.add_extradesc(["wall"], "a wall")
+        room.init_names("Room", None, None, None)
+        self.assertEqual({}, room.extra_desc)
+        self.assertIs(Item("thing").name, item.name)
+
 
 if __name__ == '__main__':
     unittest.main()
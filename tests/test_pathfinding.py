@@ -0,0 +1,90 @@
+"""
+Unittests for the exit graph and path finding
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import print_function, division, unicode_literals, absolute_import
+import unittest
+from tests.supportstuff import TestDriver
+from tale.base import Location, Exit, Door
+from tale.pathfinding import ExitGraph
+from tale import mud_context
+
+
+class TestExitGraph(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = self.driver = TestDriver()
+        # a square of four rooms, with a door between hall and kitchen, and a long detour via the garden
+        self.hall = Location("Hall")
+        self.kitchen = Location("Kitchen")
+        self.yard = Location("Yard")
+        self.garden = Location("Garden")
+        self.shed = Location("Shed")
+        self.door = Door("east", self.kitchen, "The kitchen door.")
+        self.hall.add_exits([self.door, Exit("north", self.garden, "The garden.")])
+        self.kitchen.add_exits([Exit("west", self.hall, "The hall."), Exit("north", self.yard, "The yard.")])
+        self.garden.add_exits([Exit("south", self.hall, "The hall."), Exit("east", self.yard, "The yard.")])
+        self.yard.add_exits([Exit("west", self.garden, "The garden."), Exit("south", self.kitchen, "The kitchen.")])
+
+    def directions(self, route):
+        return [exit.name for exit in route]
+
+    def test_find_path(self):
+        graph = self.driver.exit_graph
+        self.assertEqual([], self.driver.find_path(self.hall, self.hall))
+        self.assertEqual(["east"], self.directions(self.driver.find_path(self.hall, self.kitchen)))
+        route = self.driver.find_path(self.hall, self.yard)
+        self.assertEqual(2, len(route))
+        self.assertIs(self.yard, route[-1].target)
+        self.assertEqual(["west"], self.directions(self.driver.find_path(self.kitchen, self.hall)))
+        self.assertIsNone(self.driver.find_path(self.hall, self.shed))
+        self.assertEqual(5, len(graph))
+        self.assertEqual(graph.node(self.kitchen), graph.node(self.kitchen))
+        self.assertIs(self.kitchen, graph.locations[graph.node(self.kitchen)])
+
+    def test_doors(self):
+        self.assertEqual(["east"], self.directions(self.driver.find_path(self.hall, self.kitchen)))
+        self.door.opened = False
+        self.assertEqual(["north", "east", "south"], self.directions(self.driver.find_path(self.hall, self.kitchen)))
+        self.door.opened = True
+        self.assertEqual(["east"], self.directions(self.driver.find_path(self.hall, self.kitchen)))
+
+    def test_new_exits(self):
+        self.assertIsNone(self.driver.find_path(self.hall, self.shed))
+        self.yard.add_exits([Exit("shed", self.shed, "A small shed.")])
+        route = self.driver.find_path(self.hall, self.shed)
+        self.assertEqual(3, len(route))
+        self.assertEqual("shed", route[-1].name)
+
+    def test_zones(self):
+        graph = ExitGraph()
+        zones = {self.hall: 1, self.kitchen: 1, self.garden: 2, self.yard: 2}
+        graph.zone_of = zones.get
+        self.assertEqual(["east"], self.directions(graph.find_path(self.hall, self.kitchen)))
+        self.assertIn(1, graph.zone_tables)
+        self.door.opened = False
+        graph.exit_changed(self.door)
+        self.assertNotIn(1, graph.zone_tables)
+        # not possible within zone 1 anymore, but it is via zone 2
+        self.assertEqual(["north", "east", "south"], self.directions(graph.find_path(self.hall, self.kitchen)))
+
+    def test_astar(self):
+        steps = {self.hall: 2, self.garden: 1, self.kitchen: 1, self.yard: 0}
+        route = self.driver.find_path(self.hall, self.yard, heuristic=lambda location, target: steps[location])
+        self.assertEqual(2, len(route))
+        self.assertIs(self.yard, route[-1].target)
+        self.assertIsNone(self.driver.find_path(self.hall, self.shed, heuristic=lambda location, target: 0))
+
+    def test_long_chain(self):
+        rooms = [Location("room %d" % i) for i in range(3000)]
+        for room, next_room in zip(rooms, rooms[1:]):
+            room.add_exits([Exit("forward", next_room, "Onwards.")])
+        route = self.driver.find_path(rooms[0], rooms[-1])
+        self.assertEqual(2999, len(route))
+        self.assertIs(rooms[-1], route[-1].target)
+
+
+if __name__ == '__main__':
+    unittest.main()
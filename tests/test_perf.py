@@ -0,0 +1,92 @@
+"""
+Unittests for the performance instrumentation
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import print_function, division, unicode_literals, absolute_import
+import unittest
+import json
+import sys
+import threading
+import time
+from tale.perf import Profiler, Timings, SamplingProfiler
+
+
+def busy_loop(duration):
+    end = time.time() + duration
+    while time.time() < end:
+        pass
+
+
+class TestProfiler(unittest.TestCase):
+    def test_timings(self):
+        timings = Timings(100)
+        self.assertEqual({"count": 0, "samples": 0}, timings.statistics())
+        for duration in range(200):
+            timings.add(duration)
+        stats = timings.statistics()
+        self.assertEqual(200, stats["count"])
+        self.assertEqual(100, stats["samples"], "only the most recent durations are kept")
+        self.assertEqual(150, stats["p50"])
+        self.assertEqual(195, stats["p95"])
+        self.assertEqual(199, stats["p99"])
+        self.assertEqual(199, stats["max"])
+        self.assertAlmostEqual(149.5, stats["mean"])
+
+    def test_disabled(self):
+        profiler = Profiler()
+        stopwatch = profiler.stopwatch("tick")
+        stopwatch.lap("heartbeats")
+        stopwatch.stop()
+        self.assertEqual({}, profiler.timings)
+        self.assertIs(stopwatch, profiler.stopwatch("command"))
+
+    def test_stopwatch(self):
+        profiler = Profiler()
+        profiler.enable()
+        stopwatch = profiler.stopwatch("tick")
+        stopwatch.lap("heartbeats")
+        stopwatch.lap("deferreds")
+        stopwatch.stop()
+        stopwatch.stop("other")
+        self.assertEqual({"tick", "tick.heartbeats", "tick.deferreds", "other"}, set(profiler.timings))
+        stats = json.loads(json.dumps(profiler.statistics()))
+        self.assertTrue(stats["enabled"])
+        self.assertEqual(1, stats["timings"]["tick"]["count"])
+        profiler.reset()
+        self.assertEqual({}, profiler.statistics()["timings"])
+
+    def test_max_timers(self):
+        profiler = Profiler()
+        profiler.max_timers = 10
+        for i in range(20):
+            profiler.record("verb%d" % i, 0.1)
+        self.assertEqual(10, len(profiler.timings))
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    def test_collapse(self):
+        stack = SamplingProfiler.collapse(sys._getframe())
+        self.assertTrue(stack.endswith(";test_perf.py:test_collapse"))
+
+    def test_sampling(self):
+        thread = threading.Thread(target=busy_loop, args=(0.5,))
+        thread.start()
+        sampler = SamplingProfiler(thread.ident, interval=0.001).run(0.2)
+        thread.join()
+        self.assertGreater(sampler.num_samples, 10)
+        function, own, total = sampler.top_functions()[0]
+        self.assertEqual("test_perf.py:busy_loop", function)
+        self.assertEqual(own, total)
+        for line in sampler.collapsed_stacks().splitlines():
+            stack, count = line.rsplit(" ", 1)
+            self.assertIn("threading.py:", stack)
+            self.assertGreater(int(count), 0)
+        if thread.ident not in sys._current_frames():   # (the ident of an ended thread can be reused by a new thread)
+            self.assertEqual(0, SamplingProfiler(thread.ident).run(1).num_samples, "thread has ended")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,15 +6,20 @@ Copyright by Irmen de Jong (irmen@razorvine.net)
 """
 
 from __future__ import print_function, division, unicode_literals, absolute_import
+import os
 import sys
+import hashlib
+import binascii
 import time
+import tempfile
 import unittest
+from contextlib import contextmanager
 import tale
 from tests.supportstuff import TestDriver, MsgTraceNPC
 from tale.base import Location, Exit, Item, Stats
 from tale.errors import ActionRefused, ParseError
 from tale.npc import NPC
-from tale.player import Player, TextBuffer, PlayerConnection, MudAccounts
+from tale.player import Player, TextBuffer, PlayerConnection, MudAccounts, MudPlayerStore, _pbkdf2_sha256
 from tale.soul import NonSoulVerb, ParseResult
 from tale.tio.console_io import ConsoleIo
 from tale.tio.iobase import IoAdapterBase
@@ -461,6 +466,7 @@ class TestPlayerConnection(unittest.TestCase):
             player.store_input_line("      input text     \n")
             x = pc.input_direct("inputprompt")
             self.assertEqual("input text", x)
+            io.destroy()   # wait until the paced output has been written
             self.assertEqual("  first this text\ninputprompt ", sys.stdout.getvalue())  # should have outputted the buffered text
 
     def test_peek_output(self):
@@ -481,6 +487,7 @@ class TestPlayerConnection(unittest.TestCase):
             player.tell("hello 2", end=True)
             pc.write_output()
             self.assertEqual("  hello 2", pc.last_output_line)
+            io.destroy()   # wait until the paced output has been written
             self.assertEqual("  hello 1\n  hello 2\n", sys.stdout.getvalue())
 
     def test_destroy(self):
@@ -687,6 +694,94 @@ class TestMudAccounts(unittest.TestCase):
         pw2, salt2 = MudAccounts._pwhash("secret", "some salt")
         self.assertEqual(pw, pw2)
         self.assertEqual(salt, salt2)
+        self.assertTrue(pw.startswith(MudAccounts.pw_hash_method + "$"))
+        self.assertEqual(MudAccounts.pw_hash_method, MudAccounts._pwhash_method(pw))
+        pw, salt = MudAccounts._pwhash("secret", "some salt", "sha1")
+        self.assertEqual("sha1", MudAccounts._pwhash_method(pw))
+        self.assertEqual(40, len(pw))
+        pw, salt = MudAccounts._pwhash("secret", "some salt", "pbkdf2_sha256$1000")
+        self.assertEqual("pbkdf2_sha256$1000", MudAccounts._pwhash_method(pw))
+        with self.assertRaises(ValueError):
+            MudAccounts._pwhash("secret", "some salt", "md5$1")
+
+    def test_pbkdf2_fallback(self):
+        digest = _pbkdf2_sha256(b"passwd", b"salt", 1)
+        self.assertEqual("55ac046e56e3089fec1691c22544b605f94185216dde0465e68b9d57c20dacbc", binascii.hexlify(digest).decode("ascii"))
+        if hasattr(hashlib, "pbkdf2_hmac"):
+            self.assertEqual(hashlib.pbkdf2_hmac(str("sha256"), b"secret", b"some salt", 1000), _pbkdf2_sha256(b"secret", b"some salt", 1000))
+
+    def test_valid_password_rehash(self):
+        db = {}
+
+        @contextmanager
+        def opener():
+            yield db
+        accounts = MudAccounts(database_opener=opener)
+        accounts.create("testname", "secret1", "test@invalid", "m", Stats())
+        accounts.valid_password("testname", "secret1")
+        with self.assertRaises(ValueError):
+            accounts.valid_password("testname", "secret2")
+        with self.assertRaises(ValueError):
+            accounts.valid_password("unknown", "secret1")
+        # an old style sha1 hash should be upgraded when the password is validated
+        account = db["testname"]
+        account["pw_hash"], account["pw_salt"] = MudAccounts._pwhash("secret1", "some salt", "sha1")
+        accounts.valid_password("testname", "secret1")
+        self.assertEqual(MudAccounts.pw_hash_method, MudAccounts._pwhash_method(db["testname"]["pw_hash"]))
+        self.assertNotEqual("some salt", db["testname"]["pw_salt"])
+        accounts.valid_password("testname", "secret1")
+
+
+class TestMudPlayerStore(unittest.TestCase):
+    def setUp(self):
+        tale.mud_context.driver = TestDriver()
+        fd, self.dbpath = tempfile.mkstemp(suffix=".sqlite")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.dbpath)
+
+    def test_save_restore(self):
+        store = MudPlayerStore(self.dbpath, save_interval=9999)
+        self.assertIsNone(store.load("julie"))
+        julie = Player("julie", "f")
+        store.restore(julie, None)
+        julie.money = 42
+        julie.state["quest"] = "started"
+        store.save_dirty()
+        store.flush()
+        self.assertIsNone(store.load("julie"), "not dirty, and interval not yet expired")
+        store.mark_dirty(julie)
+        store.save_dirty(force=True)
+        store.flush()
+        state = store.load("julie")
+        self.assertEqual(42, state["money"])
+        self.assertEqual({"quest": "started"}, state["state"])
+        julie.money = 99
+        store.save(julie, logout=True)
+        store.mark_dirty(julie)
+        self.assertEqual(set(), store.dirty, "player is no longer tracked after logout")
+        store.close()
+        store = MudPlayerStore(self.dbpath)
+        julie2 = Player("julie", "f")
+        store.restore(julie2, store.load("julie"))
+        self.assertEqual(99, julie2.money)
+        self.assertEqual({"quest": "started"}, julie2.state)
+        self.assertEqual("human", julie2.stats.race)
+        store.close()
+
+    def test_close_saves_everyone(self):
+        store = MudPlayerStore(self.dbpath)
+        for name in ["julie", "fritz"]:
+            p = Player(name, "n")
+            p.money = len(name)
+            store.restore(p, None)
+        store.close()
+        self.assertFalse(store.writer.is_alive())
+        store = MudPlayerStore(self.dbpath)
+        self.assertEqual(5, store.load("julie")["money"])
+        self.assertEqual(5, store.load("fritz")["money"])
+        store.close()
 
 
 class WrappedConsoleIO(ConsoleIo):
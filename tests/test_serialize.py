@@ -7,7 +7,10 @@ Copyright by Irmen de Jong (irmen@razorvine.net)
 from __future__ import print_function, division, unicode_literals, absolute_import
 import unittest
 import pickle
-from tale import mud_context, races, base, npc, soul, player, util, hints
+import os
+import tempfile
+import threading
+from tale import mud_context, races, base, npc, soul, player, util, hints, savegames
 from tale.story import Storybase
 from tests.supportstuff import TestDriver
 
@@ -135,5 +138,98 @@ class TestSerializing(unittest.TestCase):
         self.assertEqual(h.all_hints, x.all_hints)
 
 
+class TestSavegames(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = TestDriver()
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "test.savegame")
+
+    def tearDown(self):
+        for name in os.listdir(self.tempdir):
+            os.remove(os.path.join(self.tempdir, name))
+        os.rmdir(self.tempdir)
+
+    def test_write_read(self):
+        p = player.Player("name", "n", description="description")
+        p.money = 42
+        state = {"version": "1.2", "player": p, "bulk": "x" * 500000, "bin": bytes(bytearray(range(256))) * 1000}
+        savegames.write_savegame(self.path, "1.2", state)
+        self.assertEqual(["test.savegame"], os.listdir(self.tempdir), "temporary file must be gone")
+        self.assertLess(os.path.getsize(self.path), 100000, "data should be compressed")
+        with savegames.SavegameReader(self.path) as reader:
+            self.assertEqual("1.2", reader.game_version)
+            loaded = reader.load()
+        self.assertEqual(42, loaded["player"].money)
+        self.assertEqual(state["bulk"], loaded["bulk"])
+        self.assertEqual(state["bin"], loaded["bin"])
+        # overwrite the existing savegame
+        savegames.write_savegame(self.path, "1.3", {"new": True})
+        with savegames.SavegameReader(self.path) as reader:
+            self.assertEqual("1.3", reader.game_version)
+            self.assertEqual({"new": True}, reader.load())
+
+    def test_invalid(self):
+        with open(self.path, "wb") as f:
+            f.write(pickle.dumps({"version": "1.2"}))
+        with self.assertRaises(savegames.SavegameFormatError):
+            savegames.SavegameReader(self.path)
+        with self.assertRaises(IOError):
+            savegames.SavegameReader(self.path + ".nonexisting")
+
+    def test_corrupt(self):
+        savegames.write_savegame(self.path, "1.2", {"data": list(range(10000))})
+        with open(self.path, "r+b") as f:
+            f.seek(-10, os.SEEK_END)
+            f.write(b"corrupted!")
+        with savegames.SavegameReader(self.path) as reader:
+            self.assertEqual("1.2", reader.game_version)
+            with self.assertRaises(savegames.SavegameFormatError):
+                reader.load()
+
+    def test_write_failure(self):
+        savegames.write_savegame(self.path, "1.2", {"data": 42})
+        with self.assertRaises(Exception):
+            savegames.write_savegame(self.path, "1.3", {"data": threading.Lock()})
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+        with savegames.SavegameReader(self.path) as reader:
+            self.assertEqual("1.2", reader.game_version)
+            self.assertEqual({"data": 42}, reader.load())
+
+    def test_corrupt_body(self):
+        savegames.write_savegame(self.path, "1.2", {"data": list(range(10000))})
+        with open(self.path, "r+b") as f:
+            f.seek(100)
+            f.write(b"corrupted!")
+        with savegames.SavegameReader(self.path) as reader:
+            with self.assertRaises(savegames.SavegameFormatError):
+                reader.load()
+
+    def test_world_snapshot(self):
+        # a long chain of locations would hit the recursion limit if pickled as one object graph
+        locations = [base.Location("room%d" % i) for i in range(3000)]
+        for here, there in zip(locations, locations[1:]):
+            base.Exit(["east"], there, "east").bind(here)
+            base.Exit(["west"], here, "west").bind(there)
+        n = npc.NPC("rat", "n", race="rodent")
+        n.move(locations[1500])
+        n.insert(base.Item("cheese"), n)
+        p = player.Player("julie", "f")
+        p.move(locations[1500])
+        world = {"startlocation_player": locations[0], "heartbeats": {n}}
+        num_locations = savegames.write_world_snapshot(self.path, "1.2", world)
+        self.assertEqual(3000, num_locations)
+        with savegames.SavegameReader(self.path) as reader:
+            world = savegames.load_world_snapshot(reader)
+        loc = world["startlocation_player"]
+        for _ in range(1500):
+            loc = loc.exits["east"].target
+        self.assertEqual("room1500", loc.name)
+        self.assertIs(loc, loc.exits["east"].target.exits["west"].target)
+        rat = list(world["heartbeats"])[0]
+        self.assertEqual({rat}, loc.livings, "player must not be in the snapshot")
+        self.assertIs(loc, rat.location)
+        self.assertEqual(["cheese"], [item.name for item in rat.inventory])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,150 @@
+"""
+Unittests for the sharded mud mode
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import print_function, division, unicode_literals, absolute_import
+import io
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import tale
+from tale.base import Location, Exit, _limbo
+from tale.player import Player
+from tale.shard import ShardMap, ShardFront, _HandoffPickler, _HandoffUnpickler
+from tale.util import queue
+from tale import mud_context
+from tests.supportstuff import TestDriver
+
+tale_root = os.path.abspath(os.path.join(os.path.dirname(tale.__file__), ".."))
+
+
+class TestShardMap(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = self.driver = TestDriver()
+        self.square = Location("Town square")
+        self.shop = Location("Shop")
+        self.driver.zone_locations.update({"town.square": self.square, "shoppe.shop": self.shop})
+
+    def test_registry_keys(self):
+        shard_map = ShardMap(self.driver, 2, {"town": 1})
+        self.assertEqual("town.square", shard_map.location_key(self.square))
+        self.assertIsNone(shard_map.location_key(Location("Nowhere")))
+        self.assertEqual("shoppe.shop", shard_map.target_key(Exit("shop", self.shop, "To the shop.")))
+        self.assertIs(self.shop, shard_map.find_location("shoppe.shop"))
+        self.assertEqual(1, shard_map.shard_of_key("town.square"))
+        self.assertIsNone(shard_map.shard_of_key(None))
+        self.assertIn(shard_map.shard_of_key("shoppe.shop"), (0, 1))
+        self.assertEqual(shard_map.shard_of_key("shoppe.shop"), shard_map.shard_of_key("shoppe.backroom"))
+
+    def test_numbered_zones(self):
+        shard_map = ShardMap(self.driver, 3)
+        shard_map.zone_of_key = lambda vnum: vnum // 100
+        self.assertEqual([0, 0, 1, 2, 0], [shard_map.shard_of_key(vnum) for vnum in (3, 99, 101, 250, 399)])
+
+    def test_handoff_pickle(self):
+        Exit("east", self.shop, "The shop is east.").bind(self.square)
+        Exit("west", self.square, "The square is west.").bind(self.shop)
+        player = Player("julie", "f")
+        player.known_locations.update([self.square, self.shop, Location("Nowhere")])
+        stream = io.BytesIO()
+        _HandoffPickler(stream, ShardMap(self.driver, 2)).dump(player)
+        # in the receiving shard, the keys refer to its own location objects
+        other_driver = TestDriver()
+        square, shop = Location("Town square"), Location("Shop")
+        other_driver.zone_locations.update({"town.square": square, "shoppe.shop": shop})
+        stream.seek(0)
+        player = _HandoffUnpickler(stream, ShardMap(other_driver, 2)).load()
+        self.assertEqual({square, shop, _limbo}, player.known_locations)
+        self.assertNotIn(b"The shop is east", stream.getvalue())
+
+
+@unittest.skipIf(sys.version_info < (3, 4), "a worker should be started in a fresh interpreter, not forked from the test runner")
+class TestShards(unittest.TestCase):
+    def setUp(self):
+        # earlier tests may have started a driver, that changed the working directory and sys.path
+        self.cwd = os.getcwd()
+        self.sys_path = list(sys.path)
+        os.chdir(tale_root)
+        sys.path[:] = [path if os.path.isabs(path) else tale_root for path in sys.path]
+        # the workers get an empty user data directory (no stored player state of earlier runs)
+        self.xdg_data_home = os.environ.get("XDG_DATA_HOME")
+        self.user_data = os.environ["XDG_DATA_HOME"] = tempfile.mkdtemp()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        sys.path[:] = self.sys_path
+        if self.xdg_data_home is None:
+            del os.environ["XDG_DATA_HOME"]
+        else:
+            os.environ["XDG_DATA_HOME"] = self.xdg_data_home
+        shutil.rmtree(self.user_data)
+
+    def wait_for(self, front, name, text, timeout=10):
+        output = ""
+        end = time.time() + timeout
+        while time.time() < end:
+            front.process_messages(0.1)
+            output += "".join(front.get_output(name)[0])
+            if text in output:
+                return output
+        self.fail("no '%s' in the output: %s" % (text, output))
+
+    def test_handoff(self):
+        game = os.path.abspath("stories/demo")
+        front = ShardFront(game, 2, {"town": 0, "shoppe": 1, "wizardtower": 0})
+        front.start()
+        try:
+            self.assertEqual([0, 0], front.start_shards)
+            front.connect("julie", "f")
+            self.wait_for(front, "julie", "[Town square]")
+            front.input("julie", "north")
+            self.wait_for(front, "julie", "[Lane of Magicks]")
+            front.input("julie", "shop")
+            self.wait_for(front, "julie", "[Curiosity Shoppe]")
+            self.assertEqual(1, front.shards["julie"])
+            front.input("julie", "inventory")
+            self.wait_for(front, "julie", "You are carrying nothing")
+            front.input("julie", "out")
+            self.wait_for(front, "julie", "[Lane of Magicks]")
+            self.assertEqual(0, front.shards["julie"])
+        finally:
+            front.stop()
+
+
+class TestShardFront(unittest.TestCase):
+    class Connection(object):
+        def __init__(self):
+            self.io = type(str("Io"), (object,), {})()
+            self.io.html_to_browser = []
+            self.io.html_special = []
+            self.player = type(str("Player"), (object,), {})()
+            self.player.turns = 0
+
+    def test_deliver_output(self):
+        front = ShardFront("stories/demo", 2)
+        front.outbox = queue.Queue()
+        front.shards = {"julie": 0, "peter": 1}
+        julie, peter = self.Connection(), self.Connection()
+        front.outbox.put(("output", "julie", ["<p>hello</p>"], ["clear"], "Town square", 3))
+        front.outbox.put(("output", "ghost", ["<p>boo</p>"], [], "Limbo", 1))
+        front.outbox.put(("quit", "peter"))
+        quits = front.deliver_output({"julie": julie, "peter": peter})
+        self.assertEqual(["peter"], quits)
+        self.assertEqual(["<p>hello</p>"], julie.io.html_to_browser)
+        self.assertEqual(["clear"], julie.io.html_special)
+        self.assertEqual("Town square", julie.io.location_title)
+        self.assertEqual(3, julie.player.turns)
+        self.assertEqual([], peter.io.html_to_browser)
+        self.assertEqual({"julie": 0}, front.shards)
+        self.assertEqual([], front.deliver_output({"julie": julie}))
+        self.assertEqual(["<p>hello</p>"], julie.io.html_to_browser)
+
+
+if __name__ == '__main__':
+    unittest.main()
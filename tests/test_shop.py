@@ -33,6 +33,12 @@ class TestShopping(unittest.TestCase):
         wiz.privileges.add("wizard")
         self.shopkeeper.validate_open_hours(wiz, current_time=datetime.time(2, 59))
 
+    def test_open_until_midnight(self):
+        self.shopkeeper.shop.open_hours = [(20, 24)]
+        self.shopkeeper.validate_open_hours(current_time=datetime.time(23, 59))
+        with self.assertRaises(ActionRefused):
+            self.shopkeeper.validate_open_hours(current_time=datetime.time(0, 0))
+
     def test_closed_hours(self):
         with self.assertRaises(ActionRefused):
             self.shopkeeper.validate_open_hours(current_time=datetime.time(6, 30))
@@ -6,12 +6,19 @@ Copyright by Irmen de Jong (irmen@razorvine.net)
 """
 from __future__ import print_function, division, unicode_literals, absolute_import
 import datetime
+import importlib
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
 import unittest
+import tale
 from tale import util, mud_context, pubsub
 from tale.errors import ParseError, ActionRefused
 from tale.base import Item, Container, Location, Exit
 from tale.player import Player
-from tale.tio.vfs import VirtualFileSystem, VfsError
+from tale.tio.vfs import VirtualFileSystem, VfsError, internal_resources
 from tests.supportstuff import TestDriver, Wiretap
 
 
@@ -230,6 +237,40 @@ class TestUtil(unittest.TestCase):
         del vfs["unittest.txt"]
         del vfs["unittest.jpg"]
 
+    def test_vfs_cache(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            vfs = VirtualFileSystem(root_path=tempdir, readonly=False, cache_size=20, revalidate=0)
+            vfs["one.txt"] = "1234567890"
+            vfs["two.txt"] = "abcdefghij"
+            self.assertEqual("1234567890", vfs["one.txt"].data)
+            self.assertIs(vfs["one.txt"], vfs["one.txt"])
+            self.assertEqual("abcdefghij", vfs["two.txt"].data)
+            stats = vfs.cache_statistics()
+            self.assertEqual(2, stats["misses"])
+            self.assertEqual(2, stats["revalidations"])
+            self.assertEqual({"entries": 2, "size": 20}, {"entries": stats["entries"], "size": stats["size"]})
+            vfs["one.txt"] = "changed"
+            self.assertEqual("changed", vfs["one.txt"].data, "writing must invalidate the cached resource")
+            os.utime(vfs.validate_path("two.txt"), (0, 0))
+            self.assertEqual("abcdefghij", vfs["two.txt"].data)
+            self.assertEqual(4, vfs.cache_statistics()["misses"], "a changed mtime must cause a reload")
+            vfs["three.txt"] = "klmnopqrst"
+            _ = vfs["three.txt"]
+            stats = vfs.cache_statistics()
+            self.assertEqual(1, stats["evictions"])
+            self.assertNotIn("one.txt", vfs.cache, "the least recently used resource is evicted")
+            del vfs["three.txt"]
+            with self.assertRaises(IOError):
+                _ = vfs["three.txt"]
+            vfs = VirtualFileSystem(root_path=tempdir, cache_size=20, revalidate=60)
+            _ = vfs["two.txt"]
+            os.remove(vfs.validate_path("two.txt"))
+            self.assertEqual("abcdefghij", vfs["two.txt"].data, "not revalidated yet")
+            self.assertEqual(1, vfs.cache_statistics()["hits"])
+        finally:
+            shutil.rmtree(tempdir)
+
     def test_vfs_readonly(self):
         vfs = VirtualFileSystem(root_path=".")
         with self.assertRaises(VfsError):
@@ -250,6 +291,58 @@ class TestUtil(unittest.TestCase):
         self.assertEqual("overwrittenappended", vfs["unittest.txt"].data)
         del vfs["unittest.txt"]
 
+    def test_vfs_read_stream(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            vfs = VirtualFileSystem(root_path=tempdir, readonly=False)
+            vfs["text.txt"] = "line1\r\nline2\n"
+            vfs["data.bin"] = b"\x00\x01" * 1000
+            vfs["empty.bin"] = b""
+            with vfs.open_read("text.txt") as f:
+                self.assertEqual("line1\nline2\n", f.read())
+            with vfs.open_read("text.txt", binary=True) as f:
+                self.assertEqual(b"line1\r\n", f.readline())
+            with vfs.open_read("data.bin") as f:
+                self.assertEqual(b"\x00\x01\x00", f.read(3))
+            mapped = vfs.mmap_read("data.bin")
+            try:
+                self.assertEqual(2000, len(mapped))
+                self.assertEqual(b"\x01\x00", mapped[1:3])
+            finally:
+                mapped.close()
+            with self.assertRaises(VfsError):
+                vfs.mmap_read("empty.bin")
+            with self.assertRaises(IOError):
+                vfs.open_read("doesnt_exist.bin")
+            with internal_resources.open_read("web/index.html") as f:
+                self.assertEqual(internal_resources["web/index.html"].data, f.read())
+            self.assertEqual(os.path.getsize(os.path.join(os.path.dirname(tale.__file__), "web", "index.html")), internal_resources.size("web/index.html"))
+            self.assertIsNone(internal_resources.size("web/doesnt_exist.html"))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_vfs_read_stream_zip(self):
+        tempdir = tempfile.mkdtemp()
+        zip_path = os.path.join(tempdir, "story.zip")
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipped:
+            zipped.writestr("zippedstory_vfs/__init__.py", "")
+            zipped.writestr("zippedstory_vfs/messages/motd.txt", "Hello from the zip file.\r\n" * 1000)
+        sys.path.insert(0, zip_path)
+        try:
+            self.assertEqual("zippedstory_vfs", importlib.import_module("zippedstory_vfs").__name__)
+            vfs = VirtualFileSystem(root_package="zippedstory_vfs")
+            with vfs.open_read("messages/motd.txt") as f:
+                self.assertEqual("Hello from the zip file.\n", f.readline())
+                self.assertEqual(999, len(f.readlines()))
+            with self.assertRaises(IOError):
+                vfs.open_read("messages/doesnt_exist.txt")
+            with self.assertRaises(VfsError):
+                vfs.mmap_read("messages/motd.txt")
+        finally:
+            sys.path.remove(zip_path)
+            sys.modules.pop("zippedstory_vfs", None)
+            shutil.rmtree(tempdir)
+
     def test_gametime_realtime(self):
         epoch = datetime.datetime(2012, 4, 19, 14, 0, 0)
         gt = util.GameDateTime(epoch)  # realtime=1
@@ -0,0 +1,62 @@
+"""
+Unittests for the story verification checks
+
+'Tale' mud driver, mudlib and interactive fiction framework
+Copyright by Irmen de Jong (irmen@razorvine.net)
+"""
+
+from __future__ import print_function, division, unicode_literals, absolute_import
+import unittest
+from tests.supportstuff import TestDriver
+from tale.base import Location, Exit, Item
+from tale.shop import Shopkeeper, ShopBehavior
+from tale.story import Storybase
+from tale import mud_context, verify
+
+
+class TestVerify(unittest.TestCase):
+    def setUp(self):
+        mud_context.driver = self.driver = TestDriver()
+        self.hall = Location("Hall")
+        self.shop = Location("Shop")
+        self.attic = Location("Attic")
+        self.hall.add_exits([Exit("east", self.shop, "The shop.")])
+        self.shop.add_exits([Exit("west", self.hall, "The hall.")])
+        self.driver.config = Storybase()._get_config()
+        self.driver.config.startlocation_player = self.driver.config.startlocation_wizard = self.hall
+        self.keeper = Shopkeeper("lucy", "f")
+        self.keeper.set_shop(ShopBehavior())
+        self.shop.insert(self.keeper, None)
+        self.locations = [self.hall, self.shop, self.attic]
+
+    def check(self):
+        results = verify.verify_world(self.driver, self.locations)
+        return dict((result.name, result) for result in results)
+
+    def test_good_world(self):
+        results = self.check()
+        self.assertEqual(["bulletin boards", "connectivity", "exit binding", "shops"], sorted(results))
+        self.assertTrue(all(not result.errors for result in results.values()))
+        self.assertEqual(1, len(results["connectivity"].warnings))
+        self.assertIn("1 locations can't be reached", results["connectivity"].warnings[0])
+
+    def test_unbound_exit(self):
+        self.attic.add_exits([Exit("down", "nowhere.to.be.found", "Down.")])
+        errors = self.check()["exit binding"].errors
+        self.assertEqual(1, len(errors))
+        self.assertIn("not bound", errors[0])
+
+    def test_shops(self):
+        shop = self.keeper.shop
+        shop.open_hours = [(9, 17), (22, 3), (0, 24), (10, 10), (8, 25)]
+        sword = Item("sword")
+        sword.value = 0
+        shop.forsale = [sword, Item("shield")]
+        self.keeper.insert(sword, self.keeper)
+        result = self.check()["shops"]
+        self.assertEqual(3, len(result.errors), "two invalid opening hours, shield not in stock")
+        self.assertEqual(1, len(result.warnings), "sword has no value")
+
+
+if __name__ == '__main__':
+    unittest.main()